@@ -0,0 +1,58 @@
+"""
+Compara a consolidação original (groupby + lambdas Python) com a versão vetorizada.
+
+Uso:
+    python -m benchmarks.bench_consolidate [linhas] [pessoas]
+"""
+import random
+import sys
+import time
+import pandas as pd
+from modules.excel_handler import HEADERS, consolidate_records
+
+
+def legacy_consolidate(df):
+    """Implementação anterior de consolidate_data, mantida apenas como referência de desempenho."""
+    def first_non_null(series):
+        return series.dropna().iloc[0] if not series.dropna().empty else ""
+
+    aggregations = {column: first_non_null for column in HEADERS if column not in ("Arquivo", "Nome Completo")}
+    aggregations["Arquivo"] = lambda x: ', '.join(sorted(set(x.dropna())))
+    return df.groupby("Nome Completo", as_index=False).agg(aggregations)
+
+
+def synthetic_results(rows, people, seed=42):
+    """Gera linhas de resultados com várias leituras (parcialmente vazias) da mesma pessoa."""
+    rng = random.Random(seed)
+    data = []
+    for index in range(rows):
+        person = rng.randrange(people)
+        row = [f"scan_{index}.png", f"Pessoa Numero {person}", f"{person:011d}"]
+        row += [f"valor {column} {person}" if rng.random() < 0.5 else None for column in HEADERS[3:]]
+        data.append(row)
+    return pd.DataFrame(data, columns=HEADERS)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rows = int(argv[0]) if argv else 100_000
+    people = int(argv[1]) if len(argv) > 1 else rows // 4
+
+    df = synthetic_results(rows, people)
+    legacy, legacy_seconds = timed(legacy_consolidate, df)
+    vectorized, vectorized_seconds = timed(consolidate_records, df)
+
+    print(f"{rows} linhas, {people} pessoas")
+    print(f"  original:    {legacy_seconds:8.3f}s ({len(legacy)} registros)")
+    print(f"  vetorizada:  {vectorized_seconds:8.3f}s ({len(vectorized)} registros)")
+    print(f"  speedup:     {legacy_seconds / vectorized_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
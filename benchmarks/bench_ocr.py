@@ -0,0 +1,69 @@
+"""
+Compara o OCR da página inteira em resolução completa com o OCR com confiança por palavra
+(passagem rápida em baixa resolução e nova leitura só das linhas incertas): tempo médio por
+imagem, precisão por caractere e quantas páginas ou linhas precisaram ser relidas.
+
+Usa o corpus sintético de benchmarks.corpus (o texto de referência de cada imagem é o .txt de
+mesmo nome). As variáveis OCR_FAST_DPI, OCR_FAST_LANG, OCR_MIN_CONFIDENCE, OCR_RETRY_PSM e
+OCR_PAGE_RETRY_RATIO valem para o modo com confiança.
+
+Uso:
+    python -m benchmarks.bench_ocr [documentos] [diretório]
+"""
+import os
+import sys
+import time
+from PIL import Image
+from benchmarks.bench_preprocessing import char_accuracy
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, generate_corpus
+from modules import metrics, ocr, preprocessing
+
+
+def run_mode(backend, images, recognize):
+    """Executa um modo sobre as imagens: (segundos por imagem, precisão média, contadores do OCR)."""
+    metrics.recorder.reset()
+    seconds = accuracy = 0.0
+    for image, reference in images:
+        start = time.perf_counter()
+        text = recognize(backend, image)
+        seconds += time.perf_counter() - start
+        accuracy += char_accuracy(reference, text)
+    counters = {name: value for name, value in metrics.recorder.summary()["counters"].items() if name.startswith("ocr_")}
+    return seconds / len(images), accuracy / len(images), counters
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    documents = int(argv[0]) if argv else 20
+    directory = argv[1] if len(argv) > 1 else os.path.join(DEFAULT_CORPUS_DIR, f"{documents}_docs")
+    paths = generate_corpus(directory, documents)
+
+    backend = ocr.create_backend()
+    try:
+        backend.image_to_data(Image.new("L", (64, 32), 255))
+    except Exception as e:
+        print(f"Backend de OCR '{backend.name}' indisponível: {str(e)}")
+        return 1
+
+    # Pré-processamento fora da medição: os dois modos recebem a mesma imagem
+    images = []
+    for path in paths:
+        with open(os.path.splitext(path)[0] + ".txt", encoding="utf-8") as f:
+            images.append((preprocessing.preprocess(Image.open(path)), f.read()))
+
+    modes = {
+        "página inteira": lambda backend, image: backend.image_to_string(image),
+        "com confiança": lambda backend, image: ocr.recognize_with_confidence(image, backend).text,
+    }
+    print(f"{len(images)} imagens, backend '{backend.name}'")
+    print(f"  {'modo':<16} {'s/imagem':>9} {'precisão':>9}  releituras")
+    for label, recognize in modes.items():
+        seconds, accuracy, counters = run_mode(backend, images, recognize)
+        retries = ", ".join(f"{name}={value}" for name, value in counters.items()) or "-"
+        print(f"  {label:<16} {seconds:8.3f}s {accuracy:9.1%}  {retries}")
+    backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Mede a vazão e a latência por etapa do pipeline completo (OCR → refinamento → armazenamento →
+consolidação → Word) sobre o corpus sintético, com a API substituída pelo servidor simulado.
+
+Cada cenário roda em um processo e diretório de trabalho próprios (caches e dados vazios) e é
+comparado com a referência gravada em benchmarks/baselines/pipeline.json: vazão menor ou p95 de
+alguma etapa maior que a tolerância indica uma regressão (código de saída 1). A referência só
+é gravada com --update-baseline, na máquina usada para as comparações; sem ela, ou se nenhum
+cenário executado tiver referência, a comparação também falha (código de saída 1), para que
+uma verificação sem referência não passe despercebida.
+
+Uso:
+    python -m benchmarks.bench_pipeline [10 100 1000] [--latency 0.8] [--error-rate 0.02] [--malformed-rate 0]
+                                         [--no-word] [--local-extraction] [--tolerance 0.2]
+                                         [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.corpus import DEFAULT_CORPUS_DIR, generate_corpus, load_ground_truth
+from benchmarks.mock_openai import start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "pipeline.json")
+DEFAULT_SCENARIOS = (10, 100, 1000)
+
+# Etapas com p95 abaixo disso na referência não são comparadas (ruído de medição)
+MIN_COMPARED_SECONDS = 0.01
+
+# Colunas comparadas com o gabarito
+COMPARED_FIELDS = ("Nome Completo", "CPF", "Data de Nascimento", "Documento de Identidade", "Data de Emissão",
+                   "Nome do Pai", "Nome da Mãe", "Cidade", "Estado", "CEP")
+
+
+def _normalize(value):
+    return " ".join(str(value or "").upper().split())
+
+
+def field_accuracy(results, truth):
+    """Fração dos campos do gabarito reproduzidos exatamente (sem diferenciar maiúsculas e espaços)."""
+    matched = total = 0
+    for row in results.to_dict(orient="records"):
+        expected = truth.get(row["Arquivo"])
+        if expected is None:
+            continue
+        for field in COMPARED_FIELDS:
+            total += 1
+            matched += _normalize(row.get(field)) == _normalize(expected.get(field))
+    return matched / total if total else 0.0
+
+
+def run_scenario(corpus_dir, result_file, generate_word):
+    """Executa um cenário no diretório atual (processo filho) e grava o resultado em JSON."""
+    from modules import cli, excel_handler, metrics
+
+    start = time.perf_counter()
+    status = cli.run(corpus_dir, os.path.join(REPO_ROOT, "templates", "template.docx"),
+                     generate_word=generate_word, export_mode="files")
+    elapsed = time.perf_counter() - start
+    summary = metrics.recorder.summary()
+    truth = load_ground_truth(corpus_dir)
+    result = {
+        "status": status,
+        "documents": len(truth),
+        "elapsed_seconds": elapsed,
+        "throughput": len(truth) / elapsed if elapsed > 0 else 0.0,
+        "field_accuracy": field_accuracy(excel_handler.get_store().load_results(), truth),
+        "stages": {name: {key: stage[key] for key in ("samples", "wall_seconds", "cpu_seconds",
+                                                      "p50_seconds", "p95_seconds")}
+                   for name, stage in summary["stages"].items()},
+        "counters": summary["counters"],
+    }
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def environment(args):
+    """Máquina e parâmetros do servidor simulado: comparações só fazem sentido entre ambientes iguais."""
+    return {
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "malformed_rate": args.malformed_rate,
+        "generate_word": not args.no_word,
+        "local_extraction": args.local_extraction,
+    }
+
+
+def compare(name, result, baseline, tolerance):
+    """Lista as regressões de um cenário em relação à referência."""
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"{name}: vazão {result['throughput']:.2f} docs/s "
+                           f"(referência {baseline['throughput']:.2f})")
+    for stage, reference in baseline["stages"].items():
+        current = result["stages"].get(stage)
+        if current is None or reference["p95_seconds"] < MIN_COMPARED_SECONDS:
+            continue
+        if current["p95_seconds"] > reference["p95_seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 de '{stage}' {current['p95_seconds']:.3f}s "
+                               f"(referência {reference['p95_seconds']:.3f}s)")
+    if result["field_accuracy"] < baseline["field_accuracy"] - 0.01:
+        regressions.append(f"{name}: precisão dos campos {result['field_accuracy']:.1%} "
+                           f"(referência {baseline['field_accuracy']:.1%})")
+    return regressions
+
+
+def print_result(name, result):
+    print(f"{name}: {result['documents']} documentos em {result['elapsed_seconds']:.1f}s "
+          f"({result['throughput']:.2f} docs/s), precisão dos campos {result['field_accuracy']:.1%}")
+    print(f"  {'etapa':<12} {'amostras':>8} {'total':>9} {'p50':>8} {'p95':>8}")
+    for stage, values in result["stages"].items():
+        print(f"  {stage:<12} {values['samples']:>8} {values['wall_seconds']:8.2f}s "
+              f"{values['p50_seconds']:7.3f}s {values['p95_seconds']:7.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_pipeline",
+                                     description="Benchmark do pipeline completo com a API simulada.")
+    parser.add_argument("documents", nargs="*", type=int, default=list(DEFAULT_SCENARIOS),
+                        help="tamanhos dos cenários (padrão: 10 100 1000)")
+    parser.add_argument("--latency", type=float, default=0.8, help="latência média da API simulada, em segundos")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fração de respostas 429/500 simuladas")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fração de respostas com JSON truncado (corrigidas com um pedido de correção)")
+    parser.add_argument("--no-word", action="store_true", help="não gera os documentos Word")
+    parser.add_argument("--local-extraction", action="store_true",
+                        help="mantém a extração local antes do GPT (por padrão desativada, para medir a API)")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR,
+                        help="onde o corpus sintético é gerado (reaproveitado entre execuções)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variação aceita em relação à referência")
+    parser.add_argument("--update-baseline", action="store_true", help="grava os resultados como nova referência")
+    parser.add_argument("--run-scenario", nargs=2, metavar=("CORPUS", "RESULTADO"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        run_scenario(*args.run_scenario, generate_word=not args.no_word)
+        return 0
+
+    os.environ["OPENAI_API_KEY"] = "benchmark"  # Nenhuma chamada sai para a API real
+    import pytesseract
+    from modules.config import TESSERACT_CMD
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        print(f"Tesseract não encontrado ({TESSERACT_CMD}): {str(e)}")
+        return 1
+
+    server, base_url, server_stats = start_server(latency=args.latency, jitter=args.jitter,
+                                                  error_rate=args.error_rate, seed=42,
+                                                  malformed_rate=args.malformed_rate)
+    env = {**os.environ, "OPENAI_BASE_URL": base_url,
+           "LOCAL_EXTRACTION_ENABLED": "1" if args.local_extraction else "0",
+           "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+
+    results = {}
+    try:
+        for documents in args.documents:
+            name = f"{documents}_docs"
+            corpus_dir = os.path.join(args.corpus_dir, name)
+            print(f"Gerando o corpus de {documents} documentos em '{corpus_dir}'...")
+            generate_corpus(corpus_dir, documents)
+
+            # Diretório de trabalho vazio: sem cache, dados ou manifest de execuções anteriores
+            with tempfile.TemporaryDirectory(prefix="gpt_ocr_bench_") as workdir:
+                result_file = os.path.join(workdir, "resultado.json")
+                log_file = os.path.join(workdir, "execucao.log")
+                command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--run-scenario",
+                           os.path.abspath(corpus_dir), result_file] + (["--no-word"] if args.no_word else [])
+                with open(log_file, "w", encoding="utf-8") as log:
+                    subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+                if not os.path.exists(result_file):
+                    with open(log_file, encoding="utf-8") as log:
+                        print(log.read()[-2000:])
+                    print(f"{name}: o cenário falhou.")
+                    return 1
+                with open(result_file, encoding="utf-8") as f:
+                    results[name] = json.load(f)
+            print_result(name, results[name])
+    finally:
+        server.shutdown()
+    print(f"API simulada: {server_stats.as_dict()}")
+
+    current_environment = environment(args)
+    if args.update_baseline:
+        baseline = {"environment": current_environment, "scenarios": {}}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE, encoding="utf-8") as f:
+                previous = json.load(f)
+            if previous.get("environment") == current_environment:
+                baseline["scenarios"] = previous.get("scenarios", {})  # Mantém os cenários não executados
+        baseline["scenarios"].update(results)
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"Referência gravada em '{BASELINE_FILE}'.")
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print(f"Erro: nenhuma referência em '{BASELINE_FILE}'; nada foi comparado. "
+              "Grave-a com --update-baseline na máquina usada para as comparações.")
+        return 1
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != current_environment:
+        print("Aviso: a referência foi gravada em outro ambiente ou com outros parâmetros; "
+              f"referência: {baseline.get('environment')}")
+
+    regressions = []
+    missing = [name for name in results if name not in baseline.get("scenarios", {})]
+    for name, result in results.items():
+        if name not in missing:
+            regressions += compare(name, result, baseline["scenarios"][name], args.tolerance)
+    if missing:
+        print(f"Aviso: cenários sem referência, não comparados: {', '.join(missing)}")
+    if len(missing) == len(results):
+        print("Erro: nenhum cenário executado tem referência; nada foi comparado.")
+        return 1
+    if regressions:
+        print("Regressões em relação à referência:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("Sem regressões em relação à referência.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
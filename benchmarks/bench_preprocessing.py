@@ -0,0 +1,131 @@
+"""
+Mede o tempo do OCR e a precisão por caractere com e sem cada etapa do pré-processamento.
+
+Sem argumentos, gera imagens sintéticas de documentos (fotos grandes, inclinadas e com sombra)
+com o texto de referência conhecido. Com um diretório, usa as imagens dele; a referência de
+cada imagem é o arquivo .txt de mesmo nome.
+
+Uso:
+    python -m benchmarks.bench_preprocessing [imagens] [diretório]
+"""
+import difflib
+import os
+import random
+import sys
+import time
+import numpy as np
+import pytesseract
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from modules import preprocessing
+from modules.config import IMAGE_EXTENSIONS, TESSERACT_CMD, TESSERACT_LANG, TESSERACT_PSM
+
+pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+SAMPLE_LINES = [
+    "REPUBLICA FEDERATIVA DO BRASIL",
+    "NOME: {name}",
+    "CPF: {cpf}",
+    "DATA DE NASCIMENTO: {birth}",
+    "FILIACAO: {mother}",
+    "RG: {rg} SSP/SP",
+    "CEP: {cep}",
+]
+FIRST_NAMES = ["MARIA", "JOSE", "ANA", "JOAO", "FRANCISCA", "ANTONIO", "ADRIANA", "CARLOS"]
+LAST_NAMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "RODRIGUES", "FERREIRA", "ALVES", "PEREIRA"]
+
+
+def synthetic_document(rng):
+    """Gera (imagem, texto de referência) simulando a foto de um documento."""
+    values = {
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "mother": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "cpf": "{:03d}.{:03d}.{:03d}-{:02d}".format(*(rng.randrange(1000) for _ in range(3)), rng.randrange(100)),
+        "birth": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1940, 2005)}",
+        "rg": f"{rng.randint(10, 99)}.{rng.randrange(1000):03d}.{rng.randrange(1000):03d}-{rng.randrange(10)}",
+        "cep": f"{rng.randrange(100000):05d}-{rng.randrange(1000):03d}",
+    }
+    lines = [line.format(**values) for line in SAMPLE_LINES]
+
+    font = ImageFont.load_default(size=30)
+    card = Image.new("RGB", (1100, 80 + 60 * len(lines)), (245, 243, 235))
+    draw = ImageDraw.Draw(card)
+    for index, line in enumerate(lines):
+        draw.text((50, 40 + index * 60), line, fill=(20, 20, 30), font=font)
+
+    # Fundo escuro, inclinação, resolução de celular, sombra e ruído
+    photo = Image.new("RGB", (1400, 1100), (70, 60, 55))
+    photo.paste(card, (150, 150))
+    photo = photo.rotate(rng.uniform(-5, 5), resample=Image.BICUBIC, fillcolor=(70, 60, 55))
+    photo = photo.resize((4000, 3143), Image.BICUBIC).filter(ImageFilter.GaussianBlur(1.5))
+    array = np.asarray(photo).astype(np.float32)
+    array *= np.linspace(1.0, 0.55, array.shape[1], dtype=np.float32)[None, :, None]
+    array += np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 8, array.shape).astype(np.float32)
+    return Image.fromarray(np.clip(array, 0, 255).astype(np.uint8)), "\n".join(lines)
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        reference_path = os.path.join(directory, os.path.splitext(name)[0] + ".txt")
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                corpus.append((Image.open(os.path.join(directory, name)).copy(), f.read()))
+    return corpus
+
+
+def char_accuracy(reference, text):
+    """Similaridade por caractere entre o texto de referência e o reconhecido (0 a 1), ignorando espaços extras."""
+    return difflib.SequenceMatcher(None, " ".join(reference.split()), " ".join(text.split())).ratio()
+
+
+def configurations():
+    """Sem pré-processamento, todas as etapas, e todas menos uma de cada vez."""
+    all_steps = dict.fromkeys(preprocessing.STEPS, True)
+    yield "nenhuma etapa", dict.fromkeys(preprocessing.STEPS, False)
+    yield "todas as etapas", all_steps
+    for step in preprocessing.STEPS:
+        yield f"sem {step}", {**all_steps, step: False}
+
+
+def run_configuration(corpus, steps):
+    preprocess_seconds = ocr_seconds = accuracy = 0.0
+    for image, reference in corpus:
+        start = time.perf_counter()
+        prepared = preprocessing.preprocess(image, steps)
+        middle = time.perf_counter()
+        text = pytesseract.image_to_string(prepared, lang=TESSERACT_LANG, config=f"--psm {TESSERACT_PSM}")
+        ocr_seconds += time.perf_counter() - middle
+        preprocess_seconds += middle - start
+        accuracy += char_accuracy(reference, text)
+    return preprocess_seconds, ocr_seconds, accuracy / len(corpus)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        print(f"Tesseract não encontrado ({TESSERACT_CMD}): {str(e)}")
+        return 1
+
+    if len(argv) > 1:
+        corpus = load_corpus(argv[1])
+    else:
+        rng = random.Random(42)
+        corpus = [synthetic_document(rng) for _ in range(int(argv[0]) if argv else 5)]
+    if not corpus:
+        print("Nenhuma imagem com texto de referência encontrada.")
+        return 1
+
+    print(f"{len(corpus)} imagens")
+    print(f"  {'configuração':<18} {'pré-proc.':>10} {'OCR':>10} {'precisão':>9}")
+    for label, steps in configurations():
+        preprocess_seconds, ocr_seconds, accuracy = run_configuration(corpus, steps)
+        print(f"  {label:<18} {preprocess_seconds:9.2f}s {ocr_seconds:9.2f}s {accuracy:9.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
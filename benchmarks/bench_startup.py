@@ -0,0 +1,81 @@
+"""
+Mede o tempo de inicialização da interface e dos caminhos em lote (imports dos módulos e, na
+interface, a montagem da janela) e quais dependências pesadas cada um carrega.
+
+Cada medição roda em um processo novo, sem OPENAI_API_KEY (a chave só deve ser exigida quando o
+refinamento é executado) e com a página do Flet substituída por um objeto simulado.
+
+Uso:
+    python -m benchmarks.bench_startup [repetições]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependências cujo carregamento é relatado em cada cenário
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "docx", "lxml", "pytesseract", "tesserocr",
+                 "pypdfium2", "cv2", "PIL", "httpx", "flet")
+
+# Cenário → código executado no processo filho (o tempo medido é o do código inteiro)
+SCENARIOS = {
+    "python": "pass",
+    "config": "from modules.config import get_settings; get_settings()",
+    "ui": "import main; main.main(page)",  # Janela desenhada, dados ainda carregando em segundo plano
+    "ui + dados": "import main; main.main(page); [target() for target in page.threads]",
+    "cli": "import modules.cli",
+    "pipeline": "import modules.pipeline",
+    "ocr": "import modules.ocr",
+    "word": "import modules.word_generator",
+}
+
+_CHILD = """
+import json, sys, time
+from unittest.mock import MagicMock
+page = MagicMock()
+page.threads = []
+page.run_thread.side_effect = lambda target, *args: page.threads.append(lambda: target(*args))
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(code, workdir):
+    """Executa o cenário em um processo novo e devolve (segundos, dependências carregadas)."""
+    env = {**os.environ, "OPENAI_API_KEY": "",  # Vazia: o .env não a redefine
+           "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+    completed = subprocess.run([sys.executable, "-c", _CHILD.format(code=code, heavy=HEAVY_MODULES)],
+                               cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "erro")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["modules"]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    repetitions = int(argv[0]) if argv else 5
+
+    print(f"{'cenário':<12} {'mínimo':>8} {'mediana':>8}  dependências carregadas")
+    # Diretório de trabalho vazio: o armazenamento de dados criado pela interface não suja o repositório
+    with tempfile.TemporaryDirectory(prefix="gpt_ocr_startup_") as workdir:
+        for name, code in SCENARIOS.items():
+            try:
+                runs = [measure(code, workdir) for _ in range(repetitions)]
+            except RuntimeError as e:
+                print(f"{name:<12} falhou: {str(e)}")
+                continue
+            seconds = [run[0] for run in runs]
+            print(f"{name:<12} {min(seconds):7.3f}s {statistics.median(seconds):7.3f}s  "
+                  f"{', '.join(runs[-1][1]) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
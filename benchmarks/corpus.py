@@ -0,0 +1,210 @@
+"""
+Gera um corpus sintético de documentos de identidade brasileiros com o gabarito de cada um.
+
+Cada documento gera uma imagem (doc_NNNN.jpg), o texto de referência (doc_NNNN.txt, usado
+também por bench_preprocessing) e os campos esperados (doc_NNNN.json, com os nomes das
+colunas da planilha).
+
+Uso:
+    python -m benchmarks.corpus [documentos] [diretório] [semente]
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Diretório padrão dos corpora (um subdiretório por tamanho), compartilhado com bench_pipeline
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "gpt_ocr_bench_corpus")
+
+FIRST_NAMES = ["MARIA", "JOSE", "ANA", "JOAO", "FRANCISCA", "ANTONIO", "ADRIANA", "CARLOS",
+               "JULIANA", "PAULO", "MARCIA", "LUCAS", "FERNANDA", "RAFAEL", "PATRICIA", "MARCOS"]
+LAST_NAMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "RODRIGUES", "FERREIRA", "ALVES", "PEREIRA",
+              "LIMA", "GOMES", "COSTA", "RIBEIRO", "MARTINS", "CARVALHO", "ALMEIDA", "LOPES"]
+CITIES = [("SAO PAULO", "SP"), ("RIO DE JANEIRO", "RJ"), ("BELO HORIZONTE", "MG"), ("SALVADOR", "BA"),
+          ("CURITIBA", "PR"), ("RECIFE", "PE"), ("PORTO ALEGRE", "RS"), ("FORTALEZA", "CE")]
+STREETS = ["RUA DAS FLORES", "AVENIDA BRASIL", "RUA SETE DE SETEMBRO", "RUA DA CONSOLACAO",
+           "AVENIDA PAULISTA", "RUA DOS ANDRADAS", "TRAVESSA DO COMERCIO", "RUA XV DE NOVEMBRO"]
+DISTRICTS = ["CENTRO", "JARDIM AMERICA", "VILA NOVA", "BOA VISTA", "SANTA CRUZ", "LIBERDADE"]
+
+# Rótulo impresso no documento → coluna da planilha
+LABELS = {
+    "NOME": "Nome Completo",
+    "RG": "Documento de Identidade",
+    "ORGAO EMISSOR": "Órgão Emissor",
+    "DATA DE EXPEDICAO": "Data de Emissão",
+    "DATA DE NASCIMENTO": "Data de Nascimento",
+    "NATURALIDADE": "Local de Nascimento",
+    "NACIONALIDADE": "Nacionalidade",
+    "PAI": "Nome do Pai",
+    "MAE": "Nome da Mãe",
+    "CPF": "CPF",
+    "ENDERECO": "Endereço",
+    "CIDADE": "Cidade",
+    "CEP": "CEP",
+}
+
+_LABELED_LINE = re.compile(r"^\s*([A-Z ]+?)\s*:\s*(.+?)\s*$")
+
+
+def random_cpf(rng):
+    """CPF formatado com dígitos verificadores válidos."""
+    digits = [rng.randrange(10) for _ in range(9)]
+    for size in (9, 10):
+        total = sum(digit * weight for digit, weight in zip(digits, range(size + 1, 1, -1)))
+        digits.append(total * 10 % 11 % 10)
+    text = "".join(map(str, digits))
+    return f"{text[:3]}.{text[3:6]}.{text[6:9]}-{text[9:]}"
+
+
+def _date(rng, first_year, last_year):
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(first_year, last_year)}"
+
+
+def _name(rng, surnames=2):
+    return " ".join([rng.choice(FIRST_NAMES)] + [rng.choice(LAST_NAMES) for _ in range(surnames)])
+
+
+def random_identity(rng):
+    """Campos de uma pessoa fictícia, com os nomes das colunas da planilha."""
+    birth_city, birth_state = rng.choice(CITIES)
+    city, state = rng.choice(CITIES)
+    street, number, district = rng.choice(STREETS), str(rng.randint(1, 3000)), rng.choice(DISTRICTS)
+    cep = f"{rng.randrange(10000, 100000):05d}-{rng.randrange(1000):03d}"
+    return {
+        "Nome Completo": _name(rng),
+        "CPF": random_cpf(rng),
+        "Data de Nascimento": _date(rng, 1940, 2005),
+        "Local de Nascimento": f"{birth_city} - {birth_state}",
+        "Documento de Identidade": f"{rng.randint(10, 99)}.{rng.randrange(1000):03d}.{rng.randrange(1000):03d}-{rng.randrange(10)}",
+        "Órgão Emissor": f"SSP/{state}",
+        "Data de Emissão": _date(rng, 2006, 2023),
+        "Nacionalidade": "BRASILEIRA",
+        "Nome do Pai": _name(rng),
+        "Nome da Mãe": _name(rng),
+        "Endereço Completo": f"{street}, {number}, {district}, {city}, {state}, {cep}",
+        "Rua": street,
+        "Número": number,
+        "Bairro": district,
+        "Cidade": city,
+        "Estado": state,
+        "CEP": cep,
+    }
+
+
+def document_lines(identity):
+    """Linhas impressas no documento, com os rótulos de LABELS."""
+    return [
+        "REPUBLICA FEDERATIVA DO BRASIL",
+        "CARTEIRA DE IDENTIDADE",
+        f"NOME: {identity['Nome Completo']}",
+        f"RG: {identity['Documento de Identidade']}",
+        f"ORGAO EMISSOR: {identity['Órgão Emissor']}",
+        f"DATA DE EXPEDICAO: {identity['Data de Emissão']}",
+        f"DATA DE NASCIMENTO: {identity['Data de Nascimento']}",
+        f"NATURALIDADE: {identity['Local de Nascimento']}",
+        f"NACIONALIDADE: {identity['Nacionalidade']}",
+        f"PAI: {identity['Nome do Pai']}",
+        f"MAE: {identity['Nome da Mãe']}",
+        f"CPF: {identity['CPF']}",
+        f"ENDERECO: {identity['Rua']}, {identity['Número']}, {identity['Bairro']}",
+        f"CIDADE: {identity['Cidade']} - {identity['Estado']}",
+        f"CEP: {identity['CEP']}",
+    ]
+
+
+def parse_document_text(text):
+    """
+    Lê os campos rotulados de um texto de documento (o inverso de document_lines), no formato
+    JSON pedido pelo prompt do GPT. Usado pelo servidor simulado da API.
+    """
+    values = {}
+    for line in text.splitlines():
+        match = _LABELED_LINE.match(line)
+        if match and match.group(1) in LABELS:
+            values.setdefault(LABELS[match.group(1)], match.group(2))
+
+    address = {}
+    if "Endereço" in values:
+        parts = [part.strip() for part in values.pop("Endereço").split(",")]
+        address.update(zip(("Rua", "Número", "Bairro"), parts))
+    if "Cidade" in values:
+        city, _, state = values.pop("Cidade").rpartition(" - ")
+        address.update({"Cidade": city, "Estado": state} if city else {"Cidade": state})
+    if "CEP" in values:
+        address["CEP"] = values.pop("CEP")
+    if address:
+        values["Endereço"] = address
+    return values
+
+
+def render_document(lines, rng, font_size=28):
+    """Imagem do documento escaneado: fundo claro, leve inclinação, desfoque e ruído."""
+    font = ImageFont.load_default(size=font_size)
+    line_height = int(font_size * 1.6)
+    card = Image.new("RGB", (1100, 60 + line_height * len(lines)), (246, 244, 236))
+    draw = ImageDraw.Draw(card)
+    for index, line in enumerate(lines):
+        draw.text((40, 30 + index * line_height), line, fill=(25, 25, 35), font=font)
+
+    card = card.rotate(rng.uniform(-1.5, 1.5), resample=Image.BICUBIC, expand=True, fillcolor=(246, 244, 236))
+    card = card.filter(ImageFilter.GaussianBlur(0.6))
+    array = np.asarray(card).astype(np.float32)
+    array += np.random.default_rng(rng.randrange(2 ** 32)).normal(0, 6, array.shape).astype(np.float32)
+    image = Image.fromarray(np.clip(array, 0, 255).astype(np.uint8))
+    image.info["dpi"] = (300, 300)
+    return image
+
+
+def generate_corpus(directory, documents, seed=42):
+    """
+    Grava documentos sintéticos e seus gabaritos no diretório (documentos já gerados com a mesma
+    semente são reaproveitados).
+
+    Returns:
+        list: Caminhos das imagens, em ordem.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(documents):
+        identity = random_identity(rng)
+        document_rng = random.Random(rng.randrange(2 ** 32))
+        base = os.path.join(directory, f"doc_{index + 1:04d}")
+        paths.append(base + ".jpg")
+        if os.path.exists(base + ".json"):
+            continue
+        lines = document_lines(identity)
+        render_document(lines, document_rng).save(base + ".jpg", quality=90, dpi=(300, 300))
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(identity, f, ensure_ascii=False, indent=2)  # Gravado por último: marca o documento completo
+    return paths
+
+
+def load_ground_truth(directory):
+    """Gabaritos do corpus: {nome_da_imagem: {coluna: valor}}."""
+    truth = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                truth[os.path.splitext(name)[0] + ".jpg"] = json.load(f)
+    return truth
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    documents = int(argv[0]) if argv else 10
+    directory = argv[1] if len(argv) > 1 else os.path.join(DEFAULT_CORPUS_DIR, f"{documents}_docs")
+    seed = int(argv[2]) if len(argv) > 2 else 42
+    paths = generate_corpus(directory, documents, seed)
+    print(f"{len(paths)} documentos em '{directory}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Servidor local que imita o endpoint /chat/completions da OpenAI, para medir o pipeline sem
+gastar créditos da API.
+
+As respostas são montadas a partir dos campos rotulados do texto enviado no prompt (o formato
+dos documentos de benchmarks.corpus), no mesmo formato JSON pedido ao modelo, inclusive para
+prompts com vários documentos. A latência, a taxa de erros (429/500, com retry-after-ms) e a de
+respostas malformadas (JSON truncado, corrigido no pedido de correção seguinte) são configuráveis,
+e cada resposta informa o uso de tokens estimado.
+
+Uso:
+    python -m benchmarks.mock_openai [--port 8765] [--latency 0.8] [--jitter 0.2] [--error-rate 0.02]
+                                     [--malformed-rate 0.05]
+
+Depois aponte o aplicativo para o servidor:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=teste python -m modules.cli
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.corpus import parse_document_text
+from modules.schema import BATCH_KEY
+
+# Cabeçalho de cada documento em um prompt com vários documentos (gpt_refinement.build_batch_prompt)
+_BATCH_SECTION = re.compile(r'^### Documento id="([^"]+)"\n', re.MULTILINE)
+
+
+def build_content(prompt):
+    """Conteúdo da resposta do modelo para um prompt de extração (individual ou em lote)."""
+    sections = _BATCH_SECTION.split(prompt)
+    if len(sections) == 1:
+        return json.dumps(parse_document_text(prompt), ensure_ascii=False)
+    documents = [{"id": doc_id, **parse_document_text(text)} for doc_id, text in zip(sections[1::2], sections[2::2])]
+    return json.dumps({BATCH_KEY: documents}, ensure_ascii=False)
+
+
+class MockServerStats:
+    """Contadores do servidor: requisições, erros injetados, respostas malformadas e tokens."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "malformed": self.malformed,
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+def make_handler(latency, jitter, error_rate, retry_after, stats, seed=None, malformed_rate=0.0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    broken = {}  # Resposta malformada enviada → resposta correta, devolvida quando ela for enviada para correção
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Conexões persistentes, como na API real
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Endpoint desconhecido: {self.path}"}})
+                return
+            with rng_lock:
+                delay = max(0.0, rng.gauss(latency, jitter)) if jitter else latency
+                fail = rng.random() < error_rate
+                status = rng.choice((429, 500))
+                malformed = rng.random() < malformed_rate
+            time.sleep(delay)
+
+            with stats._lock:
+                stats.requests += 1
+                stats.errors += fail
+            if fail:
+                self._send_json(status, {"error": {"message": "Erro simulado"}},
+                                {"retry-after-ms": str(int(retry_after * 1000))})
+                return
+
+            try:
+                request = json.loads(body)
+                prompt = request["messages"][-1]["content"]
+            except (ValueError, KeyError, IndexError):
+                self._send_json(400, {"error": {"message": "Requisição inválida"}})
+                return
+            with rng_lock:
+                repaired = next((key for key in broken if key in prompt), None)
+                content = broken[repaired] if repaired is not None else build_content(prompt)
+                if malformed and repaired is None:
+                    truncated = content[:len(content) // 2]
+                    broken[truncated], content = content, truncated
+            with stats._lock:
+                stats.malformed += malformed and repaired is None
+            prompt_tokens = sum(len(message.get("content", "")) for message in request["messages"]) // 4
+            completion_tokens = len(content) // 4
+            with stats._lock:
+                stats.prompt_tokens += prompt_tokens
+                stats.completion_tokens += completion_tokens
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{stats.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def log_message(self, format, *args):
+            pass  # Sem log por requisição
+
+    return Handler
+
+
+def start_server(port=0, latency=0.8, jitter=0.2, error_rate=0.0, retry_after=0.05, seed=None, malformed_rate=0.0):
+    """
+    Inicia o servidor em uma thread em segundo plano.
+
+    Returns:
+        tuple: (servidor, URL base no formato de OPENAI_BASE_URL, MockServerStats).
+    """
+    stats = MockServerStats()
+    server = ThreadingHTTPServer(("127.0.0.1", port),
+                                 make_handler(latency, jitter, error_rate, retry_after, stats, seed, malformed_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mock_openai",
+                                     description="Servidor local que imita a API de chat da OpenAI.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8, help="latência média por requisição, em segundos")
+    parser.add_argument("--jitter", type=float, default=0.2, help="desvio padrão da latência, em segundos")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das requisições que falham (429/500)")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="espera sugerida nos erros, em segundos")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fração das respostas com JSON truncado")
+    args = parser.parse_args(argv)
+
+    server, url, stats = start_server(args.port, args.latency, args.jitter, args.error_rate, args.retry_after,
+                                      malformed_rate=args.malformed_rate)
+    print(f"Servidor simulado em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(stats.as_dict()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
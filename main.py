@@ -1,8 +1,27 @@
 import flet as ft
 import os
-import pandas as pd
-from modules import ocr, gpt_refinement, excel_handler, word_generator
+import threading
+import time
+from modules import schema
 from modules.config import EXCEL_OUTPUT_FILE, CONSOLIDATED_FILE, SAVE_DIR
+from modules.edit_journal import EditJournal
+
+# pandas, o pipeline (OCR e API) e a geração dos documentos Word são importados no primeiro uso
+# (ver load_data, run_processing e generate_documents): a janela é desenhada antes de carregá-los
+
+# Colunas exibidas na tabela de resultados (todas as da planilha, menos o arquivo de origem)
+TABLE_COLUMNS = schema.TABLE_COLUMNS
+ALL_COLUMNS_OPTION = "Todas as colunas"
+
+# Intervalo mínimo entre atualizações da tela durante o processamento
+PROGRESS_REFRESH_SECONDS = 0.3
+
+def column_width(col_name):
+    return 150 if col_name not in [schema.FULL_ADDRESS_COLUMN, "Local de Nascimento"] else 200
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}min {seconds:02d}s" if minutes else f"{seconds}s"
 
 def main(Page: ft.Page):
     # Configurações da UI
@@ -16,14 +35,22 @@ def main(Page: ft.Page):
     Page.padding = ft.padding.all(20)
     Page.spacing = 20
     Page.scroll = "adaptive"
+    Page.window.prevent_close = True  # Grava as edições pendentes antes de fechar
 
     # Variáveis globais da interface
     selected_images = []
     selected_template = None
-    processed_data = []
+    table_view = None  # Dados exibidos, com busca e paginação (criado em load_data)
+    cell_containers = {}  # (linha, coluna) -> Container da célula, apenas para a página visível
     copied_value = None
     editing_cell = None
-    edited_data = {}
+    edited_data = {}  # Linhas editadas ainda não gravadas na planilha consolidada
+    batch_rows = []  # Resultados do último processamento (as pessoas cujos documentos Word são gerados)
+    store = None  # Resultados e dados consolidados; as planilhas são exportações
+    edit_journal = None
+    data_loaded = threading.Event()  # Sinaliza que os dados da última execução foram carregados
+    processing = False
+    cancel_event = threading.Event()  # Sinaliza ao pipeline que o lote foi cancelado
 
     # Função para alternar entre Dark e Light Mode
     def toggle_theme(e):
@@ -43,62 +70,136 @@ def main(Page: ft.Page):
     def open_file_explorer_template(e):
         file_picker_template.pick_files()
 
+    # Texto exibido em uma célula
+    def cell_text(value):
+        return ft.Text(
+            value,
+            color="#e0e0e0",
+            size=13,
+            text_align=ft.TextAlign.CENTER,
+            overflow=ft.TextOverflow.ELLIPSIS,
+        )
+
+    # Monta os controles apenas das linhas da página atual
+    def render_table_page():
+        cell_containers.clear()
+        rows = []
+        for row_idx, row in table_view.page_rows():
+            cells = []
+            for col_name in TABLE_COLUMNS:
+                container = ft.Container(
+                    content=cell_text(row[col_name]),
+                    width=column_width(col_name),
+                    padding=ft.padding.all(5),
+                )
+                cell_containers[(row_idx, col_name)] = container
+                cells.append(ft.DataCell(
+                    container,
+                    on_tap=lambda e, ri=row_idx, cn=col_name: start_edit(e, ri, cn)
+                ))
+            rows.append(ft.DataRow(cells=cells))
+        data_table.rows = rows
+
+        page_label.value = (f"Página {table_view.page + 1} de {table_view.page_count} "
+                            f"({len(table_view.visible)} de {len(table_view)} registros)")
+        previous_page_button.disabled = table_view.page == 0
+        next_page_button.disabled = table_view.page >= table_view.page_count - 1
+        Page.update()
+
+    def change_page(delta):
+        nonlocal editing_cell
+        if not data_loaded.is_set():
+            return
+        editing_cell = None
+        table_view.set_page(table_view.page + delta)
+        render_table_page()
+
+    # Busca e filtro por coluna, aplicados ao DataFrame
+    def apply_search(e):
+        nonlocal editing_cell
+        if not data_loaded.is_set():
+            return
+        editing_cell = None
+        column = None if filter_column.value == ALL_COLUMNS_OPTION else filter_column.value
+        table_view.filter(search_field.value, column)
+        render_table_page()
+
     # Função para iniciar a edição de uma célula
-    def start_edit(e, row_index, col_name, current_value):
+    def start_edit(e, row_index, col_name):
         nonlocal editing_cell
+        container = cell_containers.get((row_index, col_name))
+        if container is None or processing:
+            return  # Linhas parciais do processamento em andamento não são editáveis
         editing_cell = (row_index, col_name)
-        # Criar um TextField para edição
-        text_field = ft.TextField(
-            value=str(current_value),
+        # Substituir o texto da célula por um TextField
+        container.content = ft.TextField(
+            value=table_view.value(row_index, col_name),
             on_submit=lambda e: save_edit(e, row_index, col_name),
             on_blur=lambda e: save_edit(e, row_index, col_name)
         )
-        # Substituir o texto da célula pelo TextField
-        for i, row in enumerate(data_table.rows):
-            if i == row_index:
-                for j, cell in enumerate(row.cells):
-                    if data_table.columns[j].label.content.value == col_name:
-                        cell.content = text_field
-                        break
-        Page.update()
+        container.update()
 
     # Função para salvar a edição
     def save_edit(e, row_index, col_name):
-        nonlocal editing_cell, processed_data, edited_data
+        nonlocal editing_cell, edited_data
         if editing_cell == (row_index, col_name):
             new_value = e.control.value
-            # Atualizar o valor na tabela
-            for i, row in enumerate(data_table.rows):
-                if i == row_index:
-                    for j, cell in enumerate(row.cells):
-                        if data_table.columns[j].label.content.value == col_name:
-                            cell.content = ft.Container(
-                                content=ft.Text(
-                                    new_value,
-                                    color="#e0e0e0",
-                                    size=13,
-                                    text_align=ft.TextAlign.CENTER,
-                                    overflow=ft.TextOverflow.ELLIPSIS,
-                                ),
-                                width=150 if col_name not in ["Endereço", "Local Nascimento"] else 200,
-                                padding=ft.padding.all(5),
-                            )
-                            break
-            
-            # Atualizar os dados processados
-            processed_data[row_index][col_name] = new_value
-            edited_data[row_index] = processed_data[row_index]
-            
-            # Salvar alterações no arquivo Excel
-            df = pd.DataFrame(processed_data)
-            df.to_excel(CONSOLIDATED_FILE, index=False)
-            
+
+            # Atualizar os dados e apenas a célula editada
+            table_view.set_value(row_index, col_name, new_value)
+            edited_data[row_index] = table_view.row(row_index)
+            container = cell_containers.get((row_index, col_name))
+            if container is not None:
+                container.content = cell_text(new_value)
+                container.update()
+
+            # A edição vai para o journal; a linha é atualizada nos dados após EDIT_FLUSH_DELAY sem novas edições
+            edit_journal.record(row_index, col_name, new_value)
+            save_button.text = f"Salvar Alterações ({len(edited_data)})"
+            save_button.update()
+
             editing_cell = None
-            Page.update()
+
+    # Chamado após cada gravação das edições, automática ou explícita
+    def edits_saved():
+        edited_data.clear()
+        save_button.text = "Salvar Alterações"
+        if save_button.page:
+            save_button.update()
+
+    # Grava imediatamente as edições pendentes nos dados consolidados
+    def flush_edits():
+        return edit_journal.flush() if edit_journal is not None else False
+
+    # Salvamento explícito: grava as edições e exporta a planilha consolidada
+    def save_edits(e):
+        if not data_loaded.is_set():
+            return
+        try:
+            from modules import excel_handler
+            flush_edits()
+            excel_handler.export_consolidated_to_excel(CONSOLIDATED_FILE, store)
+            Page.snack_bar = ft.SnackBar(ft.Text("Alterações salvas!"), open=True)
+        except Exception as ex:
+            Page.snack_bar = ft.SnackBar(ft.Text(f"Erro ao salvar as alterações: {str(ex)}"), open=True)
+        Page.update()
+
+    # Ao fechar a janela, grava as edições pendentes antes de sair
+    def on_window_event(e):
+        if e.data == "close":
+            try:
+                if flush_edits():
+                    from modules import excel_handler
+                    excel_handler.export_consolidated_to_excel(CONSOLIDATED_FILE, store)
+            except Exception as ex:
+                print(f"Erro ao salvar as alterações: {str(ex)}")  # O journal é reaplicado na próxima abertura
+            Page.window.destroy()
 
     # Processar as imagens
     def process_images(e):
-        nonlocal processed_data
+        nonlocal processing
+        if processing:
+            return
         if not selected_images:
             Page.snack_bar = ft.SnackBar(ft.Text("Nenhuma imagem selecionada!"), open=True)
             return
@@ -106,72 +207,123 @@ def main(Page: ft.Page):
             Page.snack_bar = ft.SnackBar(ft.Text("Nenhum template selecionado!"), open=True)
             return
 
-        # Mostrar indicador de carregamento
+        # Edições pendentes são gravadas antes de a planilha consolidada ser gerada novamente
+        try:
+            flush_edits()
+        except Exception as ex:
+            print(f"Erro ao salvar as alterações: {str(ex)}")
+
+        # Mostrar o progresso e liberar o cancelamento enquanto o lote roda em segundo plano
+        processing = True
+        cancel_event.clear()
+        process_button.disabled = True
+        generate_button.disabled = True
+        cancel_button.visible = True
+        cancel_button.disabled = False
+        loading_indicator.value = None  # Indeterminado até o primeiro documento terminar
         loading_indicator.visible = True
+        progress_label.value = "Iniciando o processamento..."
+        progress_label.visible = True
+        Page.update()
+        Page.run_thread(run_processing)
+
+    # Cancelar o processamento em andamento
+    def cancel_processing(e):
+        cancel_event.set()
+        cancel_button.disabled = True
+        progress_label.value = "Cancelando... aguardando as tarefas em andamento."
         Page.update()
 
-        # Processar as imagens
-        extracted_data = {}
-        for image_path in selected_images:
-            raw_text = ocr.extract_text_from_image(image_path)
-            if not raw_text.strip():  # Verifica se o OCR não extraiu nada 
-                Page.snack_bar = ft.SnackBar(ft.Text(f"Erro ao processar a imagem: {image_path}"), open=True)
-                continue
-            
-            refined_text = gpt_refinement.refine_text_with_gpt(raw_text)
-            extracted_data[os.path.basename(image_path)] = (raw_text, refined_text)
-
-        # Salvar no Excel e consolidar
-        excel_handler.save_text_to_excel(extracted_data, EXCEL_OUTPUT_FILE)
-        
+    # Executa o pipeline fora do tratador de eventos, atualizando a interface a cada documento
+    def run_processing():
+        nonlocal processing
+        import pandas as pd
+        from modules import pipeline, excel_handler, metrics
+        data_loaded.wait()  # A tabela e o armazenamento são criados em segundo plano ao abrir a janela
+        start = time.perf_counter()
+        partial_rows = {}  # Resultados ainda não exibidos na tabela, pelo id na tabela de resultados
+        last_refresh = 0.0
+        metrics.recorder.reset()
+        batch_rows.clear()
+
+        # Linhas parciais são exibidas na tabela enquanto o lote é processado
+        table_view.set_data(pd.DataFrame(columns=excel_handler.HEADERS))
+        edited_data.clear()
+        search_field.value = ""
+        filter_column.value = ALL_COLUMNS_OPTION
+
+        def on_error(image_path, message):
+            Page.snack_bar = ft.SnackBar(ft.Text(message), open=True)
+
+        # Cada resultado é gravado no armazenamento de dados assim que o refinamento termina
+        def on_result(file_name, raw_text, refined_text):
+            row_id = excel_handler.append_result(file_name, refined_text, store)
+            row = excel_handler.build_row(file_name, refined_text)
+            batch_rows.append(row)
+            partial_rows[row_id] = dict(zip(excel_handler.HEADERS, row))
+
+        def on_progress(done, total, unit_id):
+            nonlocal last_refresh
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / done * (total - done)
+            loading_indicator.value = done / total
+            progress_label.value = (f"{done} de {total} documentos • {os.path.basename(unit_id)} • "
+                                    f"restante: {format_duration(remaining)}")
+            # Limita a frequência de atualização da tela em lotes rápidos (ex.: resultados do cache)
+            if time.perf_counter() - last_refresh >= PROGRESS_REFRESH_SECONDS or done == total:
+                last_refresh = time.perf_counter()
+                table_view.append_rows(partial_rows)
+                partial_rows.clear()
+                render_table_page()
+
         try:
-            excel_handler.consolidate_data(EXCEL_OUTPUT_FILE, CONSOLIDATED_FILE)
+            pipeline.process_batch(selected_images, on_result=on_result, on_error=on_error,
+                                   on_progress=on_progress, cancel_event=cancel_event)
+
+            # Consolidar (incluindo as execuções anteriores) e exportar as planilhas
+            progress_label.value = "Consolidando os dados..."
+            Page.update()
+            consolidated = excel_handler.consolidate_data(output_file=CONSOLIDATED_FILE, store=store)
+            if consolidated is None:
+                raise RuntimeError("veja o log para detalhes")
+            excel_handler.export_results_to_excel(EXCEL_OUTPUT_FILE, store)
+
+            # Exibir os dados consolidados (apenas a primeira página vira controles)
+            table_view.set_data(consolidated)  # Os ids e as edições de cada pessoa são mantidos
+            edited_data.clear()
+            save_button.text = "Salvar Alterações"
+            render_table_page()
+            status = "Processamento cancelado" if cancel_event.is_set() else "Processamento concluído"
+            progress_label.value = f"{status} em {format_duration(time.perf_counter() - start)}."
         except Exception as e:
             Page.snack_bar = ft.SnackBar(ft.Text(f"Erro ao consolidar dados: {str(e)}"), open=True)
+            progress_label.value = "Erro no processamento."
+        finally:
+            # Ocultar o indicador de carregamento após o processamento
+            processing = False
+            loading_indicator.visible = False
+            cancel_button.visible = False
+            process_button.disabled = False
+            generate_button.disabled = False
             Page.update()
-            return
-
-        # Carregar dados consolidados para exibição
-        df = pd.read_excel(CONSOLIDATED_FILE)
-        processed_data = df.to_dict(orient="records")
-
-        # Atualizar a tabela de dados
-        data_table.rows.clear()
-        for row_idx, row in enumerate(processed_data):
-            cells = [
-                ft.DataCell(
-                    ft.Container(
-                        content=ft.Text(
-                            str(row.get(col.label.content.value, "")),
-                            color="#e0e0e0",
-                            size=13,
-                            text_align=ft.TextAlign.CENTER,
-                            overflow=ft.TextOverflow.ELLIPSIS,
-                        ),
-                        width=150 if col.label.content.value not in ["Endereço", "Local Nascimento"] else 200,
-                        padding=ft.padding.all(5),
-                    ),
-                    on_tap=lambda e, ri=row_idx, cn=col.label.content.value, cv=row.get(col.label.content.value, ""): start_edit(e, ri, cn, cv)
-                )
-                for col in data_table.columns
-            ]
-            data_table.rows.append(ft.DataRow(cells=cells))
-        Page.update()
-
-        # Ocultar o indicador de carregamento após o processamento
-        loading_indicator.visible = False
-        Page.update()
+            try:
+                if metrics.recorder.enabled:
+                    metrics.recorder.write_report()
+            except OSError as e:
+                print(f"Erro ao gravar o relatório de métricas: {str(e)}")
 
     # Função para gerar documentos Word
     def generate_documents(e):
-        if not processed_data:
+        if processing or not batch_rows:
             Page.snack_bar = ft.SnackBar(ft.Text("Nenhum dado processado!"), open=True)
             return
 
         if not os.path.exists(SAVE_DIR):
             os.makedirs(SAVE_DIR)
 
-        df = pd.read_excel(CONSOLIDATED_FILE)
+        from modules import word_generator, excel_handler
+        flush_edits()  # Os documentos devem refletir as edições da tabela
+        df = excel_handler.consolidated_for(batch_rows, store)
         word_generator.update_word_form(selected_template, df, SAVE_DIR)
         Page.snack_bar = ft.SnackBar(ft.Text("Documentos gerados com sucesso!"), open=True)
         Page.update()
@@ -259,6 +411,15 @@ def main(Page: ft.Page):
         )
     )
 
+    save_button = ft.ElevatedButton(
+        "Salvar Alterações",
+        icon=ft.Icons.SAVE,
+        on_click=save_edits,
+        style=ft.ButtonStyle(
+            shape=ft.RoundedRectangleBorder(radius=8),
+        )
+    )
+
     generate_button = ft.ElevatedButton(
         "Gerar Documentos Word",
         icon=ft.Icons.DESCRIPTION,
@@ -280,11 +441,11 @@ def main(Page: ft.Page):
                         color="#e0e0e0",
                         text_align=ft.TextAlign.CENTER,
                     ),
-                    width=150 if col not in ["Endereço", "Local Nascimento"] else 200,
+                    width=column_width(col),
                     padding=ft.padding.all(5),
                 )
             ) 
-            for col in ["Nome Completo", "CPF", "Data de Nascimento", "Local de Nascimento", "Documento de Identidade", "Órgão Emissor", "Data deEmissão", "Nacionalidade", "Nome do Pai", "Nome da Mãe", "Endereço Completo", "Rua", "Número", "Bairro", "Cidade", "Estado", "CEP"]
+            for col in TABLE_COLUMNS
         ],
         rows=[],
         border=ft.border.all(2, "#424242"),
@@ -298,6 +459,33 @@ def main(Page: ft.Page):
         data_text_style=ft.TextStyle(color="#e0e0e0", size=13),
     )
 
+    # UI: Busca, filtro por coluna e paginação da tabela
+    search_field = ft.TextField(
+        label="Buscar",
+        prefix_icon=ft.Icons.SEARCH,
+        on_change=apply_search,
+        expand=True,
+    )
+    filter_column = ft.Dropdown(
+        value=ALL_COLUMNS_OPTION,
+        options=[ft.dropdown.Option(col) for col in [ALL_COLUMNS_OPTION] + TABLE_COLUMNS],
+        on_change=apply_search,
+        width=250,
+    )
+    previous_page_button = ft.IconButton(
+        icon=ft.Icons.CHEVRON_LEFT,
+        on_click=lambda e: change_page(-1),
+        tooltip="Página anterior",
+        disabled=True,
+    )
+    next_page_button = ft.IconButton(
+        icon=ft.Icons.CHEVRON_RIGHT,
+        on_click=lambda e: change_page(1),
+        tooltip="Próxima página",
+        disabled=True,
+    )
+    page_label = ft.Text("Nenhum registro", size=14, color="grey")
+
     # Container para a tabela com scroll
     table_scroll = ft.Container(
         content=ft.Row(
@@ -313,12 +501,23 @@ def main(Page: ft.Page):
         expand=True,
     )
 
+    cancel_button = ft.ElevatedButton(
+        "Cancelar",
+        icon=ft.Icons.STOP_ROUNDED,
+        on_click=cancel_processing,
+        visible=False,
+        style=ft.ButtonStyle(
+            shape=ft.RoundedRectangleBorder(radius=8),
+        )
+    )
+
     # UI: Indicador de Carregamento
     loading_indicator = ft.ProgressBar(
         visible=False,
         color="primary",
         bgcolor="#1a1a1a"
     )
+    progress_label = ft.Text("", size=14, color="grey", visible=False)
 
     # Layout da UI com responsividade
     Page.add(
@@ -365,7 +564,9 @@ def main(Page: ft.Page):
                     ),
                     
                     # Botão de Processamento
-                    ft.Row([process_button], alignment=ft.MainAxisAlignment.CENTER),
+                    ft.Row([process_button, cancel_button], alignment=ft.MainAxisAlignment.CENTER),
+                    loading_indicator,
+                    progress_label,
                     
                     # Divisor
                     ft.Divider(height=1, color="grey400"),
@@ -384,14 +585,18 @@ def main(Page: ft.Page):
                                 ],
                                 alignment=ft.MainAxisAlignment.CENTER
                             ),
+                            ft.Row([search_field, filter_column], spacing=10),
                             table_scroll,
+                            ft.Row(
+                                [previous_page_button, page_label, next_page_button],
+                                alignment=ft.MainAxisAlignment.CENTER,
+                            ),
                         ]),
                         padding=ft.padding.symmetric(vertical=20),
                     ),
                     
                     # Botão de Geração
-                    ft.Row([generate_button], alignment=ft.MainAxisAlignment.CENTER),
-                    loading_indicator
+                    ft.Row([save_button, generate_button], alignment=ft.MainAxisAlignment.CENTER),
                 ],
                 spacing=10,
                 expand=True,
@@ -401,6 +606,35 @@ def main(Page: ft.Page):
         )
     )
 
+    Page.window.on_event = on_window_event
+
+    # Carrega pandas, o armazenamento e os dados da última execução depois que a janela é desenhada
+    def load_data():
+        nonlocal table_view, store, edit_journal
+        try:
+            from modules import excel_handler
+            from modules.table_view import TableView
+            table_view = TableView(TABLE_COLUMNS)
+            store = excel_handler.get_store()
+            edit_journal = EditJournal(store, on_flush=lambda: edits_saved())
+
+            # Edições que não chegaram a ser gravadas (ex.: o aplicativo foi encerrado à força)
+            try:
+                edit_journal.recover()
+            except Exception as e:
+                print(f"Erro ao reaplicar as edições pendentes: {str(e)}")
+
+            # Dados consolidados da última execução
+            try:
+                table_view.set_data(store.load_consolidated())
+            except Exception as e:
+                print(f"Erro ao carregar os dados consolidados: {str(e)}")
+        finally:
+            data_loaded.set()  # Libera o processamento, que aguarda a tabela e o armazenamento
+        render_table_page()
+
+    Page.run_thread(load_data)
+
 # Executar o app Flet
 if __name__ == "__main__":
     ft.app(target=main)
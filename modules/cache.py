@@ -0,0 +1,165 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from modules import metrics
+from modules.config import CACHE_ENABLED, CACHE_DIR, CACHE_MAX_BYTES
+
+
+def make_key(*parts):
+    """Gera uma chave SHA-256 a partir de bytes e/ou valores convertidos em texto."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        # Prefixo com o tamanho evita colisões entre ("ab", "c") e ("a", "bc")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Cache persistente em SQLite, endereçado por conteúdo, com limite de tamanho
+    e despejo LRU. Seguro para uso por várias threads e processos.
+    """
+
+    def __init__(self, name, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, enabled=CACHE_ENABLED):
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.sqlite")
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma conexão por thread e por processo (conexões não sobrevivem a um fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Retorna o valor armazenado para a chave, ou None se não estiver no cache."""
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connect()
+            with conn:
+                row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                    metrics.increment("cache_misses", cache=self.name)
+                    return None
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+                metrics.increment("cache_hits", cache=self.name)
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"Erro ao ler o cache '{self.name}': {str(e)}")
+            return None
+
+    def set(self, key, value):
+        """Armazena o valor e despeja as entradas menos usadas se o limite for excedido."""
+        if not self.enabled:
+            return
+        try:
+            conn = self._connect()
+            size = len(value.encode("utf-8"))
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, size, time.time()),
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar no cache '{self.name}': {str(e)}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def clear(self):
+        """Invalida todas as entradas e zera os contadores."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("UPDATE counters SET value = 0")
+        conn.execute("VACUUM")
+
+    def stats(self):
+        """Retorna contadores de acertos/falhas, número de entradas e tamanho ocupado."""
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters"))
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Caches usados pelo pipeline
+ocr_cache = DiskCache("ocr")
+gpt_cache = DiskCache("gpt")
+CACHES = {"ocr": ocr_cache, "gpt": gpt_cache}
+
+
+def main(argv=None):
+    """
+    Comando de manutenção dos caches.
+
+    Uso:
+        python -m modules.cache stats [ocr|gpt]
+        python -m modules.cache clear [ocr|gpt]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("stats", "clear") or (len(argv) > 1 and argv[1] not in CACHES):
+        print(main.__doc__)
+        return 1
+
+    command = argv[0]
+    names = [argv[1]] if len(argv) > 1 else list(CACHES)
+    for name in names:
+        cache = CACHES[name]
+        if command == "clear":
+            cache.clear()
+            print(f"Cache '{name}' invalidado.")
+        else:
+            stats = cache.stats()
+            print(f"Cache '{name}': {stats['entries']} entradas, {stats['bytes']} de {stats['max_bytes']} bytes, "
+                  f"{stats['hits']} acertos, {stats['misses']} falhas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
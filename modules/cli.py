@@ -0,0 +1,273 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from modules import ocr, pipeline, excel_handler, metrics
+from modules.manifest import JobManifest, DONE
+from modules.config import (
+    INPUT_FOLDER, DEFAULT_TEMPLATE, IMAGE_EXTENSIONS, PDF_EXTENSIONS,
+    EXCEL_OUTPUT_FILE, CONSOLIDATED_FILE, SAVE_DIR, WORD_EXPORT_MODE, WORD_EXPORT_MODES,
+    WATCH_MAX_BATCH, WATCH_FLUSH_INTERVAL, WATCH_METRICS_SAMPLES,
+)
+
+
+def list_input_files(input_folder):
+    """Lista, em ordem alfabética, as imagens e PDFs suportados dentro do diretório de entrada."""
+    return sorted(
+        os.path.join(input_folder, name)
+        for name in os.listdir(input_folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS + PDF_EXTENSIONS) and os.path.isfile(os.path.join(input_folder, name))
+    )
+
+
+def count_documents(path):
+    """Número de documentos gerados por um arquivo de entrada (uma por página, no caso de PDFs)."""
+    if not ocr.is_pdf(path):
+        return 1
+    try:
+        return ocr.count_pdf_pages(path)
+    except Exception:
+        return 1  # PDF ilegível: será reportado como erro pelo pipeline
+
+
+class ProgressReporter:
+    """Imprime o progresso do lote e a vazão (documentos por segundo)."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def throughput(self):
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def on_result(self, file_name, raw_text, refined_text):
+        # Persiste o resultado antes de reportar, para sobreviver a interrupções
+        excel_handler.append_result(file_name, refined_text)
+        self.done += 1
+        print(f"[{self.done + self.failed}/{self.total}] {file_name} "
+              f"({self.throughput():.2f} docs/s, {self.elapsed():.1f}s)", flush=True)
+
+    def on_error(self, image_path, message):
+        self.failed += 1
+        print(f"[{self.done + self.failed}/{self.total}] {message}", flush=True)
+
+
+def report_metrics():
+    """Imprime o resumo das métricas da execução e grava os relatórios em METRICS_DIR."""
+    if not metrics.recorder.enabled:
+        return
+    print("Métricas por etapa:")
+    print(metrics.recorder.format_summary())
+    try:
+        paths = metrics.recorder.write_report()
+        print(f"Relatório de métricas: {paths['json']}, {paths['csv']}, {paths['prometheus']}")
+    except OSError as e:
+        print(f"Erro ao gravar o relatório de métricas: {str(e)}")
+
+
+def run(input_folder, template_path, generate_word=True, resume=False, export_mode=WORD_EXPORT_MODE):
+    """
+    Executa OCR → refinamento → Excel → consolidação → Word sobre um diretório de imagens
+    e grava o relatório de métricas da execução.
+    """
+    metrics.recorder.reset()
+    try:
+        return _run(input_folder, template_path, generate_word, resume, export_mode)
+    finally:
+        report_metrics()
+
+
+def _run(input_folder, template_path, generate_word, resume, export_mode):
+    image_paths = list_input_files(input_folder)
+    if not image_paths:
+        print(f"Nenhuma imagem encontrada em '{input_folder}'.")
+        return 1
+
+    # PDFs geram um documento por página
+    total_documents = sum(count_documents(path) for path in image_paths)
+
+    manifest = JobManifest()
+    if resume:
+        summary = manifest.summary(image_paths)
+        print(f"Retomando lote: {summary['excel'][DONE]} de {total_documents} documentos já concluídos.")
+
+    print(f"Processando {len(image_paths)} arquivos ({total_documents} documentos) de '{input_folder}'...")
+    progress = ProgressReporter(total_documents)
+    extracted_data = pipeline.process_batch(image_paths, on_result=progress.on_result, on_error=progress.on_error,
+                                            manifest=manifest, resume=resume)
+    print(f"OCR e refinamento: {progress.done} ok, {progress.failed} com erro em {progress.elapsed():.1f}s "
+          f"({progress.throughput():.2f} docs/s)")
+
+    if not extracted_data:
+        print("Nenhum documento processado com sucesso.")
+        manifest.close()
+        return 1
+
+    stage_start = time.perf_counter()
+    if excel_handler.consolidate_data(output_file=CONSOLIDATED_FILE) is None:
+        manifest.close()
+        return 1
+    excel_handler.export_results_to_excel(EXCEL_OUTPUT_FILE)
+    print(f"Excel e consolidação: {time.perf_counter() - stage_start:.1f}s")
+
+    if generate_word:
+        # Os documentos Word são gerados a partir dos dados consolidados das pessoas deste lote
+        units = [row for row in manifest.units_for(image_paths) if row["excel_status"] == DONE]
+        rendered = [row["path"] for row in units]
+        if resume and all(row["word_status"] == DONE for row in units):
+            print("Documentos Word já gerados para este lote.")
+        else:
+            from modules import word_generator  # python-docx e lxml só quando há documentos a gerar
+            stage_start = time.perf_counter()
+            df = excel_handler.consolidated_for([excel_handler.build_row(file_name, refined_text)
+                                                 for file_name, (_, refined_text) in extracted_data.items()])
+            word_generator.update_word_form(template_path, df, SAVE_DIR, export_mode=export_mode)
+            seconds = time.perf_counter() - stage_start
+            for path in rendered:
+                manifest.mark(path, "word", DONE, seconds=seconds)
+            print(f"Documentos Word ({len(df)}): {seconds:.1f}s")
+
+    manifest.close()
+    print(f"Total: {progress.elapsed():.1f}s para {total_documents} documentos "
+          f"({total_documents / progress.elapsed():.2f} documentos/s)")
+    return 0
+
+
+def watch(input_folder, stop_event=None):
+    """
+    Modo contínuo: acompanha o diretório de entrada e processa cada arquivo que chega (OCR →
+    refinamento → armazenamento de dados) assim que ele estiver completo, sem gerar documentos Word.
+
+    A cada WATCH_FLUSH_INTERVAL segundos com documentos novos, os dados consolidados são atualizados
+    (as edições feitas na interface são guardadas por pessoa e reaplicadas, e os ids não mudam, então
+    a interface pode ficar aberta) e as planilhas exportadas; a fila e a vazão são publicadas em metrics.prom.
+    Arquivos com etapas falhas ou pendentes no manifest são tentados de novo com espera exponencial
+    (WATCH_RETRY_BASE a WATCH_RETRY_MAX segundos). Termina com Ctrl+C, SIGTERM ou quando stop_event
+    for sinalizado, gravando o que estiver pendente; documentos interrompidos ficam pendentes no
+    manifest e são refeitos na próxima execução.
+    """
+    from modules.watcher import FolderWatcher, IngestionStats
+    if stop_event is None:
+        stop_event = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            # Serviços (systemd, Docker) são encerrados com SIGTERM
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    # O serviço roda por tempo indeterminado: só as amostras recentes ficam em memória
+    metrics.recorder.reset(max_samples=WATCH_METRICS_SAMPLES)
+    watcher = FolderWatcher(input_folder)
+    watcher.start()
+    stats = IngestionStats()
+    manifest = JobManifest()
+    last_flush, changed = time.monotonic(), False
+    print(f"Acompanhando '{input_folder}' ({'eventos' if watcher.mode == 'events' else 'varredura'}); "
+          "Ctrl+C para encerrar.", flush=True)
+
+    def on_result(file_name, raw_text, refined_text):
+        nonlocal changed
+        excel_handler.append_result(file_name, refined_text)
+        changed = True
+        stats.record()
+        print(f"{file_name} ({stats.status()})", flush=True)
+
+    errored = set()
+
+    def on_error(image_path, message):
+        errored.add(image_path.rsplit("#p", 1)[0])
+        stats.record(ok=False)
+        print(f"{message} ({stats.status()})", flush=True)
+
+    def flush():
+        nonlocal last_flush, changed
+        if changed:
+            # Só depois de documentos novos; a consolidação reaplica as edições (DataStore.replace_consolidated)
+            excel_handler.consolidate_data(output_file=CONSOLIDATED_FILE)
+            excel_handler.export_results_to_excel(EXCEL_OUTPUT_FILE)
+            changed = False
+        stats.queued = watcher.pending()
+        stats.failed = watcher.failed()
+        stats.publish()
+        if metrics.recorder.enabled:
+            try:
+                metrics.recorder.write_prometheus()
+            except OSError as e:
+                print(f"Erro ao gravar as métricas: {str(e)}")
+        last_flush = time.monotonic()
+
+    try:
+        while not stop_event.is_set():
+            queue = watcher.wait_ready()
+            while queue and not stop_event.is_set():
+                batch, queue = queue[:WATCH_MAX_BATCH], queue[WATCH_MAX_BATCH:]
+                stats.queued = len(batch) + len(queue) + watcher.pending()
+                stats.publish()
+                # Arquivos já processados com o mesmo conteúdo são pulados pelo manifest; os alterados, refeitos
+                errored.clear()
+                pipeline.process_batch(batch, on_result=on_result, on_error=on_error, manifest=manifest,
+                                       resume=True, cancel_event=stop_event)
+                if stop_event.is_set():
+                    break  # Os interrompidos ficam pendentes no manifest para a próxima execução
+                # Falhas da API ou do OCR não podem deixar o arquivo esquecido até ele mudar
+                incomplete = errored | {row["path"].rsplit("#p", 1)[0] for row in manifest.units_for(batch)
+                                        if row["excel_status"] != DONE}
+                for path in batch:
+                    if path in incomplete:
+                        delay = watcher.retry(path)
+                        print(f"Nova tentativa de {os.path.basename(path)} em {delay:.0f}s", flush=True)
+                    else:
+                        watcher.succeeded(path)
+                stats.failed = watcher.failed()
+            stats.queued = watcher.pending()
+            if time.monotonic() - last_flush >= WATCH_FLUSH_INTERVAL:
+                flush()
+    except KeyboardInterrupt:
+        print("Encerrando o modo contínuo...")
+    finally:
+        watcher.stop()
+        flush()
+        manifest.close()
+        print(f"Modo contínuo encerrado: {stats.status()}")
+        report_metrics()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m modules.cli",
+        description="Processa um diretório de imagens sem a interface gráfica.",
+    )
+    parser.add_argument("input_folder", nargs="?", default=INPUT_FOLDER,
+                        help=f"diretório com as imagens (padrão: {INPUT_FOLDER})")
+    parser.add_argument("-t", "--template", default=DEFAULT_TEMPLATE,
+                        help=f"template Word (padrão: {DEFAULT_TEMPLATE})")
+    parser.add_argument("--no-word", action="store_true",
+                        help="não gera os documentos Word")
+    parser.add_argument("--resume", action="store_true",
+                        help="retoma o lote anterior, pulando etapas já concluídas no manifest")
+    parser.add_argument("--watch", action="store_true",
+                        help="modo contínuo: processa os arquivos que chegarem ao diretório até Ctrl+C "
+                             "(sem documentos Word)")
+    parser.add_argument("--export", choices=WORD_EXPORT_MODES, default=WORD_EXPORT_MODE,
+                        help="files: um .docx por registro; zip: todos em documentos.zip; "
+                             f"merged: um único documentos.docx (padrão: {WORD_EXPORT_MODE})")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input_folder):
+        print(f"Erro: diretório de entrada não encontrado: {args.input_folder}")
+        return 1
+
+    if args.watch:
+        return watch(args.input_folder)
+    return run(args.input_folder, args.template, generate_word=not args.no_word, resume=args.resume,
+               export_mode=args.export)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,147 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
+from modules import schema
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Configurações do OpenAI
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
-    raise ValueError("Please set OPENAI_API_KEY environment variable in .env file")
+class Settings:
+    """
+    Configurações do aplicativo, lidas das variáveis de ambiente (e do arquivo .env).
 
-# Caminho para o Tesseract OCR
-TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    Use get_settings(), que resolve as configurações uma única vez por processo. Os nomes
+    também podem ser importados diretamente deste módulo (from modules.config import OCR_WORKERS).
+    """
 
-# Diretórios de entrada e saída
-INPUT_FOLDER = "images"
-OUTPUT_FOLDER = "output"
-TEMPLATE_PATH = "templates"
+    def __init__(self, env=None):
+        getenv = (os.environ if env is None else env).get
 
-# Arquivos gerados
-EXCEL_OUTPUT_FILE = os.path.join(OUTPUT_FOLDER, "documentos_processados.xlsx")
-CONSOLIDATED_FILE = os.path.join(OUTPUT_FOLDER, "dados_unificados.xlsx")
-SAVE_DIR = os.path.join(OUTPUT_FOLDER, "generated_templates")
\ No newline at end of file
+        # Configurações do OpenAI
+        self.OPENAI_API_KEY = getenv('OPENAI_API_KEY')  # Exigida apenas quando o refinamento é executado
+        self.OPENAI_BASE_URL = getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        self.OPENAI_TIMEOUT = float(getenv('OPENAI_TIMEOUT', 60))  # Segundos por requisição
+        self.OPENAI_MAX_RETRIES = int(getenv('OPENAI_MAX_RETRIES', 6))
+        self.OPENAI_RPM_LIMIT = int(getenv('OPENAI_RPM_LIMIT', 500))  # Requisições por minuto permitidas pela conta
+        self.OPENAI_TPM_LIMIT = int(getenv('OPENAI_TPM_LIMIT', 200000))  # Tokens por minuto permitidos pela conta
+        self.OPENAI_MAX_CONNECTIONS = int(getenv('OPENAI_MAX_CONNECTIONS', 20))
+
+        # Caminho para o Tesseract OCR
+        self.TESSERACT_CMD = getenv('TESSERACT_CMD', r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+
+        # Parâmetros do OCR
+        self.TESSERACT_LANG = "por"
+        self.TESSERACT_PSM = 3  # Page segmentation mode (3 = automático, padrão do Tesseract)
+        self.OCR_BACKEND = getenv('OCR_BACKEND', 'auto')  # "auto", "tesserocr" (API no processo), "cli" (stdin) ou "pytesseract"
+        self.OCR_BATCH_SIZE = int(getenv('OCR_BATCH_SIZE', 1))  # Imagens por chamada ao backend (no "cli", um processo por lote)
+
+        # OCR com confiança por palavra: passagem rápida em baixa resolução e nova leitura só das linhas incertas
+        self.OCR_CONFIDENCE_ENABLED = getenv('OCR_CONFIDENCE_ENABLED', '0') != '0'
+        self.OCR_FAST_DPI = int(getenv('OCR_FAST_DPI', 150))  # Resolução da passagem rápida (a imagem pré-processada está em PREPROCESS_TARGET_DPI)
+        self.OCR_FAST_LANG = getenv('OCR_FAST_LANG', self.TESSERACT_LANG)  # Modelo da passagem rápida (ex.: o tessdata_fast instalado como "por_fast")
+        self.OCR_MIN_CONFIDENCE = float(getenv('OCR_MIN_CONFIDENCE', 75))  # Palavras abaixo disso (0 a 100) são relidas
+        self.OCR_RETRY_PSM = int(getenv('OCR_RETRY_PSM', 7))  # PSM da nova leitura de cada linha (7 = uma única linha de texto)
+        self.OCR_PAGE_RETRY_RATIO = float(getenv('OCR_PAGE_RETRY_RATIO', 0.4))  # Acima dessa fração de palavras incertas, a página inteira é relida
+
+        # Pré-processamento das imagens antes do Tesseract (cada etapa pode ser desligada com 0)
+        self.PREPROCESS_DOWNSCALE = getenv('PREPROCESS_DOWNSCALE', '1') != '0'
+        self.PREPROCESS_TARGET_DPI = int(getenv('PREPROCESS_TARGET_DPI', 300))  # Resolução alvo de imagens com DPI informado
+        self.PREPROCESS_MAX_SIDE = int(getenv('PREPROCESS_MAX_SIDE', 2000))  # Maior lado, em pixels, de fotos sem DPI
+        self.PREPROCESS_GRAYSCALE = getenv('PREPROCESS_GRAYSCALE', '1') != '0'
+        self.PREPROCESS_THRESHOLD = getenv('PREPROCESS_THRESHOLD', '1') != '0'  # Limiarização adaptativa
+        self.PREPROCESS_DESKEW = getenv('PREPROCESS_DESKEW', '1') != '0'
+        self.PREPROCESS_CROP = getenv('PREPROCESS_CROP', '0') != '0'  # Recorte para a região do documento (opcional)
+
+        # Parâmetros de leitura de PDFs
+        self.PDF_RENDER_DPI = 300  # Resolução usada para rasterizar páginas sem camada de texto
+        self.PDF_TEXT_LAYER_MIN_CHARS = 20  # Páginas com ao menos esse texto embutido dispensam o OCR
+
+        # Parâmetros do refinamento com GPT
+        self.GPT_MODEL = "gpt-3.5-turbo"
+        self.GPT_TEMPERATURE = 0.2
+        self.GPT_BATCH_MAX_DOCS = int(getenv('GPT_BATCH_MAX_DOCS', 5))  # Documentos por requisição (1 desativa o agrupamento)
+        self.GPT_BATCH_TOKEN_BUDGET = int(getenv('GPT_BATCH_TOKEN_BUDGET', 3000))  # Tokens estimados de texto por requisição
+        self.GPT_RESPONSE_FORMAT = getenv('GPT_RESPONSE_FORMAT', 'json_object')  # "json_object", "json_schema" (saída estruturada) ou "text"
+        self.GPT_REPAIR_ATTEMPTS = int(getenv('GPT_REPAIR_ATTEMPTS', 1))  # Pedidos de correção de uma resposta malformada
+
+        # Extração local (regex) antes do GPT: o prompt pede só os campos que faltam; se todos os campos obrigatórios
+        # forem reconhecidos, a API não é chamada. O padrão exige todos os campos do schema (endereço, pais, naturalidade
+        # e órgão emissor não são extraídos localmente), então a chamada só é evitada se nada for perdido
+        self.LOCAL_EXTRACTION_ENABLED = getenv('LOCAL_EXTRACTION_ENABLED', '1') != '0'
+        self.REQUIRED_FIELDS = tuple(
+            field.strip() for field in getenv('REQUIRED_FIELDS', ','.join(schema.PROMPT_KEYS)).split(',')
+            if field.strip()
+        )
+
+        # Concorrência do pipeline (por etapa)
+        self.OCR_WORKERS = int(getenv('OCR_WORKERS', os.cpu_count() or 1))  # Processos dedicados ao Tesseract
+        self.GPT_WORKERS = int(getenv('GPT_WORKERS', 4))  # Chamadas simultâneas à API OpenAI
+        self.WORD_WORKERS = int(getenv('WORD_WORKERS', os.cpu_count() or 1))  # Processos de renderização dos documentos Word
+        self.WORD_PARALLEL_THRESHOLD = int(getenv('WORD_PARALLEL_THRESHOLD', 200))  # Abaixo disso, renderiza no próprio processo
+        self.WORD_EXPORT_MODES = ("files", "zip", "merged")  # Um arquivo por registro, um .zip com todos, ou um único .docx
+        self.WORD_EXPORT_MODE = getenv('WORD_EXPORT_MODE', 'files')  # "files", "zip" ou "merged" (um único .docx)
+
+        # Modo contínuo (python -m modules.cli --watch): arquivos que chegam ao diretório de entrada são processados
+        self.WATCH_BACKEND = getenv('WATCH_BACKEND', 'auto')  # "auto" (eventos com o watchdog, quando instalado), "events" ou "poll"
+        self.WATCH_POLL_INTERVAL = float(getenv('WATCH_POLL_INTERVAL', 2.0))  # Segundos entre varreduras e verificações dos arquivos em espera
+        self.WATCH_SETTLE_SECONDS = float(getenv('WATCH_SETTLE_SECONDS', 3.0))  # Tempo sem mudar de tamanho até o arquivo ser considerado completo
+        self.WATCH_MAX_BATCH = int(getenv('WATCH_MAX_BATCH', 50))  # Arquivos por lote do pipeline
+        self.WATCH_FLUSH_INTERVAL = float(getenv('WATCH_FLUSH_INTERVAL', 60.0))  # Segundos entre consolidações, exportações e métricas
+        self.WATCH_RETRY_BASE = float(getenv('WATCH_RETRY_BASE', 30.0))  # Espera antes de tentar de novo um arquivo com falha (dobra a cada falha)
+        self.WATCH_RETRY_MAX = float(getenv('WATCH_RETRY_MAX', 900.0))  # Espera máxima entre as tentativas
+        self.WATCH_METRICS_SAMPLES = int(getenv('WATCH_METRICS_SAMPLES', 10000))  # Amostras recentes mantidas para os percentis (os totais são acumulados)
+
+        # Interface: linhas exibidas por página da tabela de resultados
+        self.UI_PAGE_SIZE = int(getenv('UI_PAGE_SIZE', 50))
+        self.EDIT_FLUSH_DELAY = float(getenv('EDIT_FLUSH_DELAY', 2.0))  # Segundos sem edições até gravá-las nos dados consolidados
+
+        # Diretórios de entrada e saída
+        self.INPUT_FOLDER = "images"
+        self.OUTPUT_FOLDER = "output"
+        self.TEMPLATE_PATH = "templates"
+        self.DEFAULT_TEMPLATE = os.path.join(self.TEMPLATE_PATH, "template.docx")
+
+        # Extensões aceitas ao varrer o diretório de entrada
+        self.IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+        self.PDF_EXTENSIONS = (".pdf",)
+
+        # Arquivos gerados
+        self.EXCEL_OUTPUT_FILE = os.path.join(self.OUTPUT_FOLDER, "documentos_processados.xlsx")
+        self.CONSOLIDATED_FILE = os.path.join(self.OUTPUT_FOLDER, "dados_unificados.xlsx")
+        self.SAVE_DIR = os.path.join(self.OUTPUT_FOLDER, "generated_templates")
+        self.DATA_STORE_FILE = os.path.join(self.OUTPUT_FOLDER, "dados.sqlite")  # Resultados e dados consolidados (as planilhas são exportações)
+        self.MANIFEST_FILE = os.path.join(self.OUTPUT_FOLDER, "manifest.sqlite")  # Estado de cada arquivo por etapa (retomada de lotes)
+
+        # Cache persistente de OCR e refinamentos
+        self.CACHE_ENABLED = getenv('CACHE_ENABLED', '1') != '0'
+        self.CACHE_DIR = os.path.join(self.OUTPUT_FOLDER, "cache")
+        self.CACHE_MAX_BYTES = int(getenv('CACHE_MAX_BYTES', 512 * 1024 * 1024))  # Limite por cache, com despejo LRU
+
+        # Imagens duplicadas ou quase idênticas (pHash de 1024 bits) reaproveitam o resultado anterior, sem OCR nem API
+        self.DEDUP_ENABLED = getenv('DEDUP_ENABLED', '1') != '0'
+        self.DEDUP_MAX_DISTANCE = int(getenv('DEDUP_MAX_DISTANCE', 64))  # Bits diferentes (de 1024) aceitos entre duplicatas
+        self.DEDUP_INDEX_FILE = os.path.join(self.CACHE_DIR, "image_hashes.sqlite")
+
+        # Métricas de cada execução (tempo por etapa e por arquivo, tokens, cache e retentativas)
+        self.METRICS_ENABLED = getenv('METRICS_ENABLED', '1') != '0'
+        self.METRICS_DIR = getenv('METRICS_DIR', os.path.join(self.OUTPUT_FOLDER, "metrics"))  # Relatórios JSON/CSV e metrics.prom
+        self.METRICS_PREFIX = getenv('METRICS_PREFIX', 'gpt_ocr')  # Prefixo dos nomes no formato do Prometheus
+
+    def require_openai_api_key(self):
+        """Retorna a chave da API, ou levanta ValueError se ela não estiver configurada."""
+        if not self.OPENAI_API_KEY:
+            raise ValueError("Please set OPENAI_API_KEY environment variable in .env file")
+        return self.OPENAI_API_KEY
+
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """Configurações do processo, lidas na primeira chamada (depois de carregar o .env)."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Settings()
+
+
+def __getattr__(name):
+    # from modules.config import NOME: os valores vêm das configurações resolvidas uma única vez
+    settings = get_settings()
+    if name in vars(settings):
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
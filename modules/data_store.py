@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from modules.config import DATA_STORE_FILE
+
+# Tabelas de dados: resultados de cada documento (acumulados entre execuções) e registros consolidados
+TABLES = ("results", "consolidated")
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DataStore:
+    """
+    Armazenamento canônico (SQLite) dos dados entre as etapas do pipeline.
+
+    Os resultados de cada documento são acrescentados à tabela "results" assim que o
+    refinamento termina; a consolidação grava a tabela "consolidated", que a interface
+    e a geração dos documentos Word leem diretamente. As planilhas Excel passam a ser
+    apenas exportações. A coluna CPF é indexada nas duas tabelas.
+
+    Cada registro consolidado guarda sua chave de consolidação (CPF ou nome normalizado):
+    o id de uma pessoa não muda quando os dados são consolidados novamente, e as edições
+    feitas nos registros ficam também na tabela "overrides", por chave e coluna, para
+    serem reaplicadas depois de cada nova consolidação.
+    """
+
+    def __init__(self, columns, path=DATA_STORE_FILE):
+        """
+        Args:
+            columns (list): Colunas de dados (ex.: excel_handler.HEADERS), armazenadas como texto.
+            path (str): Arquivo SQLite.
+        """
+        self.columns = list(columns)
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # Uma conexão por thread e por processo (conexões não sobrevivem a um fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")  # Cada resultado confirmado sobrevive a uma queda de energia
+        columns = ", ".join(f"{_quote(column)} TEXT" for column in self.columns)
+        with conn:
+            for table in TABLES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})")
+                if "CPF" in self.columns:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_cpf ON {table} ("CPF")')
+            # Chave de consolidação (ausente em armazenamentos de versões anteriores) e edições por chave
+            if "key" not in [row[1] for row in conn.execute("PRAGMA table_info(consolidated)")]:
+                conn.execute("ALTER TABLE consolidated ADD COLUMN key TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_consolidated_key ON consolidated (key)")
+            conn.execute('CREATE TABLE IF NOT EXISTS overrides (key TEXT, "column" TEXT, value TEXT, '
+                         'PRIMARY KEY (key, "column"))')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _insert_sql(self, table, extra=()):
+        columns = list(extra) + self.columns
+        placeholders = ", ".join("?" for _ in columns)
+        return f"INSERT INTO {table} ({', '.join(map(_quote, columns))}) VALUES ({placeholders})"
+
+    def _rows(self, records):
+        return [["" if value is None or (not isinstance(value, str) and pd.isnull(value)) else str(value)
+                 for value in record] for record in records]
+
+    def append_results(self, rows):
+        """
+        Acrescenta linhas (listas na ordem das colunas) à tabela de resultados, em uma transação.
+
+        Returns:
+            list: Ids das linhas inseridas, na mesma ordem.
+        """
+        conn = self._connect()
+        sql = self._insert_sql("results")
+        with conn:
+            return [conn.execute(sql, row).lastrowid for row in self._rows(rows)]
+
+    def count(self, table="results"):
+        return self._connect().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def iter_rows(self, table="results", batch_size=1000):
+        """Percorre as linhas de uma tabela em lotes, sem carregá-la inteira (para exportações)."""
+        cursor = self._connect().execute(f"SELECT {', '.join(map(_quote, self.columns))} FROM {table} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def load(self, table="results"):
+        """Carrega uma tabela em um DataFrame indexado pelo id da linha."""
+        query = f"SELECT id, {', '.join(map(_quote, self.columns))} FROM {table} ORDER BY id"
+        return pd.read_sql_query(query, self._connect(), index_col="id").fillna("")
+
+    def load_results(self):
+        return self.load("results")
+
+    def load_consolidated(self, keys=None):
+        """Registros consolidados; com keys, apenas os dessas chaves de consolidação."""
+        if keys is None:
+            return self.load("consolidated")
+        query = f"SELECT id, key, {', '.join(map(_quote, self.columns))} FROM consolidated ORDER BY id"
+        df = pd.read_sql_query(query, self._connect(), index_col="id").fillna("")
+        return df[df["key"].isin(set(keys))].drop(columns="key")
+
+    def replace_consolidated(self, df):
+        """
+        Substitui os registros consolidados, em uma única transação.
+
+        O índice de df é a chave de consolidação de cada registro: registros cuja chave já existia
+        mantêm o id, os novos recebem ids ainda não usados, e as edições guardadas para cada chave
+        (ver update_rows) são reaplicadas sobre os valores consolidados.
+        """
+        keys = [str(key) for key in df.index]
+        rows = self._rows(df.reindex(columns=self.columns).itertuples(index=False, name=None))
+        conn = self._connect()
+        with conn:
+            ids = dict(conn.execute("SELECT key, id FROM consolidated WHERE key IS NOT NULL"))
+            conn.execute("DELETE FROM consolidated")
+            conn.executemany(self._insert_sql("consolidated", extra=("id", "key")),
+                             [[ids.get(key), key] + row for key, row in zip(keys, rows)])
+            for key, column, value in conn.execute('SELECT key, "column", value FROM overrides').fetchall():
+                if column in self.columns:
+                    conn.execute(f"UPDATE consolidated SET {_quote(column)} = ? WHERE key = ?", (value, key))
+
+    def update_rows(self, updates, table="consolidated"):
+        """
+        Atualiza somente as células alteradas. Nos registros consolidados, as edições também são
+        guardadas pela chave de consolidação, para sobreviverem às próximas consolidações.
+
+        Args:
+            updates (dict): {id_da_linha: {coluna: valor}}.
+
+        Returns:
+            int: Número de linhas atualizadas.
+        """
+        conn = self._connect()
+        updated = 0
+        with conn:
+            for row_id, values in updates.items():
+                values = {column: value for column, value in values.items() if column in self.columns}
+                if not values:
+                    continue
+                assignments = ", ".join(f"{_quote(column)} = ?" for column in values)
+                row = self._rows([values.values()])[0]
+                cursor = conn.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", row + [int(row_id)])
+                updated += cursor.rowcount
+                if table == "consolidated":
+                    conn.executemany('INSERT OR REPLACE INTO overrides (key, "column", value) '
+                                     "SELECT key, ?, ? FROM consolidated WHERE id = ? AND key IS NOT NULL",
+                                     [(column, value, int(row_id)) for column, value in zip(values, row)])
+        return updated
+
+    def find_by_cpf(self, cpf, table="consolidated"):
+        """Busca registros pelo CPF exato (usa o índice da coluna)."""
+        query = f"SELECT id, {', '.join(map(_quote, self.columns))} FROM {table} WHERE \"CPF\" = ? ORDER BY id"
+        return pd.read_sql_query(query, self._connect(), params=(cpf,), index_col="id").fillna("")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
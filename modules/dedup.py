@@ -0,0 +1,258 @@
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+from modules import gpt_refinement, ocr
+from modules.cache import make_key
+from modules.config import (
+    DEDUP_ENABLED, DEDUP_INDEX_FILE, DEDUP_MAX_DISTANCE, OCR_WORKERS,
+    GPT_MODEL, GPT_TEMPERATURE, GPT_RESPONSE_FORMAT, LOCAL_EXTRACTION_ENABLED, REQUIRED_FIELDS,
+)
+from modules.manifest import file_sha256
+
+# pHash: DCT de uma miniatura SAMPLE_SIZE x SAMPLE_SIZE, da qual são mantidas as HASH_SIZE x HASH_SIZE
+# frequências mais baixas (o layout do documento e das linhas de texto) = 1024 bits
+SAMPLE_SIZE = 64
+HASH_SIZE = 32
+HASH_WORDS = HASH_SIZE * HASH_SIZE // 64  # O hash é comparado como inteiros de 64 bits
+
+# Diferença relativa máxima entre as proporções (largura/altura) de duas duplicatas
+MAX_ASPECT_DIFFERENCE = 0.05
+
+# Energia mínima (desvio mediano das frequências do hash, em níveis de cinza) para comparar pelo pHash.
+# Em imagens quase uniformes (páginas em branco, uma linha de texto miúdo) os bits vêm do ruído e da
+# compressão, e páginas diferentes ficam próximas: essas só são reaproveitadas como cópias exatas
+MIN_HASH_ENERGY = 0.3
+
+# Matriz da DCT-II usada nas duas direções da miniatura
+_DCT = np.cos(np.pi * (2 * np.arange(SAMPLE_SIZE)[None, :] + 1) * np.arange(SAMPLE_SIZE)[:, None] / (2 * SAMPLE_SIZE))
+
+# Impressão digital de uma imagem: SHA-256 do arquivo, pHash (bytes), proporção largura/altura e
+# energia do hash (None nos registros do índice, que só são comparados com as novas imagens)
+Fingerprint = namedtuple("Fingerprint", ["sha256", "phash", "aspect", "energy"], defaults=(None,))
+
+
+def _phash_energy(image):
+    # pHash e energia: desvio mediano das frequências em relação à mediana usada como limiar dos bits
+    pixels = np.asarray(image.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.LANCZOS), dtype=np.float64)
+    frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    median = np.median(frequencies[1:])  # Sem o termo DC (brilho médio)
+    energy = float(np.median(np.abs(frequencies[1:] - median))) / SAMPLE_SIZE
+    return np.packbits(frequencies > median).tobytes(), energy
+
+
+def phash(image):
+    """
+    Hash perceptual pela DCT (pHash): cada bit indica se uma frequência baixa da miniatura em
+    tons de cinza está acima da mediana. Cópias da mesma imagem, mesmo redimensionadas ou
+    recomprimidas, diferem em poucas dezenas de bits; documentos diferentes com o mesmo
+    modelo (ex.: duas carteiras de identidade), em centenas.
+    """
+    return _phash_energy(image)[0]
+
+
+def fingerprint(path):
+    """Calcula a impressão digital de uma imagem (None se não puder ser lida)."""
+    try:
+        sha256 = file_sha256(path)
+        with Image.open(path) as image:
+            image.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))  # JPEGs são decodificados já reduzidos
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            hash_bytes, energy = _phash_energy(image)
+            return Fingerprint(sha256, hash_bytes, width / height, energy)
+    except Exception as e:
+        print(f"Erro ao calcular o hash de {path}: {str(e)}")
+        return None
+
+
+def fingerprint_images(paths, workers=OCR_WORKERS):
+    """Calcula as impressões digitais de várias imagens em paralelo: {caminho: Fingerprint ou None}."""
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        return dict(zip(paths, pool.map(fingerprint, paths)))
+
+
+def _words(hashes):
+    # Hashes (bytes) em uma matriz de inteiros de 64 bits, um hash por linha
+    return np.frombuffer(b"".join(hashes), dtype=np.uint64).reshape(-1, HASH_WORDS)
+
+
+def hamming_distances(target, hashes):
+    """Distâncias de Hamming entre um pHash (bytes) e uma matriz de hashes criada por _words."""
+    return np.bitwise_count(hashes ^ _words([target])).sum(axis=1, dtype=np.int64)
+
+
+def comparable(print_):
+    """Indica se a imagem tem detalhes suficientes para ser comparada pelo pHash (e não só pelo SHA-256)."""
+    return print_.energy is None or print_.energy >= MIN_HASH_ENERGY
+
+
+def _closest(target, hashes, aspects, max_distance):
+    # Posição do hash mais próximo dentro do limite e com proporção compatível, ou None
+    if not len(hashes) or not comparable(target):
+        return None
+    distances = hamming_distances(target.phash, hashes)
+    candidates = (distances <= max_distance) & (np.abs(aspects - target.aspect) <= MAX_ASPECT_DIFFERENCE * target.aspect)
+    if not candidates.any():
+        return None
+    return int(np.where(candidates, distances, distances.max() + 1).argmin())
+
+
+def group_duplicates(fingerprints, max_distance=DEDUP_MAX_DISTANCE):
+    """
+    Agrupa as imagens de um mesmo lote que são duplicatas exatas ou quase idênticas (as quase
+    uniformes, apenas exatas).
+
+    Args:
+        fingerprints (dict): {id: Fingerprint}, na ordem de entrada.
+
+    Returns:
+        dict: {id_da_duplicata: id_da_primeira_ocorrência}.
+    """
+    originals, hashes, aspects = [], [], []
+    by_sha = {}
+    duplicates = {}
+    for unit_id, print_ in fingerprints.items():
+        if print_.sha256 in by_sha:
+            duplicates[unit_id] = by_sha[print_.sha256]
+            continue
+        position = _closest(print_, _words(hashes), np.array(aspects), max_distance)
+        if position is not None:
+            duplicates[unit_id] = by_sha[print_.sha256] = originals[position]
+            continue
+        by_sha[print_.sha256] = unit_id
+        if not comparable(print_):
+            continue
+        originals.append(unit_id)
+        hashes.append(print_.phash)
+        aspects.append(print_.aspect)
+    return duplicates
+
+
+def settings_key():
+    """Configurações que determinam o resultado de uma imagem; resultados de outras configurações são ignorados."""
+    # Com a extração local, os campos obrigatórios decidem se a API é chamada (e o que fica vazio)
+    extraction = ("local", REQUIRED_FIELDS) if LOCAL_EXTRACTION_ENABLED else ()
+    return make_key(*ocr.settings_key(), *extraction, gpt_refinement.SYSTEM_PROMPT, gpt_refinement.build_prompt(""),
+                    GPT_MODEL, GPT_TEMPERATURE, GPT_RESPONSE_FORMAT)
+
+
+class DuplicateIndex:
+    """
+    Índice persistente (SQLite) das imagens já processadas: impressão digital e resultado
+    (texto do OCR e JSON refinado) de cada uma.
+
+    Duplicatas exatas são encontradas pelo SHA-256; as quase idênticas, pela distância de
+    Hamming entre os pHashes, calculada com NumPy sobre todos os hashes do índice, que são
+    carregados na memória na primeira consulta. Imagens quase uniformes (ver MIN_HASH_ENERGY)
+    só são reaproveitadas como cópias exatas. Usado pela thread que coordena o lote.
+    """
+
+    def __init__(self, path=DEDUP_INDEX_FILE, max_distance=DEDUP_MAX_DISTANCE, enabled=DEDUP_ENABLED):
+        self.path = path
+        self.max_distance = max_distance
+        self.enabled = enabled
+        self.version = settings_key()
+        self._conn = None
+        self._positions = None  # sha256 -> linha da matriz de hashes
+        self._shas, self._hashes, self._aspects = [], None, None
+        self._added = []  # Impressões registradas desde a última montagem da matriz
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    sha256 TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    phash BLOB NOT NULL,
+                    aspect REAL NOT NULL,
+                    path TEXT NOT NULL,
+                    raw_text TEXT NOT NULL,
+                    refined_text TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (sha256, version)
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _load(self):
+        # Hashes das imagens processadas com as configurações atuais, em uma matriz (um hash por linha)
+        if self._positions is None:
+            rows = self._connect().execute(
+                "SELECT sha256, phash, aspect FROM images WHERE version = ?", (self.version,)
+            ).fetchall()
+            self._positions = {}
+            self._added = [Fingerprint(*row) for row in rows]
+            self._hashes = _words([])
+            self._aspects = np.zeros(0, dtype=np.float64)
+        # As imagens registradas durante o lote entram na matriz de uma vez, na consulta seguinte
+        added = list({print_.sha256: print_ for print_ in self._added if print_.sha256 not in self._positions}.values())
+        self._added = []
+        if added:
+            for print_ in added:
+                self._positions[print_.sha256] = len(self._positions)
+            self._hashes = np.vstack([self._hashes, _words(print_.phash for print_ in added)])
+            self._aspects = np.concatenate([self._aspects, [print_.aspect for print_ in added]])
+            self._shas = list(self._positions)
+
+    def find(self, print_):
+        """
+        Procura uma imagem já processada igual ou quase idêntica.
+
+        Returns:
+            dict: {"path", "raw_text", "refined_text", "distance"} da imagem encontrada, ou None.
+        """
+        if not self.enabled or print_ is None:
+            return None
+        try:
+            self._load()
+            sha256, distance = print_.sha256, 0
+            if sha256 not in self._positions:
+                position = _closest(print_, self._hashes, self._aspects, self.max_distance)
+                if position is None:
+                    return None
+                sha256 = self._shas[position]
+                distance = int(hamming_distances(print_.phash, self._hashes[position:position + 1])[0])
+            row = self._connect().execute(
+                "SELECT path, raw_text, refined_text FROM images WHERE sha256 = ? AND version = ?",
+                (sha256, self.version),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erro ao consultar o índice de duplicatas: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return {"path": row[0], "raw_text": row[1], "refined_text": row[2], "distance": distance}
+
+    def add(self, print_, path, raw_text, refined_text):
+        """Registra o resultado de uma imagem processada."""
+        if not self.enabled or print_ is None:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO images (sha256, version, phash, aspect, path, raw_text, refined_text, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (print_.sha256, self.version, print_.phash, print_.aspect, path, raw_text, refined_text,
+                     time.time()),
+                )
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar no índice de duplicatas: {str(e)}")
+            return
+        if self._positions is not None:
+            self._added.append(print_)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
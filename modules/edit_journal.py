@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+from modules.config import EDIT_FLUSH_DELAY
+
+
+def edits_path(store_path):
+    """Journal de edições (JSON Lines) associado ao armazenamento de dados."""
+    return os.path.splitext(store_path)[0] + ".edits.jsonl"
+
+
+def _read_edits(path):
+    if not os.path.exists(path):
+        return []
+    edits = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                edits.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Linha inválida ignorada no journal de edições '{path}'.")
+    return edits
+
+
+def _group_edits(edits):
+    # {id_da_linha: {coluna: valor}}, com a última edição de cada célula prevalecendo
+    updates = {}
+    for edit in edits:
+        updates.setdefault(edit["row"], {})[edit["column"]] = edit.get("value")
+    return updates
+
+
+class EditJournal:
+    """
+    Persistência das edições feitas na tabela da interface.
+
+    Cada edição é acrescentada imediatamente a um journal pequeno (apenas a célula alterada,
+    sincronizada com o disco). Quando as edições param por EDIT_FLUSH_DELAY segundos, ou em
+    um salvamento explícito, somente as linhas alteradas são atualizadas nos dados consolidados,
+    em uma transação. Se o aplicativo fechar antes disso, recover() reaplica as edições pendentes.
+    """
+
+    def __init__(self, store, delay=EDIT_FLUSH_DELAY, on_flush=None):
+        """
+        Args:
+            store (DataStore): Armazenamento com a tabela de dados consolidados.
+            delay (float): Segundos sem novas edições até a gravação automática.
+            on_flush (callable): Chamado sem argumentos depois de cada gravação.
+        """
+        self.store = store
+        self.delay = delay
+        self.on_flush = on_flush
+        self.path = edits_path(store.path)
+        self.flushing_path = self.path + ".flushing"
+        self._updates = {}  # Edições pendentes: {id_da_linha: {coluna: valor}}
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Número de linhas com edições ainda não gravadas."""
+        return len(self._updates)
+
+    def record(self, row_id, column, value):
+        """Registra uma edição e reinicia a contagem para a gravação automática."""
+        line = json.dumps({"row": int(row_id), "column": column, "value": value}, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._updates.setdefault(int(row_id), {})[column] = value
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._flush_quietly)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Erro ao salvar as edições: {str(e)}")
+
+    def flush(self):
+        """
+        Grava as edições pendentes, atualizando somente as linhas alteradas.
+
+        Returns:
+            int: Número de linhas atualizadas.
+        """
+        with self._flush_lock:
+            # Edições feitas durante a gravação vão para um novo journal
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if os.path.exists(self.path):
+                    self._merge_into_flushing()
+                updates, self._updates = self._updates, {}
+            if not updates and not os.path.exists(self.flushing_path):
+                return 0
+            # O journal em gravação também traz edições de uma gravação anterior que falhou
+            pending, updates = updates, _group_edits(_read_edits(self.flushing_path))
+            for row_id, values in pending.items():
+                updates.setdefault(row_id, {}).update(values)
+
+            try:
+                updated = self.store.update_rows(updates)
+            except Exception:
+                with self._lock:
+                    for row_id, values in updates.items():
+                        self._updates.setdefault(row_id, {}).update(values)
+                raise
+            if os.path.exists(self.flushing_path):
+                os.remove(self.flushing_path)
+        if self.on_flush:
+            self.on_flush()
+        return updated
+
+    def _merge_into_flushing(self):
+        with open(self.path, encoding="utf-8") as source, open(self.flushing_path, "a", encoding="utf-8") as target:
+            target.write(source.read())
+            target.flush()
+            os.fsync(target.fileno())
+        os.remove(self.path)
+
+    def discard(self):
+        """Descarta as edições pendentes, sem gravá-las."""
+        with self._flush_lock, self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for path in (self.path, self.flushing_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._updates = {}
+
+    def recover(self):
+        """
+        Reaplica nos dados consolidados as edições que não chegaram a ser gravadas
+        (ex.: o aplicativo foi fechado antes da gravação automática).
+
+        Returns:
+            int: Número de edições reaplicadas.
+        """
+        edits = _read_edits(self.flushing_path) + _read_edits(self.path)
+        if edits:
+            self.store.update_rows(_group_edits(edits))
+            print(f"{len(edits)} edições pendentes reaplicadas.")
+        self.discard()
+        return len(edits)
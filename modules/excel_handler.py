@@ -1,110 +1,217 @@
+import numpy as np
 import pandas as pd
-from openpyxl import Workbook
 import json
 import os
-import re
+import threading
+from modules import metrics, schema
+from modules.config import EXCEL_OUTPUT_FILE
+from modules.data_store import DataStore
 
-def save_text_to_excel(data, output_file):
-    """Salva textos extraídos e refinados em um arquivo Excel."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Documentos Processados"
-
-    # Definir cabeçalho
-    headers = ["Arquivo", "Nome Completo", "CPF", "Data de Nascimento", "Local de Nascimento",
-               "Documento de Identidade", "Órgão Emissor", "Data de Emissão", "Nacionalidade",
-               "Nome do Pai", "Nome da Mãe", "Endereço Completo", "Rua", "Número", "Bairro", "Cidade", "Estado", "CEP"]
-    ws.append(headers)
-
-    # Adicionar dados
-    for file, (raw_text, refined_text) in data.items():
+# Cabeçalho da planilha de documentos processados (definido pelo schema dos campos)
+HEADERS = schema.COLUMNS
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def build_row(file, refined_text):
+    """Converte a resposta do GPT em uma linha da planilha, na ordem de HEADERS."""
+    try:
+        if not refined_text.strip():
+            raise ValueError("Resposta vazia do GPT.")
+
+        # Se o JSON não puder ser lido, a linha fica só com o nome do arquivo
         try:
-            if not refined_text.strip():
-                raise ValueError("Resposta vazia do GPT.")
+            document = schema.parse_document(refined_text)
+        except schema.SchemaError:
+            print(f"Erro ao decodificar JSON para o arquivo {file}. Resposta: {refined_text}")
+            document = {}
+
+        return schema.to_row(file, document)
+    except Exception as e:
+        print(f"Erro ao adicionar dados ao Excel: {e}, Resposta: {refined_text}")
+        return [file, "Erro"] + [""] * 16  # Linha de fallback com erro
+
+
+def get_store():
+    """Armazenamento canônico dos resultados e dos dados consolidados (aberto na primeira chamada)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DataStore(HEADERS)
+            _import_legacy_journal(_store)
+        return _store
+
 
-            # Tentar carregar o JSON, se falhar, continuar com um valor vazio
+def _import_legacy_journal(store):
+    # Resultados gravados em JSON Lines por versões anteriores são importados uma única vez
+    path = os.path.splitext(EXCEL_OUTPUT_FILE)[0] + ".jsonl"
+    if not os.path.exists(path) or store.count("results"):
+        return
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
             try:
-                # Remover delimitadores Markdown se existirem
-                refined_text_cleaned = re.sub(r"```json\s*|\s*```", "", refined_text)
-                refined_data = json.loads(refined_text_cleaned)
+                record = json.loads(line)
             except json.JSONDecodeError:
-                print(f"Erro ao decodificar JSON para o arquivo {file}. Resposta: {refined_text}")
-                refined_data = {}
-
-
-            # Processa o endereço corretamente
-            endereco = refined_data.get("Endereço", {})
-            if isinstance(endereco, dict):
-                rua = endereco.get("Rua", "") or ""
-                numero = endereco.get("Número", "") or ""
-                bairro = endereco.get("Bairro", "") or ""
-                cidade = endereco.get("Cidade", "") or ""
-                estado = endereco.get("Estado", "") or ""
-                cep = endereco.get("CEP", "") or ""
-                endereco_completo = f"{rua}, {numero}, {bairro}, {cidade}, {estado}, {cep}".strip(", ")
-            else:
-                endereco_completo = endereco
-                rua = numero = bairro = cidade = estado = cep = ""
-
-            # Adicionar dados ao Excel
-            ws.append([file,
-                       refined_data.get("Nome Completo", ""),
-                       refined_data.get("CPF", ""),
-                       refined_data.get("Data de Nascimento", ""),
-                       refined_data.get("Local de Nascimento", ""),
-                       refined_data.get("Documento de Identidade (RG)", ""),
-                       refined_data.get("Órgão Emissor", ""),
-                       refined_data.get("Data de Emissão", ""),
-                       refined_data.get("Nacionalidade", ""),
-                       refined_data.get("Nome do Pai", ""),
-                       refined_data.get("Nome da Mãe", ""),
-                       endereco_completo,
-                       rua,
-                       numero,
-                       bairro,
-                       cidade,
-                       estado,
-                       cep
-                       ])
-        except Exception as e:
-            print(f"Erro ao adicionar dados ao Excel: {e}, Resposta: {refined_text}")
-            ws.append([file, "Erro"] + [""] * 16)  # Linha de fallback com erro
-
-    # Salvar o arquivo
-    wb.save(output_file)
+                continue  # Última linha truncada por interrupção
+            rows.append([record.get(header, "") for header in HEADERS])
+    store.append_results(rows)
+    os.replace(path, path + ".importado")
+    print(f"{len(rows)} resultados importados de '{path}'.")
+
+
+def append_result(file, refined_text, store=None):
+    """
+    Persiste imediatamente um resultado no armazenamento de dados.
+
+    Cada linha é confirmada assim que o refinamento termina, então o trabalho
+    já feito sobrevive a uma interrupção do processo.
+
+    Returns:
+        int: Id da linha na tabela de resultados.
+    """
+    return (store or get_store()).append_results([build_row(file, refined_text)])[0]
+
+
+def _export_table(table, output_file, sheet_title, store=None):
+    # Planilha write-only (memória constante), gravada em arquivo temporário e renomeada ao final
+    from openpyxl import Workbook  # Carregado só quando uma planilha é exportada
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    ws.append(HEADERS)
+    for row in (store or get_store()).iter_rows(table):
+        ws.append(list(row))
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    tmp_file = output_file + ".tmp"
+    wb.save(tmp_file)
+    os.replace(tmp_file, output_file)
+
+
+@metrics.timed("export")
+def export_results_to_excel(output_file, store=None):
+    """Exporta para Excel todos os resultados acumulados."""
+    _export_table("results", output_file, "Documentos Processados", store)
     print(f"Dados salvos em '{output_file}' com sucesso!")
 
 
-def consolidate_data(input_file, output_file):
-    """Consolida dados duplicados pelo Nome Completo e salva em outro arquivo Excel."""
+@metrics.timed("export")
+def export_consolidated_to_excel(output_file, store=None):
+    """Exporta para Excel os dados consolidados (incluindo as edições feitas na interface)."""
+    _export_table("consolidated", output_file, "Dados Unificados", store)
+    print(f"Dados consolidados salvos em '{output_file}' com sucesso!")
+
+
+@metrics.timed("save")
+def save_text_to_excel(data, output_file):
+    """Acrescenta textos extraídos e refinados ao armazenamento e exporta o arquivo Excel."""
+    store = get_store()
+    store.append_results([build_row(file, refined_text) for file, (raw_text, refined_text) in data.items()])
+    export_results_to_excel(output_file, store)
+
+
+def load_results(store=None):
+    """Carrega os resultados acumulados do armazenamento de dados (sem ler planilhas)."""
+    return (store or get_store()).load_results()
+
+
+def consolidation_key(df):
+    """
+    Chave normalizada de consolidação para cada linha.
+
+    Usa os dígitos do CPF quando ele tem 11 dígitos; caso contrário, o nome sem
+    acentos, em minúsculas e com espaços normalizados. Linhas sem CPF cujo nome
+    coincide com o de uma linha com CPF recebem a chave desse CPF.
+    """
+    cpf = df["CPF"].astype("string").str.replace(r"\D", "", regex=True)
+    cpf = cpf.where(cpf.str.len() == 11)
+    name = (df["Nome Completo"].astype("string")
+            .str.normalize("NFKD")
+            .str.replace(r"[\u0300-\u036f]", "", regex=True)
+            .str.casefold()
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip())
+    name = name.where(name != "")
+
+    cpf_key = "cpf:" + cpf
+    name_key = "nome:" + name
+    # Nome -> primeiro CPF conhecido para esse nome
+    cpf_by_name = cpf_key[cpf.notna() & name.notna()].groupby(name[cpf.notna() & name.notna()], sort=False).first()
+    key = cpf_key.fillna(name.map(cpf_by_name).astype("string")).fillna(name_key)
+    return key.astype("category")
+
+
+def consolidate_records(df):
+    """
+    Consolida linhas duplicadas com agregações vetorizadas (primeiro valor não vazio por coluna).
+    O resultado é indexado pela chave de consolidação de cada registro (ver consolidation_key).
+    """
+    value_columns = [column for column in HEADERS if column != schema.FILE_COLUMN]
+    df = df.reindex(columns=HEADERS).astype(object)
+    df = df.where(df != "", np.nan)
+
+    key = consolidation_key(df)
+    valid = key.notna()
+    df, key = df[valid], key[valid].cat.remove_unused_categories()
+
+    consolidated = df[value_columns].groupby(key, observed=True, sort=False).first()
+
+    # Arquivos de origem: únicos, ordenados e unidos por vírgula. Prefixar ", " em todos
+    # menos o primeiro de cada grupo permite concatenar com sum() em vez de um join por grupo.
+    file_column = schema.FILE_COLUMN
+    files = (pd.DataFrame({"key": key, file_column: df[file_column].astype(str)})
+             [df[file_column].notna()]
+             .drop_duplicates()
+             .sort_values(["key", file_column]))
+    files[file_column] = np.where(files["key"].duplicated(), ", ", "") + files[file_column]
+    files = files.groupby("key", observed=True, sort=False)[file_column].sum()
+    consolidated[file_column] = files.reindex(consolidated.index).fillna("")
+
+    consolidated = consolidated.fillna("").sort_values("Nome Completo", kind="stable")
+    consolidated.index = consolidated.index.astype(str)
+    return consolidated.rename_axis("key")
+
+
+def consolidated_for(rows, store=None):
+    """
+    Registros consolidados das pessoas presentes nas linhas informadas (ex.: os resultados do
+    lote atual), já com as edições feitas na interface.
+
+    Args:
+        rows (list): Linhas na ordem de HEADERS (ver build_row).
+        store (DataStore): Armazenamento de dados (padrão: get_store()).
+    """
+    store = store or get_store()
+    batch = pd.DataFrame(rows, columns=HEADERS)
+    # As chaves são calculadas com todo o histórico: uma linha sem CPF recebe o CPF de outra com o mesmo nome
+    df = pd.concat([store.load_results(), batch], ignore_index=True).reindex(columns=HEADERS).astype(object)
+    key = consolidation_key(df.where(df != "", np.nan)).iloc[len(df) - len(batch):]
+    return store.load_consolidated(key.dropna().astype(str).unique())
+
+
+@metrics.timed("consolidate")
+def consolidate_data(input_data=None, output_file=None, store=None):
+    """
+    Consolida dados duplicados da mesma pessoa (pelo CPF ou, na falta dele, pelo nome
+    normalizado) e grava o resultado no armazenamento de dados. Cada pessoa mantém o id
+    das consolidações anteriores, e as edições feitas nos registros são reaplicadas.
+
+    Args:
+        input_data (pd.DataFrame): Resultados em memória; por padrão, os resultados acumulados no armazenamento.
+        output_file (str): Se informado, também exporta os dados consolidados para esse arquivo Excel.
+        store (DataStore): Armazenamento de dados (padrão: get_store()).
+
+    Returns:
+        pd.DataFrame: Dados consolidados, indexados pelo id de cada registro; None em caso de erro.
+    """
+    store = store or get_store()
     try:
-        df = pd.read_excel(input_file)
-
-        def first_non_null(series):
-            return series.dropna().iloc[0] if not series.dropna().empty else ""
-
-        consolidated_df = df.groupby("Nome Completo", as_index=False).agg({
-            "CPF": first_non_null,
-            "Data de Nascimento": first_non_null,
-            "Local de Nascimento": first_non_null,
-            "Documento de Identidade": first_non_null,
-            "Órgão Emissor": first_non_null,
-            "Data de Emissão": first_non_null,
-            "Nacionalidade": first_non_null,
-            "Nome do Pai": first_non_null,
-            "Nome da Mãe": first_non_null,
-            "Endereço Completo": first_non_null,
-            "Rua": first_non_null,
-            "Número": first_non_null,
-            "Bairro": first_non_null,
-            "Cidade": first_non_null,
-            "Estado": first_non_null,
-            "CEP": first_non_null,
-            "Arquivo": lambda x: ', '.join(sorted(set(x.dropna()))),
-        })
-
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        consolidated_df.to_excel(output_file, index=False)
-        print(f"Dados consolidados salvos em '{output_file}' com sucesso!")
+        df = input_data if isinstance(input_data, pd.DataFrame) else store.load_results()
+        store.replace_consolidated(consolidate_records(df))
+        if output_file:
+            export_consolidated_to_excel(output_file, store)
+        return store.load_consolidated()
     except Exception as e:
-        print(f"Erro ao consolidar dados: {str(e)}")
\ No newline at end of file
+        print(f"Erro ao consolidar dados: {str(e)}")
+        return None
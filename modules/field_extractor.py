@@ -0,0 +1,161 @@
+import re
+import threading
+from datetime import datetime
+from modules import schema
+
+# Campos que extract_fields consegue reconhecer
+LOCAL_FIELDS = ("Nome Completo", "CPF", "Data de Nascimento", "Data de Emissão", "Documento de Identidade", "CEP")
+
+# Padrões compilados uma única vez
+_DATE = r"(\d{2})[/.\-](\d{2})[/.\-](\d{4})"
+CPF_RE = re.compile(r"(?<!\d)(\d{3})\.?\s?(\d{3})\.?\s?(\d{3})\s?[-.]?\s?(\d{2})(?!\d)")
+CEP_RE = re.compile(r"CEP\W{0,10}(\d{2})\.?(\d{3})\s?-?\s?(\d{3})(?!\d)", re.IGNORECASE)
+CEP_FALLBACK_RE = re.compile(r"(?<!\d)(\d{5})-(\d{3})(?!\d)")
+BIRTH_DATE_RE = re.compile(r"NASC\w*[^0-9]{0,40}?" + _DATE, re.IGNORECASE)
+ISSUE_DATE_RE = re.compile(r"(?:EXPEDI|EMISS)\w*[^0-9]{0,40}?" + _DATE, re.IGNORECASE)
+RG_RE = re.compile(
+    r"(?:\bRG\b|REGISTRO\s+GERAL|IDENTIDADE)[^0-9]{0,30}?(\d{1,2}\.?\d{3}\.?\d{3}\s?-?\s?[\dXx]?)(?![\d.])",
+    re.IGNORECASE,
+)
+NAME_RE = re.compile(
+    r"\bNOME(?:\s+COMPLETO)?\b(?!\s+(?:DO\s+PAI|DA\s+M[ÃA]E|SOCIAL))\s*[:\-]?\s*\n?\s*"
+    r"([A-ZÀ-Ý][A-ZÀ-Ý']+(?: [A-ZÀ-Ý][A-ZÀ-Ý']*)+)"
+)
+
+
+def is_valid_cpf(cpf):
+    """Valida os dígitos verificadores de um CPF (com ou sem pontuação)."""
+    digits = [int(d) for d in re.sub(r"\D", "", cpf)]
+    if len(digits) != 11 or len(set(digits)) == 1:
+        return False
+    for size in (9, 10):
+        total = sum(digit * weight for digit, weight in zip(digits[:size], range(size + 1, 1, -1)))
+        check = (total * 10) % 11 % 10
+        if check != digits[size]:
+            return False
+    return True
+
+
+def _valid_date(day, month, year):
+    try:
+        return datetime(int(year), int(month), int(day)).strftime("%d/%m/%Y")
+    except ValueError:
+        return None
+
+
+def _first_date(pattern, text):
+    for match in pattern.finditer(text):
+        date = _valid_date(*match.groups())
+        if date:
+            return date
+    return None
+
+
+def extract_fields(text):
+    """
+    Extrai localmente, com expressões regulares, os campos de formato fixo.
+
+    Returns:
+        dict: Campos reconhecidos, com os mesmos nomes do prompt do GPT
+        ("Nome Completo", "CPF", "Data de Nascimento", "Data de Emissão",
+        "Documento de Identidade", "CEP"). Campos não reconhecidos são omitidos.
+    """
+    fields = {}
+
+    for match in CPF_RE.finditer(text):
+        cpf = "{}.{}.{}-{}".format(*match.groups())
+        if is_valid_cpf(cpf):
+            fields["CPF"] = cpf
+            break
+
+    match = CEP_RE.search(text)
+    if match:
+        fields["CEP"] = "{}{}-{}".format(*match.groups())
+    else:
+        match = CEP_FALLBACK_RE.search(text)
+        if match:
+            fields["CEP"] = "{}-{}".format(*match.groups())
+
+    birth_date = _first_date(BIRTH_DATE_RE, text)
+    if birth_date:
+        fields["Data de Nascimento"] = birth_date
+    issue_date = _first_date(ISSUE_DATE_RE, text)
+    if issue_date:
+        fields["Data de Emissão"] = issue_date
+
+    for match in RG_RE.finditer(text):
+        rg = re.sub(r"\s", "", match.group(1)).upper()
+        # Evita confundir o CPF com o RG
+        if re.sub(r"\D", "", rg) != re.sub(r"\D", "", fields.get("CPF", "")):
+            fields["Documento de Identidade"] = rg
+            break
+
+    match = NAME_RE.search(text)
+    if match:
+        fields["Nome Completo"] = match.group(1).strip()
+
+    return fields
+
+
+def to_refined_json(fields):
+    """Converte os campos locais no mesmo formato JSON devolvido pelo GPT (CEP dentro de "Endereço")."""
+    return schema.dumps(schema.normalize(fields))
+
+
+def merge_into_refined(refined_text, fields):
+    """
+    Completa a resposta do GPT com os campos extraídos localmente.
+
+    Os valores locais (validados) prevalecem. Se a resposta não for um JSON
+    válido, ela é devolvida sem alterações.
+    """
+    if not fields:
+        return refined_text
+    try:
+        data = schema.parse_document(refined_text)
+    except schema.SchemaError:
+        return refined_text
+
+    for key, value in schema.normalize(fields).items():
+        if key == schema.ADDRESS:
+            endereco = data.get(schema.ADDRESS)
+            if not isinstance(endereco, dict):
+                endereco = {"Rua": endereco} if endereco else {}
+            endereco.update(value)
+            data[schema.ADDRESS] = endereco
+        else:
+            data[key] = value
+    return schema.dumps(data)
+
+
+def unrecognized_fields(required):
+    """Campos obrigatórios que a extração local nunca reconhece (com algum deles, a API é sempre chamada)."""
+    return [field for field in required if field not in LOCAL_FIELDS]
+
+
+class ExtractionStats:
+    """Contadores da extração local em uma execução do pipeline."""
+
+    def __init__(self, required=()):
+        self.unrecognized = unrecognized_fields(required)
+        self.documents = 0
+        self.complete = 0  # Todos os campos obrigatórios locais: nenhuma chamada à API
+        self.partial = 0  # Prompt reduzido aos campos faltantes
+        self._lock = threading.Lock()
+
+    def record(self, found_all, found_any):
+        with self._lock:
+            self.documents += 1
+            if found_all:
+                self.complete += 1
+            elif found_any:
+                self.partial += 1
+
+    def summary(self):
+        if self.unrecognized:
+            # Nenhum documento pode dispensar a API: informa o motivo em vez de um contador sempre zerado
+            return (f"Extração local: {self.partial} de {self.documents} documentos com prompt reduzido; "
+                    f"nenhuma chamada à API é evitada, pois REQUIRED_FIELDS inclui campos não extraídos "
+                    f"localmente ({', '.join(self.unrecognized)})")
+        return (f"Extração local: {self.complete} de {self.documents} documentos sem chamada à API, "
+                f"{self.partial} com prompt reduzido")
@@ -1,53 +1,256 @@
- 
-import openai
-from modules.config import OPENAI_API_KEY
+from modules import openai_client, schema, metrics
+from modules.cache import make_key, gpt_cache
+from modules.config import (
+    GPT_MODEL, GPT_TEMPERATURE, GPT_BATCH_MAX_DOCS, GPT_BATCH_TOKEN_BUDGET, GPT_RESPONSE_FORMAT, GPT_REPAIR_ATTEMPTS,
+)
 
-# Configuração da API OpenAI
-openai.api_key = OPENAI_API_KEY
+SYSTEM_PROMPT = "Você organiza informações extraídas de documentos em JSON."
 
-def refine_text_with_gpt(text):
-    """Refina o texto extraído e organiza os dados usando a API OpenAI GPT."""
-    prompt = f"""
+# Pedido de correção de uma resposta malformada: só a resposta é reenviada, sem o texto do OCR
+REPAIR_PROMPT = """A resposta abaixo deveria ser {expected}, mas não pôde ser lida: {error}
+Corrija apenas o formato, sem alterar os valores, e responda somente com o JSON corrigido.
+
+{content}
+"""
+
+# Limite de palavras incertas do OCR citadas por documento no prompt
+MAX_UNCERTAIN_WORDS = 30
+
+
+def _uncertain_note(uncertain, label):
+    if not uncertain:
+        return ""
+    return f"{label}: {', '.join(uncertain[:MAX_UNCERTAIN_WORDS])}\n"
+
+
+def build_prompt(text, fields=None, uncertain=None):
+    """
+    Monta o prompt de extração de campos para o texto do OCR.
+
+    Args:
+        text (str): Texto extraído pelo OCR.
+        fields (list): Se informado, pede apenas essas chaves de schema.PROMPT_KEYS (as demais já
+            foram extraídas localmente).
+        uncertain (list): Palavras lidas com baixa confiança pelo OCR, que o modelo deve conferir.
+    """
+    note = _uncertain_note(uncertain, "Palavras lidas com baixa confiança pelo OCR (confira-as pelo contexto e pelo "
+                                      "formato de cada campo)")
+    return f"""
 Abaixo está um texto extraído de um documento.
-Extraia os seguintes campos (se existirem):
-- Nome Completo
-- Data de Nascimento
-- Local de Nascimento
-- Documento de Identidade (RG)
-- Órgão Emissor
-- Data de Emissão
-- Nacionalidade
-- Nome do Pai
-- Nome da Mãe
-- Endereço (Rua, Número, Bairro, Cidade, Estado, CEP - se existirem separadamente)
-- CEP
-- CPF
-
-Organize o resultado em formato JSON.
-Se houver endereço, separe os campos como:
-- Rua
-- Número
-- Bairro
-- Cidade
-- Estado
-- CEP
-
-Se algum campo estiver ausente, deixe vazio.
-
-Texto extraído:
+Extraia os campos abaixo (se existirem):
+{schema.descriptions(fields)}
+
+Responda somente com um objeto JSON com exatamente estas chaves, deixando vazio o que não existir:
+{schema.template(fields)}
+
+{note}Texto extraído:
 {text}
 """
-    
+
+
+def build_batch_prompt(documents):
+    """
+    Monta um único prompt para vários documentos.
+
+    Args:
+        documents (list): Tuplas (id, texto, campos, palavras_incertas); o id é devolvido pelo modelo em
+            cada objeto da resposta e, quando campos não é None, apenas esses campos são pedidos para o documento.
+    """
+    sections = []
+    for doc_id, text, fields, uncertain in documents:
+        wanted = f"Campos a extrair: {', '.join(fields)}\n" if fields is not None else ""
+        doubtful = _uncertain_note(uncertain, "Leitura incerta")
+        sections.append(f'### Documento id="{doc_id}"\n{wanted}{doubtful}{text}\n')
+    sections = "\n".join(sections)
+    partial_note = ("Quando um documento indicar \"Campos a extrair\", preencha somente esses campos.\n"
+                    if any(fields is not None for _, _, fields, _ in documents) else "")
+    if any(uncertain for _, _, _, uncertain in documents):
+        partial_note += ("Palavras em \"Leitura incerta\" foram lidas com baixa confiança pelo OCR: confira-as "
+                         "pelo contexto e pelo formato de cada campo.\n")
+    return f"""
+Abaixo estão textos extraídos de {len(documents)} documentos diferentes.
+Para cada documento, extraia os campos abaixo (se existirem):
+{schema.descriptions()}
+
+{partial_note}Responda somente com um objeto JSON {{"{schema.BATCH_KEY}": [...]}} com um objeto por documento,
+na mesma ordem, cada um com o campo "id" do documento correspondente e exatamente estas chaves,
+deixando vazio o que não existir:
+{schema.template()}
+
+{sections}"""
+
+
+def estimate_tokens(text):
+    """Estimativa rápida de tokens (cerca de 4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+def _cache_key(text, fields=None, uncertain=None):
+    # Mesma chave para respostas individuais e em lote: o resultado de um documento não depende do lote
+    return make_key(SYSTEM_PROMPT, build_prompt(text, fields, uncertain), GPT_MODEL, GPT_TEMPERATURE)
+
+
+def response_format(fields=None, batch=False):
+    """Formato de resposta pedido à API (GPT_RESPONSE_FORMAT); None para texto livre."""
+    if GPT_RESPONSE_FORMAT == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "documentos" if batch else "documento", "strict": True,
+                                                        "schema": schema.json_schema(fields, batch)}}
+    if GPT_RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def _chat(prompt, response_format=None):
+    # Cliente compartilhado: conexões reutilizadas, limites de RPM/TPM e retentativas com backoff
+    options = {"response_format": response_format} if response_format else {}
+    return openai_client.chat(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model=GPT_MODEL,
+        temperature=GPT_TEMPERATURE,
+        **options
+    )
+
+
+def _parse_or_repair(content, parse, expected, response_format=None):
+    """
+    Lê a resposta com parse; se ela estiver malformada, pede ao modelo apenas a correção do JSON
+    (até GPT_REPAIR_ATTEMPTS vezes) em vez de reenviar o prompt com o texto do documento.
+
+    Raises:
+        SchemaError: Se a resposta continuar inválida após as correções.
+    """
+    for attempt in range(GPT_REPAIR_ATTEMPTS + 1):
+        try:
+            return parse(content)
+        except schema.SchemaError as e:
+            metrics.increment("gpt_invalid_responses")
+            if attempt >= GPT_REPAIR_ATTEMPTS:
+                raise
+            metrics.increment("gpt_repairs")
+            content = _chat(REPAIR_PROMPT.format(expected=expected, error=str(e), content=content), response_format)
+
+
+def refine_text_with_gpt(text, fields=None, uncertain=None):
+    """
+    Refina o texto extraído e organiza os dados usando a API OpenAI GPT (com cache por texto e prompt).
+
+    Args:
+        text (str): Texto extraído pelo OCR.
+        fields (list): Se informado, pede apenas esses campos ao modelo.
+        uncertain (list): Palavras lidas com baixa confiança pelo OCR, citadas no prompt.
+
+    Returns:
+        str: JSON canônico do documento (schema.dumps).
+
+    Raises:
+        OpenAIRequestError: Se a API falhar mesmo após as retentativas (nada é armazenado no cache).
+        SchemaError: Se a resposta não puder ser lida nem após o pedido de correção.
+    """
+    cache_key = _cache_key(text, fields, uncertain)
+    cached = _cached_document(cache_key)
+    if cached is not None:
+        return cached
+
+    return _refine_uncached(text, fields, cache_key, uncertain)
+
+
+def _cached_document(cache_key):
+    # Respostas gravadas por versões anteriores (texto livre) são normalizadas na leitura
+    cached_response = gpt_cache.get(cache_key)
+    if cached_response is None:
+        return None
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Você organiza informações extraídas de documentos em JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2
-        )
-        return response['choices'][0]['message']['content']
-    except Exception as e:
-        print(f"Erro ao processar com GPT: {str(e)}")
-        return "{}"  # Retorna JSON vazio em caso de erro
+        return schema.dumps(schema.parse_document(cached_response))
+    except schema.SchemaError:
+        return None
+
+
+def _refine_uncached(text, fields, cache_key, uncertain=None):
+    fmt = response_format(fields)
+    content = _chat(build_prompt(text, fields, uncertain), fmt)
+    refined = schema.dumps(_parse_or_repair(content, schema.parse_document, "um objeto JSON", fmt))
+    gpt_cache.set(cache_key, refined)  # Erros e respostas inválidas não são armazenados
+    return refined
+
+
+def plan_batches(texts, max_docs=GPT_BATCH_MAX_DOCS, token_budget=GPT_BATCH_TOKEN_BUDGET):
+    """Agrupa os ids de {id: texto} em lotes limitados por quantidade e por tokens estimados."""
+    batches, current, current_tokens = [], [], 0
+    for doc_id, text in texts.items():
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_docs or current_tokens + tokens > token_budget):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(doc_id)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def refine_texts_with_gpt_batch(texts, fields=None, uncertain=None):
+    """
+    Refina vários textos agrupando-os em poucas requisições, para não repetir o prompt
+    a cada documento.
+
+    Cada lote pede um objeto JSON com o array "documentos", um objeto por documento, identificado
+    por um id estável. Uma resposta malformada recebe um pedido de correção; se ainda assim não
+    puder ser lida, ou faltar algum documento, esses documentos são refinados individualmente.
+
+    Args:
+        texts (dict): {id: texto_do_ocr}.
+        fields (dict): {id: campos} opcional, para pedir apenas alguns campos de cada documento.
+        uncertain (dict): {id: palavras lidas com baixa confiança pelo OCR} opcional.
+
+    Returns:
+        dict: {id: texto_refinado}, no mesmo formato devolvido por refine_text_with_gpt;
+        documentos cuja chamada falhou definitivamente recebem "".
+    """
+    fields, uncertain = fields or {}, uncertain or {}
+
+    def key(doc_id):
+        return _cache_key(texts[doc_id], fields.get(doc_id), uncertain.get(doc_id))
+
+    results, uncached = {}, {}
+    for doc_id, text in texts.items():
+        cached = _cached_document(key(doc_id))
+        if cached is not None:
+            results[doc_id] = cached
+        else:
+            uncached[doc_id] = text
+
+    def refine_one(doc_id):
+        try:
+            return _refine_uncached(uncached[doc_id], fields.get(doc_id), key(doc_id), uncertain.get(doc_id))
+        except (openai_client.OpenAIRequestError, schema.SchemaError) as e:
+            print(f"Erro ao processar com GPT o documento {doc_id}: {str(e)}")
+            return ""
+
+    for batch in plan_batches(uncached):
+        if len(batch) == 1:
+            results[batch[0]] = refine_one(batch[0])
+            continue
+
+        # Ids curtos e estáveis dentro do lote ("1", "2", ...) evitam que o modelo confunda nomes de arquivo
+        local_ids = {str(position): doc_id for position, doc_id in enumerate(batch, start=1)}
+        documents = [(local_id, uncached[doc_id], fields.get(doc_id), uncertain.get(doc_id))
+                     for local_id, doc_id in local_ids.items()]
+        fmt = response_format(batch=True)
+        try:
+            parsed = _parse_or_repair(_chat(build_batch_prompt(documents), fmt),
+                                      lambda content: schema.parse_batch(content, set(local_ids)),
+                                      f'um objeto JSON {{"{schema.BATCH_KEY}": [...]}}', fmt)
+        except Exception as e:
+            print(f"Erro ao processar lote com GPT ({len(batch)} documentos), refinando individualmente: {str(e)}")
+            parsed = {}
+
+        for local_id, doc_id in local_ids.items():
+            if local_id in parsed:
+                results[doc_id] = schema.dumps(parsed[local_id])
+                gpt_cache.set(key(doc_id), results[doc_id])
+            else:
+                results[doc_id] = refine_one(doc_id)
+    return results
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import time
+from modules.config import MANIFEST_FILE
+
+# Etapas registradas para cada arquivo de entrada, na ordem do pipeline
+STAGES = ("ocr", "refine", "excel", "word")
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Calcula o SHA-256 do conteúdo de um arquivo sem carregá-lo inteiro na memória."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobManifest:
+    """
+    Registro persistente (SQLite) do estado de cada arquivo de entrada no pipeline:
+    status e duração de cada etapa, hash do conteúdo e os textos já obtidos.
+    Permite retomar um lote interrompido sem refazer etapas concluídas.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        stage_columns = ",\n".join(
+            f"{stage}_status TEXT NOT NULL DEFAULT '{PENDING}', {stage}_seconds REAL" for stage in STAGES
+        )
+        with self.conn:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    raw_text TEXT,
+                    refined_text TEXT,
+                    {stage_columns},
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    def register(self, path, reset=False, sha256=None):
+        """
+        Registra um arquivo de entrada (ou uma página de PDF, identificada por "arquivo.pdf#pN"
+        com o hash do PDF em sha256). Se o conteúdo mudou desde o último registro
+        (ou se reset=True), todas as etapas voltam a ficar pendentes.
+        """
+        sha256 = sha256 or file_sha256(path)
+        row = self.get(path)
+        if row is not None and row["sha256"] == sha256 and not reset:
+            return row
+
+        statuses = ", ".join(f"{stage}_status = '{PENDING}', {stage}_seconds = NULL" for stage in STAGES)
+        with self.conn:
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO files (path, file_name, sha256, updated_at) VALUES (?, ?, ?, ?)",
+                    (path, os.path.basename(path), sha256, time.time()),
+                )
+            else:
+                self.conn.execute(
+                    f"UPDATE files SET sha256 = ?, raw_text = NULL, refined_text = NULL, error = NULL, "
+                    f"{statuses}, updated_at = ? WHERE path = ?",
+                    (sha256, time.time(), path),
+                )
+        return self.get(path)
+
+    def get(self, path):
+        """Retorna o registro do arquivo (sqlite3.Row) ou None."""
+        return self.conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+
+    def is_done(self, path, stage):
+        row = self.get(path)
+        return row is not None and row[f"{stage}_status"] == DONE
+
+    def mark(self, path, stage, status, seconds=None, error=None, raw_text=None, refined_text=None):
+        """Atualiza o status de uma etapa e, opcionalmente, guarda os textos produzidos."""
+        if stage not in STAGES:
+            raise ValueError(f"Etapa desconhecida: {stage}")
+        assignments = [f"{stage}_status = ?", f"{stage}_seconds = ?", "error = ?", "updated_at = ?"]
+        values = [status, seconds, error, time.time()]
+        if raw_text is not None:
+            assignments.append("raw_text = ?")
+            values.append(raw_text)
+        if refined_text is not None:
+            assignments.append("refined_text = ?")
+            values.append(refined_text)
+        with self.conn:
+            self.conn.execute(f"UPDATE files SET {', '.join(assignments)} WHERE path = ?", values + [path])
+
+    def units_for(self, paths):
+        """Retorna os registros dos arquivos informados, incluindo as páginas registradas de cada PDF."""
+        wanted = set(paths)
+        rows = self.conn.execute("SELECT * FROM files").fetchall()
+        return [row for row in rows if row["path"] in wanted or row["path"].rsplit("#p", 1)[0] in wanted]
+
+    def summary(self, paths=None):
+        """Conta os arquivos por etapa e status: {etapa: {status: quantidade}}."""
+        if paths is None:
+            rows = self.conn.execute("SELECT * FROM files").fetchall()
+        else:
+            rows = self.units_for(paths)
+        result = {stage: {PENDING: 0, DONE: 0, FAILED: 0} for stage in STAGES}
+        for row in rows:
+            for stage in STAGES:
+                result[stage][row[f"{stage}_status"]] += 1
+        return result
@@ -0,0 +1,304 @@
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from modules.config import METRICS_ENABLED, METRICS_DIR, METRICS_PREFIX
+
+# Colunas fixas de cada amostra no relatório CSV (os contadores vêm em seguida)
+SAMPLE_FIELDS = ("stage", "file", "wall_seconds", "cpu_seconds")
+
+QUANTILES = (0.5, 0.95)
+
+
+def _children_cpu():
+    # Tempo de CPU dos processos filhos já encerrados (ex.: o executável do Tesseract)
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def percentile(values, q):
+    """Percentil por interpolação linear (0 para uma lista vazia)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _by_name(values):
+    # {(nome, rótulos): valor} -> {"nome{rótulo=valor}": valor}, para os resumos
+    return {name if not labels else f"{name}{{{','.join(f'{k}={v}' for k, v in labels)}}}": value
+            for (name, labels), value in values.items()}
+
+
+class MetricsRecorder:
+    """
+    Coleta as métricas de uma execução do pipeline.
+
+    Cada etapa executada gera amostras (etapa, arquivo, tempo de relógio, tempo de CPU e
+    contadores como tokens e acertos de cache). Contadores incrementados durante uma etapa
+    também são atribuídos à amostra em andamento na mesma thread. Seguro para várias threads;
+    processos do pool de OCR devolvem suas amostras ao processo principal com drain()/merge().
+
+    Os totais por etapa são acumulados à parte; com max_samples (ex.: no modo contínuo), só as
+    amostras mais recentes são mantidas, para os percentis e os relatórios, e a memória não
+    cresce com o tempo de execução.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, max_samples=None):
+        """
+        Descarta as amostras e contadores (início de uma nova execução).
+
+        Args:
+            max_samples (int): Se informado, mantém apenas as últimas max_samples amostras.
+        """
+        with self._lock:
+            self.samples = deque(maxlen=max_samples)
+            self.stages = {}  # Totais por etapa: {etapa: {"samples", "wall_seconds", "cpu_seconds", "counters"}}
+            self.counters = {}
+            self.gauges = {}
+            self.started = time.time()
+            self._local = threading.local()  # Etapas herdadas de outro processo (fork) não continuam abertas
+
+    def _active(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name, files=None):
+        """
+        Mede uma etapa: gera uma amostra por arquivo, dividindo igualmente entre os arquivos o
+        tempo e os contadores de uma etapa feita em lote.
+
+        Args:
+            name (str): Nome da etapa (ex.: "ocr", "refine").
+            files (str | list): Arquivo ou arquivos processados; None para etapas do lote inteiro.
+        """
+        if not self.enabled:
+            yield
+            return
+        counters = {}
+        active = self._active()
+        active.append(counters)
+        wall_start, cpu_start, children_start = time.perf_counter(), time.thread_time(), _children_cpu()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start + _children_cpu() - children_start
+            active.remove(counters)
+            files = [files] if files is None or isinstance(files, str) else list(files) or [None]
+            share = 1 / len(files)
+            samples = [{
+                "stage": name,
+                "file": file,
+                "wall_seconds": wall * share,
+                "cpu_seconds": cpu * share,
+                "counters": {counter: value * share for counter, value in counters.items()},
+            } for file in files]
+            self._add(samples)
+
+    def observe(self, name, seconds, file=None):
+        """
+        Registra uma amostra com a duração já medida, para operações que não podem usar stage()
+        (ex.: requisições concorrentes no loop de eventos, que não seguem a pilha de etapas da thread).
+        """
+        if not self.enabled:
+            return
+        self._add([{"stage": name, "file": file, "wall_seconds": seconds, "cpu_seconds": 0.0, "counters": {}}])
+
+    def _add(self, samples):
+        with self._lock:
+            self.samples.extend(samples)
+            for sample in samples:
+                stage = self.stages.setdefault(sample["stage"], {"samples": 0, "wall_seconds": 0.0,
+                                                                 "cpu_seconds": 0.0, "counters": {}})
+                stage["samples"] += 1
+                stage["wall_seconds"] += sample["wall_seconds"]
+                stage["cpu_seconds"] += sample["cpu_seconds"]
+                for name, value in sample["counters"].items():
+                    stage["counters"][name] = stage["counters"].get(name, 0) + value
+
+    def timed(self, name):
+        """Decorador equivalente a stage(name) para etapas do lote inteiro."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def increment(self, name, amount=1, **labels):
+        """Incrementa um contador da execução (ex.: tokens, retentativas, acertos de cache)."""
+        if not self.enabled or not amount:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        for counters in self._active():
+            counters[name] = counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Define o valor atual de uma medida instantânea (ex.: arquivos na fila do modo contínuo)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def drain(self):
+        """Retorna e descarta as amostras e contadores coletados (em um processo do pool)."""
+        with self._lock:
+            data = {"samples": list(self.samples), "counters": list(self.counters.items())}
+            self.samples.clear()
+            self.stages, self.counters = {}, {}
+        return data
+
+    def merge(self, data):
+        """Incorpora as amostras e contadores devolvidos por drain() em outro processo."""
+        if not data:
+            return
+        self._add(data["samples"])
+        with self._lock:
+            for key, value in data["counters"]:
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self):
+        """
+        Resumo por etapa: amostras, tempos totais de relógio e CPU, percentis p50/p95 do
+        tempo por arquivo (sobre as amostras mantidas) e totais dos contadores.
+        """
+        with self._lock:
+            counters, gauges = dict(self.counters), dict(self.gauges)
+            stages = {name: {**stage, "counters": dict(stage["counters"])} for name, stage in self.stages.items()}
+            wall = {}
+            for sample in self.samples:
+                wall.setdefault(sample["stage"], []).append(sample["wall_seconds"])
+        for name, stage in stages.items():
+            for q in QUANTILES:
+                stage[f"p{round(q * 100)}_seconds"] = percentile(wall.get(name, []), q)
+        return {"started": self.started, "elapsed_seconds": time.time() - self.started,
+                "stages": stages, "counters": _by_name(counters), "gauges": _by_name(gauges)}
+
+    def format_summary(self):
+        """Tabela legível do resumo por etapa, para o final de cada execução."""
+        summary = self.summary()
+        lines = [f"  {'etapa':<12} {'amostras':>8} {'total':>9} {'CPU':>9} {'p50':>8} {'p95':>8}"]
+        for name, stage in summary["stages"].items():
+            lines.append(f"  {name:<12} {stage['samples']:>8} {stage['wall_seconds']:8.2f}s {stage['cpu_seconds']:8.2f}s "
+                         f"{stage['p50_seconds']:7.3f}s {stage['p95_seconds']:7.3f}s")
+        for name, value in {**summary["counters"], **summary["gauges"]}.items():
+            lines.append(f"  {name}: {value:g}")
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Métricas da execução no formato de texto do Prometheus (ex.: para o textfile collector)."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Tempo de relógio por arquivo em cada etapa.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stage in summary["stages"].items():
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                             f'{stage[f"p{round(q * 100)}_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["wall_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["samples"]}')
+        lines += [
+            f"# HELP {prefix}_stage_cpu_seconds_total Tempo de CPU gasto em cada etapa.",
+            f"# TYPE {prefix}_stage_cpu_seconds_total counter",
+        ]
+        for name, stage in summary["stages"].items():
+            lines.append(f'{prefix}_stage_cpu_seconds_total{{stage="{name}"}} {stage["cpu_seconds"]:.6f}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        with self._lock:
+            gauges = sorted(self.gauges.items())
+        for (name, labels), value in gauges:
+            metric = f"{prefix}_{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} gauge")
+                declared.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+        lines.append(f"# TYPE {prefix}_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_run_timestamp_seconds {summary['started']:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, directory=METRICS_DIR):
+        """
+        Grava o relatório da execução: JSON (resumo e amostras), CSV (uma linha por amostra)
+        e metrics.prom (sobrescrito a cada execução, para coleta pelo Prometheus).
+
+        Returns:
+            dict: Caminhos dos arquivos gravados ({"json", "csv", "prometheus"}).
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+        paths = {
+            "json": os.path.join(directory, f"metrics_{stamp}.json"),
+            "csv": os.path.join(directory, f"metrics_{stamp}.csv"),
+            "prometheus": os.path.join(directory, "metrics.prom"),
+        }
+        with self._lock:
+            samples = list(self.samples)
+
+        with open(paths["json"], "w", encoding="utf-8") as f:
+            json.dump({**self.summary(), "samples": samples}, f, ensure_ascii=False, indent=2)
+
+        counter_names = sorted({name for sample in samples for name in sample["counters"]})
+        with open(paths["csv"], "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SAMPLE_FIELDS + tuple(counter_names))
+            for sample in samples:
+                writer.writerow([sample["stage"], sample["file"] or "", f"{sample['wall_seconds']:.6f}",
+                                 f"{sample['cpu_seconds']:.6f}"]
+                                + [f"{sample['counters'].get(name, 0):g}" for name in counter_names])
+
+        self.write_prometheus(directory)
+        return paths
+
+    def write_prometheus(self, directory=METRICS_DIR):
+        """Grava apenas metrics.prom (usado também pelo modo contínuo, a cada intervalo) e devolve o caminho."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "metrics.prom")
+        # Arquivo temporário renomeado ao final: o coletor nunca lê um arquivo pela metade
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+        return path
+
+
+# Métricas da execução atual, compartilhadas pelos módulos do pipeline
+recorder = MetricsRecorder()
+stage = recorder.stage
+timed = recorder.timed
+observe = recorder.observe
+increment = recorder.increment
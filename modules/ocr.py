@@ -1,17 +1,520 @@
- 
-import pytesseract
+import io
+import json
+import os
+import subprocess
+import threading
+from collections import namedtuple
 from PIL import Image
-from modules.config import TESSERACT_CMD
+from modules import preprocessing, metrics
+from modules.cache import make_key, ocr_cache
+from modules.config import (
+    TESSERACT_CMD, TESSERACT_LANG, TESSERACT_PSM, OCR_BACKEND,
+    PDF_EXTENSIONS, PDF_RENDER_DPI, PDF_TEXT_LAYER_MIN_CHARS, PREPROCESS_TARGET_DPI,
+    OCR_CONFIDENCE_ENABLED, OCR_FAST_DPI, OCR_FAST_LANG, OCR_MIN_CONFIDENCE, OCR_RETRY_PSM, OCR_PAGE_RETRY_RATIO,
+)
+
+# Separador de páginas na saída do Tesseract (um texto por imagem no modo em lote)
+PAGE_SEPARATOR = "\f"
+
+OCR_BACKENDS = ("auto", "tesserocr", "cli", "pytesseract")
+
+# Margem do recorte de cada linha relida, em fração da altura da linha
+LINE_PADDING = 0.3
+
+# Palavra reconhecida pelo Tesseract (image_to_data): texto, confiança (0 a 100), caixa na imagem
+# pré-processada e linha (página, bloco, parágrafo, linha)
+OcrWord = namedtuple("OcrWord", ["text", "confidence", "left", "top", "width", "height", "line"])
+
+# Resultado do OCR de uma imagem: texto e palavras que continuaram incertas (vazio fora de OCR_CONFIDENCE_ENABLED)
+OcrResult = namedtuple("OcrResult", ["text", "uncertain"])
+
+
+# pytesseract, tesserocr e pypdfium2 são importados no primeiro uso: quem só lista arquivos
+# (ex.: a expansão das páginas dos PDFs no processo principal) não paga por eles
+def _load_tesserocr():
+    try:
+        import tesserocr
+    except ImportError:  # Opcional: sem ele, o backend "auto" usa o executável do Tesseract
+        return None
+    return tesserocr
+
+
+def _open_pdf(pdf_path):
+    import pypdfium2 as pdfium
+    return pdfium.PdfDocument(pdf_path)
+
+
+class TesseractBackend:
+    """Interface dos backends de OCR: uma imagem ou uma lista de imagens PIL, já pré-processadas."""
+
+    name = None
+
+    def image_to_string(self, image):
+        raise NotImplementedError
+
+    def images_to_strings(self, images):
+        return [self.image_to_string(image) for image in images]
+
+    def image_to_data(self, image, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        """Saída TSV do Tesseract (uma linha por elemento reconhecido, com caixa e confiança)."""
+        raise NotImplementedError
+
+    def images_to_data(self, images, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        return [self.image_to_data(image, lang, psm) for image in images]
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend(TesseractBackend):
+    """API do Tesseract no próprio processo: o modelo do idioma é carregado uma única vez por worker."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        self.api = _load_tesserocr().PyTessBaseAPI(lang=TESSERACT_LANG, psm=TESSERACT_PSM)
+        self.apis = {TESSERACT_LANG: self.api}  # Outros modelos (ex.: OCR_FAST_LANG) são carregados no primeiro uso
+
+    def image_to_string(self, image):
+        self.api.SetImage(image)
+        return self.api.GetUTF8Text().strip()
+
+    def image_to_data(self, image, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        api = self.apis.get(lang)
+        if api is None:
+            api = self.apis[lang] = _load_tesserocr().PyTessBaseAPI(lang=lang, psm=TESSERACT_PSM)
+        api.SetPageSegMode(psm)
+        try:
+            api.SetImage(image)
+            return api.GetTSVText(0)
+        finally:
+            api.SetPageSegMode(TESSERACT_PSM)
+
+    def close(self):
+        for api in self.apis.values():
+            api.End()
+
+
+class CliBackend(TesseractBackend):
+    """
+    Executável do Tesseract recebendo as imagens pela entrada padrão, sem arquivos temporários.
+
+    Em lote, as imagens são enviadas como um único TIFF de várias páginas: um só processo
+    (e uma só carga do modelo do idioma) para todas elas.
+    """
+
+    name = "cli"
+
+    def _run(self, image_bytes, lang=TESSERACT_LANG, psm=TESSERACT_PSM, output=()):
+        command = [TESSERACT_CMD, "stdin", "stdout", "-l", lang, "--psm", str(psm),
+                   "-c", f"page_separator={PAGE_SEPARATOR}", *output]
+        completed = subprocess.run(command, input=image_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Tesseract terminou com código {completed.returncode}: "
+                               f"{completed.stderr.decode('utf-8', 'replace').strip()}")
+        return completed.stdout.decode("utf-8")
+
+    def image_to_string(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return self._run(buffer.getvalue()).replace(PAGE_SEPARATOR, "").strip()
+
+    def images_to_strings(self, images):
+        if len(images) < 2:
+            return super().images_to_strings(images)
+        buffer = io.BytesIO()
+        images[0].save(buffer, format="TIFF", save_all=True, append_images=images[1:])
+        pages = self._run(buffer.getvalue()).split(PAGE_SEPARATOR)
+        if len(pages) != len(images) + 1:
+            # Saída inesperada: refaz uma imagem por vez para não atribuir textos à imagem errada
+            return super().images_to_strings(images)
+        return [page.strip() for page in pages[:-1]]
+
+    def image_to_data(self, image, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return self._run(buffer.getvalue(), lang, psm, output=("tsv",))
+
+    def images_to_data(self, images, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        # Um TIFF de várias páginas e um só processo; as linhas do TSV são separadas pela coluna page_num
+        if len(images) < 2:
+            return super().images_to_data(images, lang, psm)
+        buffer = io.BytesIO()
+        images[0].save(buffer, format="TIFF", save_all=True, append_images=images[1:])
+        pages = [[] for _ in images]
+        for row in self._run(buffer.getvalue(), lang, psm, output=("tsv",)).splitlines():
+            columns = row.split("\t")
+            if len(columns) < 12 or not columns[1].isdigit():
+                continue  # Cabeçalho
+            if not 1 <= int(columns[1]) <= len(images):
+                return super().images_to_data(images, lang, psm)
+            pages[int(columns[1]) - 1].append(row)
+        return ["\n".join(rows) for rows in pages]
+
+
+class PytesseractBackend(TesseractBackend):
+    """Comportamento original: pytesseract, com um processo e arquivos temporários por imagem."""
+
+    name = "pytesseract"
+
+    def __init__(self):
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        self.pytesseract = pytesseract
+
+    def image_to_string(self, image):
+        return self.pytesseract.image_to_string(image, lang=TESSERACT_LANG, config=f"--psm {TESSERACT_PSM}").strip()
+
+    def image_to_data(self, image, lang=TESSERACT_LANG, psm=TESSERACT_PSM):
+        return self.pytesseract.image_to_data(image, lang=lang, config=f"--psm {psm}")
+
+
+def create_backend(name=OCR_BACKEND):
+    """Cria o backend de OCR configurado ("auto" usa tesserocr quando instalado, senão o executável)."""
+    tesserocr = _load_tesserocr() if name in ("auto", "tesserocr") else None
+    if name == "auto":
+        name = "tesserocr" if tesserocr is not None else "cli"
+    if name == "tesserocr":
+        if tesserocr is None:
+            raise RuntimeError("OCR_BACKEND=tesserocr, mas o pacote tesserocr não está instalado.")
+        return TesserocrBackend()
+    if name == "cli":
+        return CliBackend()
+    if name == "pytesseract":
+        return PytesseractBackend()
+    raise ValueError(f"OCR_BACKEND inválido: {name} (use {', '.join(OCR_BACKENDS)})")
+
+
+# Um backend por thread de cada processo: os handles do tesserocr não podem ser compartilhados
+_local = threading.local()
+
+
+def get_backend():
+    """Retorna o backend de OCR da thread atual, criando-o (e carregando o modelo) na primeira chamada."""
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.backend = create_backend()
+        _local.pid = os.getpid()
+    return _local.backend
+
+
+def init_worker():
+    """Inicializador dos processos do pool de OCR: carrega o backend antes da primeira imagem."""
+    try:
+        get_backend()
+    except Exception as e:
+        print(f"Erro ao iniciar o backend de OCR: {str(e)}")
+
+
+def is_pdf(path):
+    """Indica se o arquivo deve ser tratado como PDF."""
+    return path.lower().endswith(PDF_EXTENSIONS)
+
+
+def parse_tsv(tsv, scale=1.0, offset=(0, 0)):
+    """
+    Lê a saída TSV do Tesseract (image_to_data) e devolve as palavras reconhecidas, em ordem de leitura.
+
+    Args:
+        tsv (str): Saída do Tesseract, com ou sem a linha de cabeçalho.
+        scale (float): Escala da imagem lida em relação à imagem de referência; as caixas são convertidas para ela.
+        offset (tuple): Posição (x, y) da imagem lida dentro da imagem de referência (recorte de uma linha).
+    """
+    words = []
+    for row in tsv.splitlines():
+        columns = row.split("\t")
+        if len(columns) < 12 or columns[0] != "5" or not columns[11].strip():
+            continue  # Apenas o nível 5 (palavra); o cabeçalho e os níveis de página, bloco e linha são ignorados
+        left, top, width, height = (int(value) / scale for value in columns[6:10])
+        words.append(OcrWord(columns[11].strip(), float(columns[10]), offset[0] + left, offset[1] + top,
+                             width, height, tuple(int(value) for value in columns[1:5])))
+    return words
+
+
+def words_to_text(words):
+    """Monta o texto a partir das palavras: uma linha do Tesseract por linha e blocos separados por uma linha em branco."""
+    parts, last_line = [], None
+    for word in words:
+        if word.line == last_line:
+            parts.append(" ")
+        elif last_line is not None:
+            parts.append("\n\n" if word.line[:2] != last_line[:2] else "\n")
+        last_line = word.line
+        parts.append(word.text)
+    return "".join(parts)
+
+
+def _mean_confidence(words):
+    return sum(word.confidence for word in words) / len(words) if words else -1.0
+
+
+def _retry_weak_lines(backend, image, words):
+    # Relê na resolução completa, com OCR_RETRY_PSM, cada linha que tem palavras abaixo de OCR_MIN_CONFIDENCE
+    # (todas de uma vez); a nova leitura só substitui a linha se a confiança média aumentar
+    lines = {}
+    for word in words:
+        lines.setdefault(word.line, []).append(word)
+    weak = {line: line_words for line, line_words in lines.items()
+            if min(word.confidence for word in line_words) < OCR_MIN_CONFIDENCE}
+    boxes = []
+    for line_words in weak.values():
+        left, top = min(word.left for word in line_words), min(word.top for word in line_words)
+        right = max(word.left + word.width for word in line_words)
+        bottom = max(word.top + word.height for word in line_words)
+        padding = (bottom - top) * LINE_PADDING
+        boxes.append((max(0, int(left - padding)), max(0, int(top - padding)),
+                      min(image.width, int(right + padding) + 1), min(image.height, int(bottom + padding) + 1)))
+
+    metrics.increment("ocr_line_retries", len(boxes))
+    try:
+        outputs = backend.images_to_data([image.crop(box) for box in boxes], psm=OCR_RETRY_PSM)
+    except Exception as e:
+        print(f"Erro ao reler as linhas incertas, mantendo a passagem rápida: {str(e)}")
+        return words
+
+    replaced = {}
+    for (line, line_words), box, tsv in zip(weak.items(), boxes, outputs):
+        retried = parse_tsv(tsv, offset=box[:2])
+        if retried and _mean_confidence(retried) > _mean_confidence(line_words):
+            replaced[line] = [word._replace(line=line) for word in retried]
+    result = []
+    for line, line_words in lines.items():
+        result.extend(replaced.get(line, line_words))
+    return result
+
+
+def recognize_with_confidence(image, backend=None):
+    """
+    OCR com confiança por palavra (image_to_data) de uma imagem já pré-processada.
+
+    Uma passagem rápida lê a página em OCR_FAST_DPI (e com OCR_FAST_LANG); apenas as linhas com
+    palavras abaixo de OCR_MIN_CONFIDENCE são relidas na resolução completa. Se a passagem rápida
+    for ruim como um todo (mais de OCR_PAGE_RETRY_RATIO das palavras incertas), a página inteira é
+    relida na resolução completa, como no OCR sem confiança.
+
+    Returns:
+        OcrResult: Texto e palavras que continuaram incertas, para o refinamento conferir.
+    """
+    backend = backend or get_backend()
+    scale = min(1.0, OCR_FAST_DPI / PREPROCESS_TARGET_DPI)
+    fast_image = image
+    if scale < 1:
+        fast_image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                  Image.BILINEAR)
+    words = parse_tsv(backend.image_to_data(fast_image, OCR_FAST_LANG), scale)
+
+    weak = [word for word in words if word.confidence < OCR_MIN_CONFIDENCE]
+    fast_pass = scale < 1 or OCR_FAST_LANG != TESSERACT_LANG
+    if fast_pass and (not words or len(weak) > OCR_PAGE_RETRY_RATIO * len(words)):
+        metrics.increment("ocr_page_retries")
+        words = parse_tsv(backend.image_to_data(image)) or words
+    elif weak:
+        words = _retry_weak_lines(backend, image, words)
+
+    uncertain = list(dict.fromkeys(word.text for word in words
+                                   if word.confidence < OCR_MIN_CONFIDENCE and any(char.isalnum() for char in word.text)))
+    metrics.increment("ocr_uncertain_words", len(uncertain))
+    return OcrResult(words_to_text(words), uncertain)
+
+
+def _recognize(image):
+    # OCR de uma imagem já pré-processada, com ou sem as confianças por palavra
+    if OCR_CONFIDENCE_ENABLED:
+        return recognize_with_confidence(image)
+    return OcrResult(get_backend().image_to_string(image), [])
+
+
+def _run_tesseract(image):
+    return _recognize(preprocessing.preprocess(image))
+
+
+def settings_key():
+    """Configurações que determinam o texto do OCR (Tesseract, pré-processamento e, no modo com confiança, a nova leitura)."""
+    settings = (TESSERACT_LANG, TESSERACT_PSM, preprocessing.settings_key())
+    if OCR_CONFIDENCE_ENABLED:
+        settings += ("confidence", OCR_FAST_DPI, OCR_FAST_LANG, OCR_MIN_CONFIDENCE, OCR_RETRY_PSM, OCR_PAGE_RETRY_RATIO)
+    return settings
+
+
+def _image_cache_key(image_bytes):
+    # Chave: bytes da imagem + configurações do OCR
+    return make_key(image_bytes, *settings_key())
+
+
+def _cached_result(cache_key):
+    # No modo com confiança, o cache guarda [texto, palavras incertas] em JSON; fora dele, só o texto
+    cached = ocr_cache.get(cache_key)
+    if cached is None:
+        return None
+    if not OCR_CONFIDENCE_ENABLED:
+        return OcrResult(cached, [])
+    text, uncertain = json.loads(cached)
+    return OcrResult(text, uncertain)
+
+
+def _cache_result(cache_key, result):
+    ocr_cache.set(cache_key, json.dumps(list(result), ensure_ascii=False) if OCR_CONFIDENCE_ENABLED else result.text)
 
-# Configuração do Tesseract
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 
 def extract_text_from_image(image_path):
-    """Extrai texto de uma imagem usando Tesseract OCR."""
+    """Extrai texto de uma imagem usando Tesseract OCR (com cache por conteúdo da imagem)."""
+    return extract_result_from_image(image_path).text
+
+
+def extract_result_from_image(image_path):
+    """Como extract_text_from_image, devolvendo um OcrResult (texto e palavras incertas)."""
+    if is_pdf(image_path):
+        results = [result for _, result in _iter_pdf_results(image_path) if result.text]
+        return OcrResult("\n\n".join(result.text for result in results),
+                         [word for result in results for word in result.uncertain])
+    return extract_results_from_images([image_path])[0]
+
+
+def extract_texts_from_images(image_paths):
+    """
+    Extrai o texto de várias imagens com uma única chamada ao backend de OCR (no backend "cli",
+    um só processo do Tesseract para todas). Imagens já presentes no cache não são reprocessadas.
+
+    Returns:
+        list: Um texto por imagem, na mesma ordem; "" para imagens que não puderam ser lidas.
+    """
+    return [result.text for result in extract_results_from_images(image_paths)]
+
+
+def extract_results_from_images(image_paths):
+    """
+    Como extract_texts_from_images, devolvendo um OcrResult por imagem. Com OCR_CONFIDENCE_ENABLED,
+    cada imagem passa por recognize_with_confidence (sem o agrupamento das imagens em uma chamada).
+    """
+    results = [OcrResult("", [])] * len(image_paths)
+    to_ocr = []  # (posição, caminho, chave do cache, imagem pré-processada)
+    for position, image_path in enumerate(image_paths):
+        try:
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+            cache_key = _image_cache_key(image_bytes)
+            cached = _cached_result(cache_key)
+            if cached is not None:
+                results[position] = cached
+                continue
+            image = preprocessing.preprocess(Image.open(io.BytesIO(image_bytes)))
+            to_ocr.append((position, image_path, cache_key, image))
+        except Exception as e:
+            print(f"Erro ao processar {image_path}: {str(e)}")
+
+    if not to_ocr:
+        return results
+
+    outputs = [None] * len(to_ocr)
+    if not OCR_CONFIDENCE_ENABLED:
+        try:
+            outputs = [OcrResult(text, []) for text in get_backend().images_to_strings([image for _, _, _, image in to_ocr])]
+        except Exception as e:
+            if len(to_ocr) > 1:
+                print(f"Erro no OCR em lote ({len(to_ocr)} imagens), processando individualmente: {str(e)}")
+
+    for (position, image_path, cache_key, image), result in zip(to_ocr, outputs):
+        try:
+            if result is None:
+                result = _recognize(image)
+            _cache_result(cache_key, result)
+            results[position] = result
+        except Exception as e:
+            print(f"Erro ao processar {image_path}: {str(e)}")
+    return results
+
+
+def count_pdf_pages(pdf_path):
+    """Retorna o número de páginas de um PDF sem carregar seu conteúdo."""
+    pdf = _open_pdf(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _extract_page_result(pdf, page_index, pdf_hash):
+    page = pdf[page_index]
+    try:
+        # Páginas com camada de texto dispensam o OCR
+        textpage = page.get_textpage()
+        try:
+            embedded_text = textpage.get_text_bounded().strip()
+        finally:
+            textpage.close()
+        if len(embedded_text) >= PDF_TEXT_LAYER_MIN_CHARS:
+            return OcrResult(embedded_text, [])
+
+        cache_key = make_key(pdf_hash, page_index, PDF_RENDER_DPI, *settings_key()) if pdf_hash else None
+        if cache_key:
+            cached = _cached_result(cache_key)
+            if cached is not None:
+                return cached
+
+        # Rasteriza somente esta página e libera a imagem logo após o OCR
+        bitmap = page.render(scale=PDF_RENDER_DPI / 72)
+        try:
+            image = bitmap.to_pil()
+            image.info["dpi"] = (PDF_RENDER_DPI, PDF_RENDER_DPI)  # Referência para a redução de resolução
+            result = _run_tesseract(image)
+            image.close()
+        finally:
+            bitmap.close()
+
+        if cache_key:
+            _cache_result(cache_key, result)
+        return result
+    finally:
+        page.close()
+
+
+def extract_text_from_pdf_page(pdf_path, page_index, pdf_hash=None):
+    """
+    Extrai o texto de uma única página de um PDF.
+
+    Args:
+        pdf_path (str): Caminho do PDF.
+        page_index (int): Índice da página (a partir de 0).
+        pdf_hash (str): Hash do conteúdo do PDF; quando informado, o OCR da página usa o cache.
+    """
+    return extract_result_from_pdf_page(pdf_path, page_index, pdf_hash).text
+
+
+def extract_result_from_pdf_page(pdf_path, page_index, pdf_hash=None):
+    """Como extract_text_from_pdf_page, devolvendo um OcrResult (texto e palavras incertas)."""
+    try:
+        pdf = _open_pdf(pdf_path)
+        try:
+            return _extract_page_result(pdf, page_index, pdf_hash)
+        finally:
+            pdf.close()
+    except Exception as e:
+        print(f"Erro ao processar a página {page_index + 1} de {pdf_path}: {str(e)}")
+        return OcrResult("", [])
+
+
+def iter_pdf_pages(pdf_path, pdf_hash=None):
+    """
+    Percorre um PDF página a página, gerando (índice_da_página, texto).
+
+    Apenas uma página fica rasterizada na memória por vez; páginas que já
+    possuem camada de texto não passam pelo OCR.
+    """
+    for page_index, result in _iter_pdf_results(pdf_path, pdf_hash):
+        yield page_index, result.text
+
+
+def _iter_pdf_results(pdf_path, pdf_hash=None):
     try:
-        image = Image.open(image_path)
-        text = pytesseract.image_to_string(image, lang='por')
-        return text.strip()
+        pdf = _open_pdf(pdf_path)
     except Exception as e:
-        print(f"Erro ao processar {image_path}: {str(e)}")
-        return ""
\ No newline at end of file
+        print(f"Erro ao abrir {pdf_path}: {str(e)}")
+        return
+    try:
+        for page_index in range(len(pdf)):
+            try:
+                yield page_index, _extract_page_result(pdf, page_index, pdf_hash)
+            except Exception as e:
+                print(f"Erro ao processar a página {page_index + 1} de {pdf_path}: {str(e)}")
+                yield page_index, OcrResult("", [])
+    finally:
+        pdf.close()
@@ -0,0 +1,221 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from modules import metrics
+from modules.config import (
+    get_settings, OPENAI_BASE_URL, OPENAI_TIMEOUT, OPENAI_MAX_RETRIES,
+    OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, OPENAI_MAX_CONNECTIONS,
+)
+
+# Status HTTP que justificam uma nova tentativa
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Espera da retentativa: base * 2^tentativa, com jitter, limitada a BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Tokens de resposta reservados no limite de TPM quando max_tokens não é informado
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class OpenAIRequestError(Exception):
+    """Falha definitiva de uma chamada à API (erro não recuperável ou tentativas esgotadas)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Balde de tokens com reposição contínua, para limites por minuto (requisições ou tokens)."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Aguarda até haver saldo e consome a quantidade pedida."""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta):
+        """Corrige o saldo depois que o consumo real é conhecido (delta positivo consome mais)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def _retry_after(response):
+    """Lê o tempo de espera sugerido pela API (retry-after-ms ou Retry-After), em segundos."""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def _backoff(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class AsyncChatClient:
+    """
+    Cliente assíncrono do endpoint /chat/completions com conexões HTTP reutilizadas,
+    limites de requisições e tokens por minuto e retentativas com backoff exponencial.
+    """
+
+    def __init__(self, api_key=None, base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT,
+                 max_retries=OPENAI_MAX_RETRIES, rpm_limit=OPENAI_RPM_LIMIT, tpm_limit=OPENAI_TPM_LIMIT,
+                 max_connections=OPENAI_MAX_CONNECTIONS):
+        # A chave só é exigida aqui, quando o refinamento realmente vai chamar a API
+        self.api_key = api_key or get_settings().require_openai_api_key()
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.requests_bucket = TokenBucket(rpm_limit)
+        self.tokens_bucket = TokenBucket(tpm_limit)
+        self._http = None
+
+    def _client(self):
+        # Criado sob demanda, dentro do loop de eventos que fará as chamadas
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def chat(self, messages, model, temperature, stats=None, **options):
+        """
+        Envia uma conversa ao modelo e devolve o conteúdo da resposta.
+
+        Se stats (dict) for informado, recebe "usage" (tokens informados pela API) e "retries".
+        Levanta OpenAIRequestError em erros não recuperáveis ou quando as tentativas se esgotam.
+        """
+        import httpx
+        payload = {"model": model, "messages": messages, "temperature": temperature, **options}
+        estimated_tokens = (sum(len(message["content"]) for message in messages) // 4
+                            + options.get("max_tokens", DEFAULT_COMPLETION_TOKENS))
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self.requests_bucket.acquire(1)
+            await self.tokens_bucket.acquire(estimated_tokens)
+
+            wait = None
+            start = time.perf_counter()
+            try:
+                response = await self._client().post("/chat/completions", json=payload)
+            except httpx.TransportError as e:
+                last_error = OpenAIRequestError(f"Erro de conexão com a API: {str(e)}")
+            else:
+                if response.status_code == 200:
+                    # Corpo truncado ou sem a mensagem (ex.: proxy no caminho): tratado como falha recuperável
+                    try:
+                        data = response.json()
+                        content = data["choices"][0]["message"]["content"]
+                        usage = data.get("usage") or {}
+                    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                        last_error = OpenAIRequestError(f"Resposta inválida da API: {response.text[:200]}",
+                                                        response.status_code)
+                    else:
+                        if stats is not None:
+                            stats["usage"] = usage
+                        if usage.get("total_tokens"):
+                            self.tokens_bucket.adjust(usage["total_tokens"] - estimated_tokens)
+                        return content
+                else:
+                    last_error = OpenAIRequestError(
+                        f"Erro {response.status_code} da API: {response.text[:200]}", response.status_code
+                    )
+                    if response.status_code not in RETRYABLE_STATUS:
+                        break
+                    wait = _retry_after(response)
+            finally:
+                # Uma amostra por tentativa, sem as esperas dos limites de taxa e das retentativas
+                metrics.observe("gpt_call", time.perf_counter() - start)
+
+            if attempt < self.max_retries:
+                if stats is not None:
+                    stats["retries"] = stats.get("retries", 0) + 1
+                await asyncio.sleep(wait if wait is not None else _backoff(attempt))
+
+        raise last_error
+
+
+# Loop de eventos dedicado, compartilhado pelas threads do pipeline
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """Retorna o cliente compartilhado, iniciando o loop de eventos em segundo plano na primeira chamada."""
+    global _loop, _client
+    with _lock:
+        if _client is None:
+            try:
+                client = AsyncChatClient()
+            except ValueError as e:  # Chave da API ausente
+                raise OpenAIRequestError(str(e))
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="openai-client", daemon=True).start()
+            _client = client
+        return _client
+
+
+def chat(messages, model, temperature, **options):
+    """
+    Versão bloqueante de AsyncChatClient.chat, para ser chamada de threads comuns.
+    Tokens, retentativas e falhas são registrados nas métricas da etapa em andamento na thread.
+    """
+    client = get_client()
+    stats = {}
+    future = asyncio.run_coroutine_threadsafe(client.chat(messages, model, temperature, stats=stats, **options), _loop)
+    try:
+        return future.result()
+    except OpenAIRequestError:
+        metrics.increment("gpt_errors")
+        raise
+    finally:
+        usage = stats.get("usage") or {}
+        metrics.increment("gpt_requests")
+        metrics.increment("gpt_retries", stats.get("retries", 0))
+        metrics.increment("gpt_prompt_tokens", usage.get("prompt_tokens", 0))
+        metrics.increment("gpt_completion_tokens", usage.get("completion_tokens", 0))
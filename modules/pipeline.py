@@ -0,0 +1,353 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from modules import ocr, gpt_refinement, field_extractor, dedup, metrics, schema
+from modules.config import (
+    OCR_WORKERS, OCR_BATCH_SIZE, GPT_WORKERS, GPT_BATCH_MAX_DOCS, GPT_BATCH_TOKEN_BUDGET,
+    LOCAL_EXTRACTION_ENABLED, REQUIRED_FIELDS, DEDUP_ENABLED,
+)
+from modules.manifest import DONE, FAILED, file_sha256
+
+
+def expand_inputs(paths):
+    """
+    Converte os arquivos de entrada em unidades de processamento.
+
+    Imagens viram uma unidade cada; PDFs viram uma unidade por página, identificada
+    como "arquivo.pdf#pN", para que cada página siga sozinha pelo OCR e pelo refinamento.
+
+    Returns:
+        list: tuplas (id_da_unidade, caminho, índice_da_página ou None, hash do PDF ou None).
+    """
+    units = []
+    for path in paths:
+        if not ocr.is_pdf(path):
+            units.append((path, path, None, None))
+            continue
+        try:
+            pdf_hash = file_sha256(path)
+            page_count = ocr.count_pdf_pages(path)
+        except Exception as e:
+            print(f"Erro ao abrir {path}: {str(e)}")
+            units.append((path, path, None, None))  # Falhará no OCR e será reportado
+            continue
+        for page_index in range(page_count):
+            units.append((f"{path}#p{page_index + 1}", path, page_index, pdf_hash))
+    return units
+
+
+def plan_ocr_tasks(units, batch_size=OCR_BATCH_SIZE):
+    """Agrupa imagens em lotes de até batch_size por tarefa de OCR; páginas de PDF seguem uma por tarefa."""
+    tasks, images = [], []
+    for unit in units:
+        if unit[2] is not None:
+            tasks.append([unit])
+            continue
+        images.append(unit)
+        if len(images) >= max(1, batch_size):
+            tasks.append(images)
+            images = []
+    if images:
+        tasks.append(images)
+    return tasks
+
+
+def find_duplicates(units, index):
+    """
+    Procura, antes do OCR, imagens iguais ou quase idênticas (pHash) a uma imagem já processada
+    em outra execução ou a uma imagem anterior do mesmo lote. Páginas de PDF não são verificadas.
+
+    Returns:
+        tuple: ({id: Fingerprint} das imagens verificadas, {id: resultado encontrado no índice},
+            {id_da_duplicata: id_da_imagem_original} dentro do lote).
+    """
+    with metrics.stage("dedup"):
+        fingerprints = dedup.fingerprint_images([unit[0] for unit in units if unit[2] is None])
+        fingerprints = {unit_id: print_ for unit_id, print_ in fingerprints.items() if print_ is not None}
+        known = {}
+        for unit_id, print_ in fingerprints.items():
+            match = index.find(print_)
+            if match is not None:
+                known[unit_id] = match
+        in_batch = dedup.group_duplicates(
+            {unit_id: print_ for unit_id, print_ in fingerprints.items() if unit_id not in known}, index.max_distance
+        )
+    return fingerprints, known, in_batch
+
+
+def _init_ocr_worker():
+    ocr.init_worker()
+    metrics.recorder.reset()  # Amostras herdadas do processo principal (fork) não são devolvidas de novo
+
+
+def _ocr_task(units):
+    """
+    Executa o OCR de uma tarefa (uma página de PDF ou um lote de imagens) dentro de um processo do pool.
+
+    Returns:
+        tuple: ({id_da_unidade: OcrResult}, segundos por unidade, métricas coletadas no processo).
+    """
+    start = time.perf_counter()
+    _, path, page_index, pdf_hash = units[0]
+    with metrics.stage("ocr", [unit[0] for unit in units]):
+        if page_index is not None:
+            results = [ocr.extract_result_from_pdf_page(path, page_index, pdf_hash)]
+        elif len(units) == 1:
+            results = [ocr.extract_result_from_image(path)]
+        else:
+            results = ocr.extract_results_from_images([unit[1] for unit in units])
+    seconds = (time.perf_counter() - start) / len(units)
+    return {unit[0]: result for unit, result in zip(units, results)}, seconds, metrics.recorder.drain()
+
+
+def _gpt_task(items):
+    """
+    Executa o refinamento de um lote de (id, texto, campos, campos_locais, palavras_incertas) dentro
+    de uma thread do pool.
+    """
+    start = time.perf_counter()
+    with metrics.stage("refine", [item[0] for item in items]):
+        if len(items) == 1:
+            unit_id, raw_text, fields, _, uncertain = items[0]
+            refined = {unit_id: gpt_refinement.refine_text_with_gpt(raw_text, fields, uncertain)}
+        else:
+            texts = {unit_id: raw_text for unit_id, raw_text, _, _, _ in items}
+            fields = {unit_id: fields for unit_id, _, fields, _, _ in items}
+            uncertain = {unit_id: uncertain for unit_id, _, _, _, uncertain in items}
+            refined = gpt_refinement.refine_texts_with_gpt_batch(texts, fields, uncertain)
+
+    # Os campos extraídos localmente completam (e prevalecem sobre) a resposta do modelo
+    for unit_id, _, _, local_fields, _ in items:
+        refined[unit_id] = field_extractor.merge_into_refined(refined.get(unit_id, ""), local_fields)
+    return refined, time.perf_counter() - start, None  # Métricas já registradas neste processo
+
+
+def process_batch(image_paths, on_result=None, on_error=None, manifest=None, resume=False,
+                  on_progress=None, cancel_event=None):
+    """
+    Processa um lote de imagens em pipeline: o OCR roda em um pool de processos
+    (Tesseract é limitado por CPU) e cada texto extraído segue imediatamente para
+    um pool limitado de threads que faz as chamadas ao GPT.
+
+    Os textos são agrupados em lotes de até GPT_BATCH_MAX_DOCS documentos (limitados por
+    GPT_BATCH_TOKEN_BUDGET) por requisição. Um lote parcial é enviado assim que o OCR termina
+    ou quando nenhuma requisição está em andamento, para não deixar a API ociosa.
+
+    Antes do GPT, CPF, CEP, datas, RG e nome são extraídos localmente por expressões
+    regulares e o prompt pede somente os campos faltantes; a API só deixa de ser chamada
+    se todos os REQUIRED_FIELDS (por padrão, todos os campos do schema) forem reconhecidos.
+
+    PDFs são processados página a página; cada página gera seu próprio resultado,
+    identificado como "arquivo.pdf#pN".
+
+    Com OCR_CONFIDENCE_ENABLED, as palavras que o OCR leu com baixa confiança seguem para o
+    prompt, para que o modelo as confira (ver ocr.recognize_with_confidence).
+
+    Com DEDUP_ENABLED, imagens iguais ou quase idênticas a uma imagem já processada (índice
+    persistente de pHashes) ou a outra imagem do lote não passam pelo OCR nem pela API: recebem
+    o resultado da original assim que ele estiver disponível.
+
+    Cada processo do pool de OCR mantém seu backend (OCR_BACKEND) carregado durante todo o lote;
+    com OCR_BATCH_SIZE > 1, as imagens são enviadas ao backend em lotes.
+
+    O tempo de cada etapa por documento (OCR, refinamento e gravação), os tokens, os acertos
+    de cache e as retentativas são registrados em metrics.recorder; os processos de OCR
+    devolvem suas métricas junto com os textos.
+
+    Args:
+        image_paths (list): Caminhos das imagens (ou PDFs) a processar.
+        on_result (callable): Chamado com (arquivo, texto_bruto, texto_refinado) assim que cada refinamento
+            termina; é a etapa de persistência (armazenamento de dados).
+        on_error (callable): Chamado com (caminho, mensagem) quando uma imagem não pôde ser processada.
+        manifest (JobManifest): Registro opcional do estado de cada arquivo por etapa.
+        resume (bool): Com um manifest, pula as etapas já concluídas e refaz apenas as pendentes ou com falha.
+        on_progress (callable): Chamado com (concluídos, total, id_da_unidade) sempre que um documento
+            termina, com sucesso ou erro.
+        cancel_event (threading.Event): Quando sinalizado, nenhuma tarefa nova é iniciada, as que ainda
+            aguardam na fila são canceladas e os resultados já entregues são devolvidos. Documentos
+            interrompidos ficam pendentes no manifest.
+
+    Returns:
+        dict: {arquivo: (texto_bruto, texto_refinado)}, na ordem de entrada, no formato usado por save_text_to_excel.
+    """
+    results = {}
+    if not image_paths:
+        return results
+    stats = field_extractor.ExtractionStats(REQUIRED_FIELDS)
+    completed = 0
+    index, fingerprints = None, {}
+    copies = {}  # id da imagem original -> ids das suas duplicatas no lote, que aguardam o resultado dela
+
+    def report_progress(unit_id):
+        nonlocal completed
+        completed += 1
+        if on_progress:
+            on_progress(completed, len(units), unit_id)
+
+    def fail(image_path, stage, message, seconds=None):
+        if manifest is not None:
+            manifest.mark(image_path, stage, FAILED, seconds=seconds, error=message)
+        if on_error:
+            on_error(image_path, message)
+        report_progress(image_path)
+        for copy_id in copies.pop(image_path, []):
+            fail(copy_id, stage, f"{message} (duplicata de {os.path.basename(image_path)})")
+
+    def reuse(unit_id, raw_text, refined_text):
+        # Resultado de uma imagem igual ou quase idêntica, sem OCR nem API
+        if manifest is not None:
+            manifest.mark(unit_id, "ocr", DONE, seconds=0.0, raw_text=raw_text)
+            manifest.mark(unit_id, "refine", DONE, seconds=0.0, refined_text=refined_text)
+        emit(unit_id, raw_text, refined_text)
+
+    def emit(image_path, raw_text, refined_text):
+        file_name = os.path.basename(image_path)
+        results[image_path] = (file_name, raw_text, refined_text)
+        if index is not None and image_path in fingerprints:
+            index.add(fingerprints[image_path], image_path, raw_text, refined_text)
+        for copy_id in copies.pop(image_path, []):
+            metrics.increment("duplicates", source="batch")
+            reuse(copy_id, raw_text, refined_text)
+        if manifest is not None and resume and manifest.is_done(image_path, "excel"):
+            report_progress(image_path)
+            return  # Já persistido em uma execução anterior
+        start = time.perf_counter()
+        try:
+            if on_result:
+                with metrics.stage("save", image_path):
+                    on_result(file_name, raw_text, refined_text)
+        except Exception as e:
+            fail(image_path, "excel", f"Erro ao salvar o resultado de {file_name}: {str(e)}",
+                 seconds=time.perf_counter() - start)
+            return
+        if manifest is not None:
+            manifest.mark(image_path, "excel", DONE, seconds=time.perf_counter() - start)
+        report_progress(image_path)
+
+    # Decide, para cada unidade, por qual etapa começar
+    units = expand_inputs(image_paths)
+    to_ocr, to_refine = [], []
+    for unit in units:
+        unit_id, _, _, pdf_hash = unit
+        record = manifest.register(unit_id, reset=not resume, sha256=pdf_hash) if manifest is not None else None
+        if record is not None and resume and record["refine_status"] == DONE:
+            emit(unit_id, record["raw_text"], record["refined_text"])
+        elif record is not None and resume and record["ocr_status"] == DONE:
+            to_refine.append((unit_id, record["raw_text"]))
+        else:
+            to_ocr.append(unit)
+
+    # Duplicatas de imagens já processadas são resolvidas agora; as de outra imagem do lote, quando ela terminar
+    if DEDUP_ENABLED and to_ocr:
+        index = dedup.DuplicateIndex()
+        fingerprints, known, in_batch = find_duplicates(to_ocr, index)
+        for copy_id, original_id in in_batch.items():
+            copies.setdefault(original_id, []).append(copy_id)
+        to_ocr = [unit for unit in to_ocr if unit[0] not in known and unit[0] not in in_batch]
+        for unit_id, match in known.items():
+            metrics.increment("duplicates", source="index")
+            reuse(unit_id, match["raw_text"], match["refined_text"])
+        if known or in_batch:
+            print(f"Duplicatas sem OCR: {len(known)} de imagens já processadas, {len(in_batch)} dentro do lote.")
+
+    ocr_workers = max(1, min(OCR_WORKERS, len(to_ocr)))
+    gpt_workers = max(1, GPT_WORKERS)
+
+    # Cada processo do pool mantém seu backend de OCR (e o modelo do idioma) carregado durante todo o lote
+    with ProcessPoolExecutor(max_workers=ocr_workers, initializer=_init_ocr_worker) as ocr_pool, \
+            ThreadPoolExecutor(max_workers=gpt_workers) as gpt_pool:
+        # Cada futuro pendente é mapeado para (etapa, carga): unidades da tarefa no OCR,
+        # lista de (id, texto_bruto, campos, campos_locais, palavras_incertas) no refinamento
+        pending = {ocr_pool.submit(_ocr_task, task): ("ocr", task) for task in plan_ocr_tasks(to_ocr)}
+        batch = []
+
+        def flush_batch():
+            nonlocal batch
+            if batch:
+                pending[gpt_pool.submit(_gpt_task, batch)] = ("refine", batch)
+                batch = []
+
+        def queue_refinement(unit_id, raw_text, uncertain=()):
+            local_fields = field_extractor.extract_fields(raw_text) if LOCAL_EXTRACTION_ENABLED else {}
+            found_all = LOCAL_EXTRACTION_ENABLED and all(field in local_fields for field in REQUIRED_FIELDS)
+            stats.record(found_all, bool(local_fields))
+            if found_all:
+                # Todos os campos obrigatórios reconhecidos localmente: sem chamada à API
+                refined_text = field_extractor.to_refined_json(local_fields)
+                if manifest is not None:
+                    manifest.mark(unit_id, "refine", DONE, seconds=0.0, refined_text=refined_text)
+                emit(unit_id, raw_text, refined_text)
+                return
+
+            missing = None
+            if local_fields:
+                missing = [name for name in schema.PROMPT_KEYS if name not in local_fields]
+            batch.append((unit_id, raw_text, missing, local_fields, list(uncertain)))
+            batch_tokens = sum(gpt_refinement.estimate_tokens(text) for _, text, _, _, _ in batch)
+            if len(batch) >= max(1, GPT_BATCH_MAX_DOCS) or batch_tokens >= GPT_BATCH_TOKEN_BUDGET:
+                flush_batch()
+
+        def flush_if_idle():
+            stages = [stage for stage, _ in pending.values()]
+            if "ocr" not in stages or "refine" not in stages:
+                flush_batch()
+
+        for unit_id, raw_text in to_refine:
+            queue_refinement(unit_id, raw_text)
+        flush_if_idle()
+
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                # Tarefas já em execução terminam, mas seus resultados são descartados
+                for future in pending:
+                    future.cancel()
+                print(f"Processamento cancelado: {len(units) - completed} documentos não concluídos.")
+                break
+            # Com cancelamento, acorda periodicamente para verificar o sinal
+            done, _ = wait(pending, timeout=0.5 if cancel_event is not None else None,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, payload = pending.pop(future)
+                try:
+                    output, seconds, worker_metrics = future.result()
+                    metrics.recorder.merge(worker_metrics)
+                except Exception as e:
+                    unit_ids = [item[0] for item in payload]
+                    for image_path in unit_ids:
+                        print(f"Erro na etapa '{stage}' para {image_path}: {str(e)}")
+                        fail(image_path, stage, f"Erro ao processar a imagem: {image_path}")
+                    continue
+
+                if stage == "ocr":
+                    for image_path, (text, uncertain) in output.items():
+                        if not text.strip():  # Verifica se o OCR não extraiu nada
+                            fail(image_path, "ocr", f"Erro ao processar a imagem: {image_path}", seconds)
+                            continue
+                        if manifest is not None:
+                            manifest.mark(image_path, "ocr", DONE, seconds=seconds, raw_text=text)
+                        queue_refinement(image_path, text, uncertain)
+                else:
+                    seconds /= len(payload)  # Tempo do lote dividido entre os documentos
+                    for image_path, raw_text, _, _, _ in payload:
+                        refined_text = output.get(image_path, "")
+                        # Resposta vazia indica falha definitiva da API: fica pendente para nova tentativa
+                        if refined_text.strip() in ("", "{}"):
+                            fail(image_path, "refine", f"Erro ao refinar o texto da imagem: {image_path}", seconds)
+                            continue
+                        if manifest is not None:
+                            manifest.mark(image_path, "refine", DONE, seconds=seconds, refined_text=refined_text)
+                        emit(image_path, raw_text, refined_text)
+            flush_if_idle()
+
+    if index is not None:
+        index.close()
+    if LOCAL_EXTRACTION_ENABLED and stats.documents:
+        print(stats.summary())
+
+    # Mantém a ordem de entrada, independente da ordem de conclusão
+    ordered = {}
+    for unit_id, _, _, _ in units:
+        if unit_id in results:
+            file_name, raw_text, refined_text = results[unit_id]
+            ordered[file_name] = (raw_text, refined_text)
+    return ordered
@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+from PIL import Image
+from modules.config import (
+    PREPROCESS_DOWNSCALE, PREPROCESS_TARGET_DPI, PREPROCESS_MAX_SIDE,
+    PREPROCESS_GRAYSCALE, PREPROCESS_THRESHOLD, PREPROCESS_DESKEW, PREPROCESS_CROP,
+)
+
+# Etapas na ordem em que são aplicadas
+STEPS = ("downscale", "crop", "grayscale", "deskew", "threshold")
+
+DEFAULT_STEPS = {
+    "downscale": PREPROCESS_DOWNSCALE,
+    "crop": PREPROCESS_CROP,
+    "grayscale": PREPROCESS_GRAYSCALE,
+    "deskew": PREPROCESS_DESKEW,
+    "threshold": PREPROCESS_THRESHOLD,
+}
+
+# Inclinação máxima corrigida (graus) e passo da busca
+MAX_SKEW_ANGLE = 10.0
+SKEW_STEP = 0.5
+
+# Largura usada para estimar a inclinação (a estimativa não precisa da resolução completa)
+SKEW_ANALYSIS_WIDTH = 800
+
+# A região do documento só é recortada se ocupar ao menos essa fração da imagem
+MIN_CROP_AREA = 0.2
+
+
+def settings_key(steps=None):
+    """Descrição estável das etapas ativas, usada nas chaves do cache de OCR."""
+    steps = DEFAULT_STEPS if steps is None else steps
+    active = [name for name in STEPS if steps.get(name)]
+    if steps.get("downscale"):
+        active[active.index("downscale")] = f"downscale:{PREPROCESS_TARGET_DPI}:{PREPROCESS_MAX_SIDE}"
+    return ",".join(active) or "none"
+
+
+def _image_dpi(image):
+    dpi = image.info.get("dpi")
+    try:
+        return float(dpi[0]) if dpi else None
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def downscale(array, dpi=None, target_dpi=PREPROCESS_TARGET_DPI, max_side=PREPROCESS_MAX_SIDE):
+    """
+    Reduz a imagem para a resolução alvo.
+
+    Com o DPI informado (ex.: páginas de PDF e scanners), reduz para target_dpi; em fotos sem
+    essa informação, limita o maior lado a max_side pixels. Imagens menores não são ampliadas.
+    """
+    height, width = array.shape[:2]
+    if dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    else:
+        scale = max_side / max(height, width)
+    if scale >= 1:
+        return array
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(array, size, interpolation=cv2.INTER_AREA)
+
+
+def to_grayscale(array):
+    if array.ndim == 2:
+        return array
+    return cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+
+
+def adaptive_threshold(gray):
+    """Binariza com limiar local, compensando sombras e iluminação irregular das fotos."""
+    block_size = max(15, (min(gray.shape[:2]) // 40) | 1)  # Ímpar, proporcional ao tamanho da imagem
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, 15)
+
+
+def estimate_skew(gray):
+    """
+    Estima a inclinação do texto (em graus) pelo perfil de projeção horizontal: o ângulo
+    em que as linhas de texto ficam alinhadas maximiza a variação entre linhas de tinta e entrelinhas.
+    """
+    scale = min(1.0, SKEW_ANALYSIS_WIDTH / gray.shape[1])
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    # Limiar local: áreas uniformes escuras (fundo, sombras) não são tomadas como tinta
+    ink = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 15)
+    if not ink.any():
+        return 0.0
+
+    center = (ink.shape[1] / 2, ink.shape[0] / 2)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_ANGLE, MAX_SKEW_ANGLE + SKEW_STEP / 2, SKEW_STEP):
+        matrix = cv2.getRotationMatrix2D(center, float(angle), 1.0)
+        rotated = cv2.warpAffine(ink, matrix, (ink.shape[1], ink.shape[0]), flags=cv2.INTER_NEAREST)
+        score = float(np.var(rotated.sum(axis=1, dtype=np.int64)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(gray):
+    """Corrige a inclinação estimada, preenchendo as bordas com a cor vizinha."""
+    angle = estimate_skew(gray)
+    if abs(angle) < SKEW_STEP:
+        return gray
+    height, width = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def crop_document(array):
+    """Recorta a imagem para o maior contorno encontrado (o documento sobre o fundo), se for grande o suficiente."""
+    gray = to_grayscale(array)
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return array
+    x, y, width, height = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    if width * height < MIN_CROP_AREA * gray.shape[0] * gray.shape[1]:
+        return array
+    return array[y:y + height, x:x + width]
+
+
+def preprocess(image, steps=None):
+    """
+    Prepara uma imagem para o Tesseract: redução para o DPI alvo, recorte do documento,
+    escala de cinza, correção de inclinação e limiarização adaptativa.
+
+    Args:
+        image (PIL.Image): Imagem original.
+        steps (dict): {etapa: ativa}; por padrão, as etapas configuradas em config.py.
+
+    Returns:
+        PIL.Image: Imagem processada (a original, se nenhuma etapa estiver ativa).
+    """
+    steps = DEFAULT_STEPS if steps is None else steps
+    if not any(steps.get(name) for name in STEPS):
+        return image
+
+    dpi = _image_dpi(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    array = np.asarray(image)
+
+    if steps.get("downscale"):
+        array = downscale(array, dpi)
+    if steps.get("crop"):
+        array = crop_document(array)
+    # Inclinação e limiar operam em escala de cinza
+    if steps.get("grayscale") or steps.get("deskew") or steps.get("threshold"):
+        array = to_grayscale(array)
+    if steps.get("deskew"):
+        array = deskew(array)
+    if steps.get("threshold"):
+        array = adaptive_threshold(array)
+
+    return Image.fromarray(np.ascontiguousarray(array))
@@ -0,0 +1,227 @@
+import json
+import re
+import unicodedata
+from collections import namedtuple
+
+# Campo de um documento: chave no JSON da resposta (e coluna da planilha) e descrição no prompt
+Field = namedtuple("Field", ["name", "description"])
+
+# Campos extraídos de cada documento, na ordem das colunas da planilha
+FIELDS = (
+    Field("Nome Completo", "nome completo da pessoa"),
+    Field("CPF", "CPF no formato 000.000.000-00"),
+    Field("Data de Nascimento", "data no formato DD/MM/AAAA"),
+    Field("Local de Nascimento", "cidade e estado de nascimento (naturalidade)"),
+    Field("Documento de Identidade", "número do RG"),
+    Field("Órgão Emissor", "órgão emissor do RG (ex.: SSP/SP)"),
+    Field("Data de Emissão", "data de expedição no formato DD/MM/AAAA"),
+    Field("Nacionalidade", "nacionalidade"),
+    Field("Nome do Pai", "nome do pai"),
+    Field("Nome da Mãe", "nome da mãe"),
+)
+FIELD_NAMES = [field.name for field in FIELDS]
+
+# O endereço vem em um objeto com as partes abaixo
+ADDRESS = "Endereço"
+ADDRESS_FIELDS = ("Rua", "Número", "Bairro", "Cidade", "Estado", "CEP")
+
+# Colunas da planilha, do armazenamento de dados e da tabela da interface
+FILE_COLUMN = "Arquivo"
+FULL_ADDRESS_COLUMN = "Endereço Completo"
+COLUMNS = [FILE_COLUMN] + FIELD_NAMES + [FULL_ADDRESS_COLUMN] + list(ADDRESS_FIELDS)
+TABLE_COLUMNS = COLUMNS[1:]
+
+# Chaves de primeiro nível pedidas ao modelo
+PROMPT_KEYS = FIELD_NAMES + [ADDRESS]
+
+# Chave do array de documentos nas respostas em lote (o modo JSON exige um objeto no primeiro nível)
+BATCH_KEY = "documentos"
+
+# Grafias de versões anteriores do prompt e variações comuns do modelo
+ALIASES = {
+    "Documento de Identidade (RG)": "Documento de Identidade",
+    "RG": "Documento de Identidade",
+    "Data de Expedição": "Data de Emissão",
+    "Naturalidade": "Local de Nascimento",
+    "Nome": "Nome Completo",
+    "Logradouro": "Rua",
+}
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*|\s*```")
+
+
+class SchemaError(ValueError):
+    """Resposta do modelo que não pôde ser lida como documento(s) do schema."""
+
+
+def _key(name):
+    # Comparação das chaves sem acentos, maiúsculas, espaços e pontuação ("Numero" = "Número")
+    text = unicodedata.normalize("NFKD", str(name))
+    return re.sub(r"[^a-z0-9]", "", "".join(char for char in text if not unicodedata.combining(char)).lower())
+
+
+_KEYS = {_key(name): name for name in PROMPT_KEYS + list(ADDRESS_FIELDS) + [FULL_ADDRESS_COLUMN]}
+_KEYS.update({_key(alias): name for alias, name in ALIASES.items()})
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return ", ".join(text for text in map(_text, value) if text)
+    return str(value).strip()
+
+
+def loads(content):
+    """
+    Decodifica o JSON de uma resposta. Respostas do modo JSON são lidas diretamente; cercas de
+    markdown e texto ao redor do JSON só são removidos quando a leitura direta falha.
+
+    Raises:
+        SchemaError: Se não houver um JSON válido na resposta.
+    """
+    try:
+        return json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        error = e
+    cleaned = _FENCE_RE.sub("", content or "").strip()
+    starts = [position for position in (cleaned.find("{"), cleaned.find("[")) if position >= 0]
+    end = max(cleaned.rfind("}"), cleaned.rfind("]"))
+    if starts and end > min(starts):
+        try:
+            return json.loads(cleaned[min(starts):end + 1])
+        except json.JSONDecodeError as e:
+            error = e
+    raise SchemaError(f"JSON inválido: {error}")
+
+
+def normalize(data):
+    """
+    Valida um objeto da resposta e o converte para a forma canônica do schema: os campos como
+    texto e o endereço como objeto com as partes de ADDRESS_FIELDS (ou texto, se o modelo o
+    devolver em uma linha). Chaves desconhecidas são descartadas; grafias alternativas e partes
+    do endereço fora do objeto (ex.: "CEP" no primeiro nível) são reconhecidas.
+
+    Raises:
+        SchemaError: Se o valor não for um objeto ou não tiver nenhuma chave do schema.
+    """
+    if not isinstance(data, dict):
+        raise SchemaError(f"Esperado um objeto JSON, recebido {type(data).__name__}.")
+    document, address, loose_parts = {}, {}, {}
+    for key, value in data.items():
+        name = _KEYS.get(_key(key))
+        if name is None:
+            continue
+        if name == ADDRESS and isinstance(value, dict):
+            for part_key, part_value in value.items():
+                part = _KEYS.get(_key(part_key))
+                if part in ADDRESS_FIELDS and not address.get(part):
+                    address[part] = _text(part_value)
+        elif name in (ADDRESS, FULL_ADDRESS_COLUMN):
+            if _text(value):
+                address.setdefault(FULL_ADDRESS_COLUMN, _text(value))
+        elif name in ADDRESS_FIELDS:
+            if not loose_parts.get(name):
+                loose_parts[name] = _text(value)
+        elif not document.get(name):
+            document[name] = _text(value)
+
+    for part, value in loose_parts.items():
+        if not address.get(part):
+            address[part] = value
+    full_address = address.pop(FULL_ADDRESS_COLUMN, "")
+    if address or full_address:
+        document[ADDRESS] = address if any(address.values()) or not full_address else full_address
+    if not document:
+        raise SchemaError(f"Nenhum campo esperado na resposta (use as chaves: {', '.join(PROMPT_KEYS)}).")
+    return document
+
+
+def parse_document(content):
+    """Lê a resposta de um documento e devolve o documento normalizado (SchemaError se inválida)."""
+    return normalize(loads(content))
+
+
+def parse_batch(content, expected_ids):
+    """
+    Lê a resposta de um lote ({"documentos": [...]} ou o array diretamente).
+
+    Returns:
+        dict: {id: documento normalizado} apenas para os ids esperados e objetos válidos;
+        os demais documentos ficam de fora e são refinados individualmente.
+
+    Raises:
+        SchemaError: Se a resposta não for um JSON com a lista de documentos.
+    """
+    data = loads(content)
+    if isinstance(data, dict):
+        # Alguns modelos trocam o nome da chave do array
+        data = data.get(BATCH_KEY, next((value for value in data.values() if isinstance(value, list)), None))
+    if not isinstance(data, list):
+        raise SchemaError(f'A resposta não contém a lista "{BATCH_KEY}" de documentos.')
+
+    results = {}
+    for item in data:
+        if isinstance(item, dict) and str(item.get("id")) in expected_ids:
+            try:
+                results[str(item["id"])] = normalize({key: value for key, value in item.items() if key != "id"})
+            except SchemaError:
+                continue
+    return results
+
+
+def dumps(document):
+    """JSON canônico de um documento normalizado (o formato guardado no cache e no manifest)."""
+    return json.dumps(document, ensure_ascii=False)
+
+
+def to_row(file, document):
+    """Linha da planilha (na ordem de COLUMNS) para um documento normalizado."""
+    address = document.get(ADDRESS, {})
+    if isinstance(address, dict):
+        parts = [address.get(part, "") for part in ADDRESS_FIELDS]
+        full_address = ", ".join(parts).strip(", ")
+    else:
+        parts, full_address = [""] * len(ADDRESS_FIELDS), address
+    return [file] + [document.get(name, "") for name in FIELD_NAMES] + [full_address] + parts
+
+
+def template(fields=None):
+    """
+    Objeto JSON de exemplo com as chaves esperadas e valores vazios, para o prompt.
+
+    Args:
+        fields (list): Se informado, apenas essas chaves de primeiro nível (PROMPT_KEYS).
+    """
+    keys = [key for key in PROMPT_KEYS if fields is None or key in fields]
+    return json.dumps({key: dict.fromkeys(ADDRESS_FIELDS, "") if key == ADDRESS else "" for key in keys},
+                      ensure_ascii=False)
+
+
+def descriptions(fields=None):
+    """Linhas do prompt com o significado e o formato de cada campo."""
+    lines = [f"- {field.name}: {field.description}" for field in FIELDS if fields is None or field.name in fields]
+    if fields is None or ADDRESS in fields:
+        lines.append(f"- {ADDRESS}: objeto com {', '.join(ADDRESS_FIELDS)}")
+    return "\n".join(lines)
+
+
+def json_schema(fields=None, batch=False):
+    """
+    JSON Schema estrito da resposta, para as saídas estruturadas da API
+    (response_format do tipo "json_schema"); todos os campos são obrigatórios e vazios quando ausentes.
+    """
+    keys = [key for key in PROMPT_KEYS if fields is None or key in fields]
+
+    def strict_object(properties):
+        return {"type": "object", "properties": properties, "required": list(properties),
+                "additionalProperties": False}
+
+    properties = {key: strict_object({part: {"type": "string"} for part in ADDRESS_FIELDS}) if key == ADDRESS
+                  else {"type": "string"} for key in keys}
+    if not batch:
+        return strict_object(properties)
+    item = strict_object({"id": {"type": "string"}, **properties})
+    return strict_object({BATCH_KEY: {"type": "array", "items": item}})
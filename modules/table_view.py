@@ -0,0 +1,124 @@
+import math
+import numpy as np
+import pandas as pd
+from modules.config import UI_PAGE_SIZE
+
+
+def display_value(value):
+    """Texto exibido em uma célula (valores ausentes viram vazio)."""
+    return "" if value is None or (not isinstance(value, str) and pd.isnull(value)) else str(value)
+
+
+class TableView:
+    """
+    Estado da tabela de resultados da interface: dados, busca e paginação.
+
+    Os dados ficam em um DataFrame; a busca e o filtro por coluna são feitos sobre ele,
+    de forma vetorizada, e apenas as linhas da página atual são entregues à interface
+    para virarem controles. As linhas são identificadas pelo índice do DataFrame, que
+    não muda com a busca nem com a paginação.
+    """
+
+    def __init__(self, columns, data=None, page_size=UI_PAGE_SIZE):
+        self.columns = list(columns)
+        self.page_size = max(1, page_size)
+        self.set_data(data if data is not None else pd.DataFrame(columns=self.columns))
+
+    def set_data(self, data):
+        """
+        Substitui os dados exibidos, limpando a busca e voltando à primeira página.
+        O índice do DataFrame (ex.: o id de cada registro no armazenamento) identifica as linhas.
+        """
+        data = data.copy()
+        for column in self.columns:
+            if column not in data.columns:
+                data[column] = ""
+        self.data = data.astype(object)
+        self._search_frame = None
+        self.query = ""
+        self.filter_column = None
+        self.visible = self.data.index
+        self.page = 0
+
+    def append_rows(self, records):
+        """
+        Acrescenta linhas ao final, mantendo a busca e a página atuais.
+
+        Args:
+            records (dict): {id_da_linha: {coluna: valor}}, com o id de cada registro no armazenamento.
+
+        Raises:
+            ValueError: Se algum id já estiver na tabela.
+        """
+        if not records:
+            return
+        new_rows = pd.DataFrame.from_dict(records, orient="index")
+        repeated = new_rows.index.intersection(self.data.index)
+        if len(repeated):
+            raise ValueError(f"Linhas já presentes na tabela: {', '.join(map(str, repeated))}")
+        for column in self.data.columns:
+            if column not in new_rows.columns:
+                new_rows[column] = ""
+        self.data = pd.concat([self.data, new_rows]).astype(object)
+        self._search_frame = None
+        page = self.page
+        self.filter(self.query, self.filter_column)
+        self.set_page(page)
+
+    def __len__(self):
+        return len(self.data)
+
+    def _lowercase_frame(self):
+        # Cópia em minúsculas das colunas exibidas, criada na primeira busca e mantida nas edições
+        if self._search_frame is None:
+            self._search_frame = self.data[self.columns].apply(
+                lambda column: column.map(display_value).str.lower()
+            )
+        return self._search_frame
+
+    def filter(self, query="", column=None):
+        """
+        Mostra apenas as linhas que contêm o texto buscado (sem diferenciar maiúsculas).
+
+        Args:
+            query (str): Texto buscado; vazio mostra todas as linhas.
+            column (str): Se informado, busca somente nessa coluna.
+        """
+        self.query = (query or "").strip().lower()
+        self.filter_column = column if column in self.columns else None
+        if not self.query:
+            self.visible = self.data.index
+        else:
+            frame = self._lowercase_frame()
+            mask = np.zeros(len(frame), dtype=bool)
+            for name in [self.filter_column] if self.filter_column else self.columns:
+                mask |= frame[name].str.contains(self.query, regex=False).to_numpy()
+            self.visible = self.data.index[mask]
+        self.page = 0
+
+    @property
+    def page_count(self):
+        return max(1, math.ceil(len(self.visible) / self.page_size))
+
+    def set_page(self, page):
+        self.page = min(max(0, page), self.page_count - 1)
+
+    def page_rows(self):
+        """Linhas da página atual: lista de (índice_da_linha, {coluna: texto})."""
+        start = self.page * self.page_size
+        index = self.visible[start:start + self.page_size]
+        rows = self.data.loc[index, self.columns].to_dict(orient="index")
+        return [(row_index, {column: display_value(value) for column, value in rows[row_index].items()})
+                for row_index in index]
+
+    def value(self, row_index, column):
+        return display_value(self.data.at[row_index, column])
+
+    def row(self, row_index):
+        return self.data.loc[row_index].to_dict()
+
+    def set_value(self, row_index, column, value):
+        """Altera uma célula nos dados (e no índice de busca, se já existir)."""
+        self.data.at[row_index, column] = value
+        if self._search_frame is not None and column in self._search_frame.columns:
+            self._search_frame.at[row_index, column] = display_value(value).lower()
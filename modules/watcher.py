@@ -0,0 +1,221 @@
+import os
+import stat
+import threading
+import time
+from collections import deque
+from modules import metrics
+from modules.config import (
+    IMAGE_EXTENSIONS, PDF_EXTENSIONS, WATCH_BACKEND, WATCH_POLL_INTERVAL, WATCH_SETTLE_SECONDS,
+    WATCH_RETRY_BASE, WATCH_RETRY_MAX,
+)
+
+WATCH_BACKENDS = ("auto", "events", "poll")
+
+# Janela usada no cálculo da vazão recente
+THROUGHPUT_WINDOW_SECONDS = 300
+
+
+def _load_watchdog():
+    # watchdog é opcional: sem ele, o diretório é varrido a cada WATCH_POLL_INTERVAL
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+    return Observer, FileSystemEventHandler
+
+
+def is_input_file(path):
+    """Indica se o caminho é uma imagem ou PDF aceito (arquivos ocultos e temporários são ignorados)."""
+    name = os.path.basename(path)
+    return not name.startswith((".", "~")) and name.lower().endswith(IMAGE_EXTENSIONS + PDF_EXTENSIONS)
+
+
+class FolderWatcher:
+    """
+    Acompanha o diretório de entrada e entrega os arquivos novos ou alterados quando estiverem completos.
+
+    Com o watchdog instalado, os eventos do sistema de arquivos (inotify, FSEvents, ReadDirectoryChangesW)
+    avisam da chegada de cada arquivo; sem ele, o diretório é varrido a cada poll_interval. Nos dois casos,
+    um arquivo só é entregue depois de settle_seconds sem mudar de tamanho nem de data de modificação, para
+    não ler arquivos que ainda estão sendo copiados ou escaneados. Os arquivos já presentes ao iniciar
+    também são entregues (o manifest pula os já processados).
+
+    Arquivos cujo processamento falhou (ex.: a API fora do ar) são marcados com retry() e entregues
+    de novo depois de retry_base segundos, espera que dobra a cada nova falha até retry_max.
+    """
+
+    def __init__(self, folder, settle_seconds=WATCH_SETTLE_SECONDS, poll_interval=WATCH_POLL_INTERVAL,
+                 backend=WATCH_BACKEND, retry_base=WATCH_RETRY_BASE, retry_max=WATCH_RETRY_MAX):
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"WATCH_BACKEND inválido: {backend} (use {', '.join(WATCH_BACKENDS)})")
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self.mode = None  # "events" ou "poll", definido em start()
+        self._pending = {}  # caminho -> ((tamanho, mtime_ns), instante da última mudança)
+        self._delivered = {}  # caminho -> (tamanho, mtime_ns) entregue
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._retries = {}  # caminho -> (falhas seguidas, instante da próxima tentativa)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._observer = None
+
+    def start(self):
+        """Registra os arquivos já presentes e começa a acompanhar o diretório."""
+        self._scan()
+        watchdog = _load_watchdog() if self.backend != "poll" else None
+        if watchdog is None and self.backend == "events":
+            raise RuntimeError("WATCH_BACKEND=events, mas o pacote watchdog não está instalado.")
+        if watchdog is not None:
+            Observer, FileSystemEventHandler = watchdog
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if not event.is_directory:
+                        # Arquivos movidos para o diretório (ex.: cópia para um nome temporário e renomeação)
+                        watcher.touch(getattr(event, "dest_path", "") or event.src_path)
+
+            self._observer = Observer()
+            self._observer.schedule(Handler(), self.folder, recursive=False)
+            self._observer.start()
+        self.mode = "events" if self._observer is not None else "poll"
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def touch(self, path):
+        """Avisa que um arquivo foi criado ou alterado (chamado pelos eventos do sistema de arquivos)."""
+        if not is_input_file(path):
+            return
+        with self._lock:
+            self._observe(path, time.monotonic())
+        self._wakeup.set()
+
+    def _observe(self, path, now):
+        # Atualiza o estado de um arquivo; qualquer mudança reinicia a contagem até ele ser considerado completo
+        try:
+            info = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)  # Removido ou renomeado antes de ficar completo
+            return
+        if not stat.S_ISREG(info.st_mode):
+            return
+        signature = (info.st_size, info.st_mtime_ns)
+        if self._delivered.get(path) == signature:
+            self._pending.pop(path, None)  # Evento sem mudança de conteúdo (ex.: leitura ou permissões)
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[0] != signature:
+            self._pending[path] = (signature, now)
+
+    def _scan(self):
+        now = time.monotonic()
+        try:
+            names = os.listdir(self.folder)
+        except OSError as e:
+            print(f"Erro ao listar '{self.folder}': {str(e)}")
+            return
+        with self._lock:
+            for name in names:
+                path = os.path.join(self.folder, name)
+                if is_input_file(path):
+                    self._observe(path, now)
+
+    def pending(self):
+        """Arquivos detectados que ainda aguardam ficar completos."""
+        with self._lock:
+            return len(self._pending)
+
+    def retry(self, path):
+        """Agenda uma nova entrega de um arquivo que falhou, com espera exponencial; devolve a espera."""
+        with self._lock:
+            failures = self._retries.get(path, (0, 0))[0] + 1
+            delay = min(self.retry_max, self.retry_base * 2 ** (failures - 1))
+            self._retries[path] = (failures, time.monotonic() + delay)
+        return delay
+
+    def succeeded(self, path):
+        """Esquece as falhas de um arquivo processado com sucesso."""
+        with self._lock:
+            self._retries.pop(path, None)
+
+    def failed(self):
+        """Arquivos com falha aguardando uma nova tentativa."""
+        with self._lock:
+            return len(self._retries)
+
+    def wait_ready(self, timeout=None):
+        """
+        Espera até timeout segundos (padrão: poll_interval) por novidades e devolve os arquivos completos,
+        em ordem de chegada. Arquivos vazios continuam aguardando.
+        """
+        self._wakeup.wait(self.poll_interval if timeout is None else timeout)
+        self._wakeup.clear()
+        if self.mode != "events":
+            self._scan()
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path in list(self._pending):
+                self._observe(path, now)
+            for path, (signature, since) in sorted(self._pending.items(), key=lambda item: item[1][1]):
+                if signature[0] > 0 and now - since >= self.settle_seconds:
+                    ready.append(path)
+                    self._delivered[path] = signature
+                    del self._pending[path]
+            # Novas tentativas vencidas (um arquivo alterado já foi entregue acima)
+            for path, (failures, due) in list(self._retries.items()):
+                if not os.path.exists(path):
+                    del self._retries[path]
+                elif due <= now and path not in ready and path not in self._pending:
+                    ready.append(path)
+        return ready
+
+
+class IngestionStats:
+    """Vazão e fila do modo contínuo, publicadas como medidas em metrics.recorder (e em metrics.prom)."""
+
+    def __init__(self, window=THROUGHPUT_WINDOW_SECONDS):
+        self.window = window
+        self.started = time.monotonic()
+        self.done = 0
+        self.errors = 0  # Documentos com erro em alguma tentativa
+        self.failed = 0  # Arquivos com falha aguardando uma nova tentativa (definido pelo FolderWatcher)
+        self.queued = 0  # Arquivos detectados ainda não processados (aguardando ficar completos ou na fila)
+        self._recent = deque()  # Instantes das conclusões dentro da janela
+
+    def record(self, ok=True):
+        now = time.monotonic()
+        if ok:
+            self.done += 1
+        else:
+            self.errors += 1
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+
+    def throughput(self):
+        """Documentos por minuto na janela recente (ou desde o início, se ele for mais recente)."""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+        seconds = min(self.window, now - self.started)
+        return len(self._recent) * 60 / seconds if seconds > 0 else 0.0
+
+    def publish(self):
+        metrics.recorder.set_gauge("watch_queue_depth", self.queued)
+        metrics.recorder.set_gauge("watch_documents_per_minute", self.throughput())
+        metrics.recorder.set_gauge("watch_documents", self.done, status="ok")
+        metrics.recorder.set_gauge("watch_documents", self.failed, status="failed")
+        metrics.recorder.set_gauge("watch_uptime_seconds", time.monotonic() - self.started)
+
+    def status(self):
+        return (f"fila: {self.queued} | concluídos: {self.done} | erros: {self.errors} | "
+                f"aguardando nova tentativa: {self.failed} | vazão: {self.throughput():.1f} docs/min")
@@ -1,55 +1,344 @@
 from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.oxml.ns import qn
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+import copy
+import io
 import os
+import re
+import zipfile
 import pandas as pd
+from modules import metrics
+from modules.config import WORD_WORKERS, WORD_PARALLEL_THRESHOLD, WORD_EXPORT_MODE, WORD_EXPORT_MODES
 
-def update_word_form(template_path, data, save_dir):
+# Marcador no formato {{campo}}
+PLACEHOLDER_RE = re.compile(r"\{\{(.+?)\}\}")
+
+# Partes do documento onde os marcadores são procurados (corpo, com tabelas, cabeçalhos e rodapés)
+TEMPLATE_PART_TYPES = (CT.WML_DOCUMENT_MAIN, CT.WML_HEADER, CT.WML_FOOTER)
+
+# Modos de exportação: um arquivo por registro, um .zip com todos, ou um único .docx com quebras de página
+EXPORT_MODES = WORD_EXPORT_MODES
+EXPORT_FILE_NAMES = {"zip": "documentos.zip", "merged": "documentos.docx"}
+
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+_PAGE_BREAK = (
+    b'<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    b'<w:r><w:br w:type="page"/></w:r></w:p>'
+)
+_INVALID_FILE_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def _paragraph_texts(paragraph):
+    # Apenas os w:t do próprio parágrafo (caixas de texto aninhadas são tratadas como parágrafos próprios)
+    return [t for t in paragraph.iter(qn("w:t")) if next(t.iterancestors(qn("w:p")), None) is paragraph]
+
+
+def _merge_split_placeholders(paragraph):
+    """Reúne em um único w:t os marcadores que o Word dividiu em vários runs."""
+    texts = _paragraph_texts(paragraph)
+    if len(texts) < 2:
+        return
+    offsets, position = [], 0
+    for t in texts:
+        offsets.append(position)
+        position += len(t.text or "")
+    full_text = "".join(t.text or "" for t in texts)
+
+    def locate(char_index):
+        for i in range(len(texts) - 1, -1, -1):
+            if offsets[i] <= char_index:
+                return i
+        return 0
+
+    # Do último para o primeiro, para que as edições não desloquem os marcadores anteriores
+    for match in reversed(list(PLACEHOLDER_RE.finditer(full_text))):
+        first, last = locate(match.start()), locate(match.end() - 1)
+        if first == last:
+            continue
+        first_t, last_t = texts[first], texts[last]
+        first_t.text = (first_t.text or "")[:match.start() - offsets[first]] + match.group(0)
+        last_t.text = (last_t.text or "")[match.end() - offsets[last]:]
+        for t in texts[first + 1:last]:
+            t.text = ""
+        for t in (first_t, last_t):
+            t.set(_XML_SPACE, "preserve")
+
+
+class CompiledTemplate:
+    """
+    Template Word lido e indexado uma única vez.
+
+    Na compilação, marcadores divididos entre runs são reunidos e a posição de cada
+    w:t que contém marcadores é indexada (no corpo, em tabelas, cabeçalhos e rodapés).
+    Cada registro é renderizado sobre uma cópia do XML original, substituindo apenas
+    os textos indexados e preservando a formatação dos runs.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self.document = Document(template_path)
+        self._parts = []  # (parte, elemento original, [(índice do w:t, texto com marcadores)])
+        for part in self.document.part.package.iter_parts():
+            if part.content_type not in TEMPLATE_PART_TYPES:
+                continue
+            element = part._element
+            for paragraph in list(element.iter(qn("w:p"))):
+                _merge_split_placeholders(paragraph)
+            index = [
+                (position, t.text)
+                for position, t in enumerate(element.iter(qn("w:t")))
+                if t.text and PLACEHOLDER_RE.search(t.text)
+            ]
+            if part is self.document.part or index:
+                self._parts.append((part, element, index))
+
+    @property
+    def header_placeholders(self):
+        """Indica se há marcadores em cabeçalhos ou rodapés (não suportados no modo "merged")."""
+        return any(index for part, _, index in self._parts if part is not self.document.part)
+
+    @staticmethod
+    def _fill(original, index, field_mapping):
+        def substitute(match):
+            key = match.group(1)
+            return str(field_mapping[key]) if key in field_mapping else match.group(0)
+
+        element = copy.deepcopy(original)
+        texts = list(element.iter(qn("w:t")))
+        for position, template_text in index:
+            texts[position].text = PLACEHOLDER_RE.sub(substitute, template_text)
+        return element
+
+    def render(self, field_mapping, target):
+        """
+        Preenche os marcadores com os valores do registro e salva o documento.
+
+        Args:
+            field_mapping (dict): {campo: valor}; marcadores sem campo correspondente são mantidos.
+            target (str | file): Caminho ou arquivo aberto onde o .docx será gravado.
+        """
+        for part, original, index in self._parts:
+            part._element = self._fill(original, index, field_mapping)
+        self.document.save(target)
+
+    def render_bytes(self, field_mapping):
+        """Renderiza o registro e devolve o .docx em memória."""
+        buffer = io.BytesIO()
+        self.render(field_mapping, buffer)
+        return buffer.getvalue()
+
+    def render_body_xml(self, field_mapping):
+        """Renderiza apenas o corpo do documento e devolve os elementos serializados (sem o w:sectPr final)."""
+        _, original, index = self._parts[0]
+        body = self._fill(original, index, field_mapping).find(qn("w:body"))
+        return b"".join(etree.tostring(child) for child in body if child.tag != qn("w:sectPr"))
+
+    def document_xml_envelope(self):
+        """Devolve (início, fim) do word/document.xml em torno do conteúdo do corpo."""
+        _, original, _ = self._parts[0]
+        element = copy.deepcopy(original)
+        body = element.find(qn("w:body"))
+        for child in list(body):
+            if child.tag != qn("w:sectPr"):
+                body.remove(child)
+        xml = etree.tostring(element, xml_declaration=True, encoding="UTF-8", standalone=True)
+        split_at = xml.find(b"<w:sectPr")
+        if split_at < 0:
+            split_at = xml.rfind(b"</w:body>")
+        return xml[:split_at], xml[split_at:]
+
+
+def _field_mapping(row, columns):
+    return {column: row[column] if not pd.isnull(row[column]) else '' for column in columns}
+
+
+def _file_name(field_mapping, record_id):
+    # Definir o nome do arquivo usando "Nome Completo" e "CPF"
+    nome_completo = field_mapping.get("Nome Completo", "Desconhecido")
+    cpf = field_mapping.get("CPF", "")
+    primeiro_nome = str(nome_completo).split()[0] if str(nome_completo).strip() else "Desconhecido"
+    if not str(cpf).strip():
+        # Sem CPF, o id do registro consolidado (estável entre execuções) distingue as pessoas
+        cpf = f"000.000.000-00_{record_id}"
+    return _INVALID_FILE_CHARS.sub("_", f"{primeiro_nome}_{cpf}") + ".docx"
+
+
+def _unique_file_names(rows):
+    """
+    Evita que registros com nome e CPF repetidos no mesmo lote sobrescrevam uns aos outros
+    (Nome_CPF_2.docx, ...). Entre execuções, o documento de mesmo nome e CPF é o da mesma pessoa
+    e é substituído pela versão atual.
+    """
+    used, named = set(), []
+    for index, record_id, field_mapping in rows:
+        base = _file_name(field_mapping, record_id)
+        name, counter = base, 1
+        while name.lower() in used:
+            counter += 1
+            name = f"{base[:-len('.docx')]}_{counter}.docx"
+        used.add(name.lower())
+        named.append((index, field_mapping, name))
+    return named
+
+
+def _render_rows(template, rows, kind, save_dir=None):
+    """
+    Renderiza uma sequência de (índice, campos, nome) e devolve (índice, nome, resultado) para cada
+    registro: o caminho salvo ("files"), os bytes do .docx ("zip") ou o XML do corpo ("merged").
+    Registros com erro têm resultado None.
     """
-    Gera documentos Word individuais para cada linha do DataFrame.
+    rendered = []
+    for index, field_mapping, name in rows:
+        try:
+            if kind == "files":
+                result = os.path.join(save_dir, name)
+                template.render(field_mapping, result)
+                print(f"Documento salvo: {result}")
+            elif kind == "zip":
+                result = template.render_bytes(field_mapping)
+            else:
+                result = template.render_body_xml(field_mapping)
+        except Exception as e:
+            print(f"Erro ao gerar documento para linha {index + 1}: {str(e)}")
+            result = None
+        rendered.append((index, name, result))
+    return rendered
+
+
+# Template compilado de cada processo do pool de renderização
+_worker_template = None
+
+
+def _init_worker(template_path):
+    global _worker_template
+    _worker_template = CompiledTemplate(template_path)
+
+
+def _render_chunk(rows, kind, save_dir):
+    return _render_rows(_worker_template, rows, kind, save_dir)
+
+
+def _iter_rendered(template, rows, kind, save_dir=None):
+    """
+    Gera os registros renderizados na ordem original. Com muitos registros, divide o trabalho
+    entre processos, mantendo apenas alguns blocos em andamento para limitar a memória.
+    """
+    workers = min(WORD_WORKERS, len(rows))
+    if len(rows) <= WORD_PARALLEL_THRESHOLD or workers <= 1:
+        for row in rows:
+            yield from _render_rows(template, [row], kind, save_dir)
+        return
+
+    chunk_size = 25
+    chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(template.template_path,)) as pool:
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(_render_chunk, chunk, kind, save_dir))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.pop(0).result()
+        for future in in_flight:
+            yield from future.result()
+
+
+def _export_zip(template, rows, output_path):
+    """Grava todos os documentos em um único .zip, um registro por vez."""
+    written = 0
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index, name, docx_bytes in _iter_rendered(template, rows, "zip"):
+            if docx_bytes is not None:
+                archive.writestr(name, docx_bytes)
+                written += 1
+    return written
+
+
+def _export_merged(template, rows, output_path):
+    """
+    Grava todos os registros em um único .docx, separados por quebras de página.
+
+    O word/document.xml é escrito em fluxo dentro do .zip, registro por registro; as demais
+    partes (estilos, numeração, cabeçalhos e rodapés) são copiadas do template, então marcadores
+    em cabeçalhos e rodapés não são preenchidos neste modo.
+    """
+    if template.header_placeholders:
+        print("Aviso: o modo merged não preenche marcadores de cabeçalhos e rodapés; "
+              "use os modos files ou zip para esse template.")
+    prefix, suffix = template.document_xml_envelope()
+    written = 0
+    with zipfile.ZipFile(template.template_path) as source, \
+            zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for info in source.infolist():
+            if info.filename != "word/document.xml":
+                archive.writestr(info, source.read(info.filename))
+                continue
+            with archive.open("word/document.xml", "w", force_zip64=True) as document_xml:
+                document_xml.write(prefix)
+                for index, name, body_xml in _iter_rendered(template, rows, "merged"):
+                    if body_xml is None:
+                        continue
+                    if written:
+                        document_xml.write(_PAGE_BREAK)
+                    document_xml.write(body_xml)
+                    written += 1
+                document_xml.write(suffix)
+    return written
+
+
+@metrics.timed("word")
+def update_word_form(template_path, data, save_dir, export_mode=WORD_EXPORT_MODE):
+    """
+    Gera documentos Word para cada linha do DataFrame.
+
+    O template é lido e indexado uma única vez; com mais de WORD_PARALLEL_THRESHOLD
+    linhas, a renderização é dividida entre WORD_WORKERS processos.
 
     Args:
         template_path (str): Caminho para o formulário Word existente.
         data (pd.DataFrame): DataFrame contendo os dados.
         save_dir (str): Diretório para salvar os documentos Word gerados.
+        export_mode (str): "files" (um .docx por linha), "zip" (todos em documentos.zip)
+            ou "merged" (um único documentos.docx com quebras de página, sem preencher
+            cabeçalhos e rodapés).
+
+    Returns:
+        list: Caminhos dos arquivos gerados.
     """
     # Validação inicial
+    if export_mode not in EXPORT_MODES:
+        print(f"Erro: modo de exportação inválido: {export_mode} (use {', '.join(EXPORT_MODES)})")
+        return []
+
     if not os.path.exists(template_path):
         print(f"Erro: Template não encontrado em {template_path}")
-        return
+        return []
 
     if data.empty:
         print("Nenhum dado disponível para atualizar o formulário.")
-        return
+        return []
 
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)  # Cria o diretório de saída, se não existir
 
-    # Processar cada linha do DataFrame
-    for index, row in data.iterrows():
-        try:
-            # Abrir o template do Word
-            doc = Document(template_path)
-
-            # Criar um dicionário para mapear colunas do Excel aos placeholders
-            field_mapping = {column: row[column] if not pd.isnull(row[column]) else '' for column in data.columns}
-
-            # Substituir os placeholders no documento Word
-            for paragraph in doc.paragraphs:
-                for key, value in field_mapping.items():
-                    placeholder = f"{{{{{key}}}}}"  # Marcador no formato {{campo}}
-                    if placeholder in paragraph.text:
-                        paragraph.text = paragraph.text.replace(placeholder, str(value))
-
-            # Definir o nome do arquivo usando "Nome Completo" e "CPF"
-            nome_completo = field_mapping.get("Nome Completo", "Desconhecido")
-            cpf = field_mapping.get("CPF", "000.000.000-00")
-            primeiro_nome = nome_completo.split()[0] if nome_completo else "Desconhecido"
-
-            file_name = f"{primeiro_nome}_{cpf}.docx"
-            save_path = os.path.join(save_dir, file_name)
-
-            # Salvar o documento gerado
-            doc.save(save_path)
-            print(f"Documento salvo: {save_path}")
-        
-        except Exception as e:
-            print(f"Erro ao gerar documento para linha {index + 1}: {str(e)}")
+    metrics.increment("word_documents", len(data))
+    columns = list(data.columns)
+    records = data.to_dict(orient="records")
+    rows = _unique_file_names(
+        (index, record_id, _field_mapping(row, columns))
+        for index, (record_id, row) in enumerate(zip(data.index, records))
+    )
+    template = CompiledTemplate(template_path)
+
+    if export_mode == "files":
+        return [path for _, _, path in _iter_rendered(template, rows, "files", save_dir) if path]
+
+    # Arquivo único: gravado em um temporário e renomeado ao final
+    output_path = os.path.join(save_dir, EXPORT_FILE_NAMES[export_mode])
+    tmp_path = output_path + ".tmp"
+    export = _export_zip if export_mode == "zip" else _export_merged
+    written = export(template, rows, tmp_path)
+    os.replace(tmp_path, output_path)
+    print(f"{written} documentos salvos em: {output_path}")
+    return [output_path]